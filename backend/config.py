@@ -10,11 +10,60 @@ class Settings(BaseModel):
     google_api_key: str = os.getenv("GOOGLE_API_KEY", "")
     chroma_persist_directory: str = os.getenv("CHROMA_PERSIST_DIRECTORY", "./vector_db")
     log_level: str = os.getenv("LOG_LEVEL", "INFO")
+    log_file: str = os.getenv("LOG_FILE", "logs/app.log")
+    log_format: str = os.getenv("LOG_FORMAT", "json")
+    log_max_bytes: int = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+    log_backup_count: int = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    log_sample_rate: float = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+    log_queue_size: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    log_console: bool = os.getenv("LOG_CONSOLE", "true").lower() == "true"
+    trace_file: str = os.getenv("TRACE_FILE", "logs/traces.jsonl")
+    trace_sample_rate: float = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+    trace_max_bytes: int = int(os.getenv("TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+    trace_backup_count: int = int(os.getenv("TRACE_BACKUP_COUNT", "3"))
+    profile_token: str = os.getenv("PROFILE_TOKEN", "")
+    profile_dir: str = os.getenv("PROFILE_DIR", "logs/profiles")
+    profile_interval_ms: float = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
     backend_host: str = os.getenv("BACKEND_HOST", "0.0.0.0")
     backend_port: int = int(os.getenv("BACKEND_PORT", "8000"))
     frontend_port: int = int(os.getenv("FRONTEND_PORT", "8501"))
     vosk_model_path: str = os.getenv("VOSK_MODEL_PATH", "./models/vosk-model-en-us-0.22")
     max_file_size_mb: int = int(os.getenv("MAX_FILE_SIZE_MB", "100"))
+    vector_backend: str = os.getenv("VECTOR_BACKEND", "chroma")
+    numpy_ivf_lists: int = int(os.getenv("NUMPY_IVF_LISTS", "0"))
+    numpy_ivf_probes: int = int(os.getenv("NUMPY_IVF_PROBES", "8"))
+    numpy_quantization: str = os.getenv("NUMPY_QUANTIZATION", "none")
+    numpy_pq_subspaces: int = int(os.getenv("NUMPY_PQ_SUBSPACES", "48"))
+    numpy_rescore_factor: int = int(os.getenv("NUMPY_RESCORE_FACTOR", "8"))
+    vector_shards: int = int(os.getenv("VECTOR_SHARDS", "1"))
+    vector_shard_search_threads: int = int(os.getenv("VECTOR_SHARD_SEARCH_THREADS", "0"))
+    vector_store_url: str = os.getenv("VECTOR_STORE_URL", "")
+    vector_store_timeout_seconds: float = float(os.getenv("VECTOR_STORE_TIMEOUT_SECONDS", "30"))
+    gemini_model: str = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+    gemini_base_url: str = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com")
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    llm_timeout_seconds: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+    llm_connect_timeout_seconds: float = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    llm_backoff_base_seconds: float = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+    llm_backoff_max_seconds: float = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+    admission_max_concurrency: int = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))
+    admission_weights: str = os.getenv("ADMISSION_WEIGHTS", "query=6,upload=1,documents=1")
+    admission_queue_per_slot: int = int(os.getenv("ADMISSION_QUEUE_PER_SLOT", "4"))
+    admission_max_wait_seconds: str = os.getenv("ADMISSION_MAX_WAIT_SECONDS", "query=10,upload=30,documents=2")
+    adaptive_retrieval: bool = os.getenv("ADAPTIVE_RETRIEVAL", "false").lower() == "true"
+    retrieval_overfetch_factor: int = int(os.getenv("RETRIEVAL_OVERFETCH_FACTOR", "3"))
+    retrieval_min_depth: int = int(os.getenv("RETRIEVAL_MIN_DEPTH", "1"))
+    retrieval_score_floor: float = float(os.getenv("RETRIEVAL_SCORE_FLOOR", "0.0"))
+    retrieval_gap_ratio: float = float(os.getenv("RETRIEVAL_GAP_RATIO", "0.5"))
+    response_cache_max_entries: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+    response_cache_ttl_seconds: float = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "604800"))
+    session_history_token_cap: int = int(os.getenv("SESSION_HISTORY_TOKEN_CAP", "1000"))
+    session_idle_seconds: float = float(os.getenv("SESSION_IDLE_SECONDS", "3600"))
+    max_sessions: int = int(os.getenv("MAX_SESSIONS", "10000"))
+    max_open_tenants: int = int(os.getenv("MAX_OPEN_TENANTS", "64"))
+    # Closing an evicted tenant's store does not unload its HNSW index; Chroma's LRU segment cache does
+    chroma_memory_limit_bytes: int = int(os.getenv("CHROMA_MEMORY_LIMIT_BYTES", "1073741824"))
 
 _settings = None
 
@@ -0,0 +1,220 @@
+"""Vector index service shared by every API worker and node.
+
+Run exactly one process of it next to the index files, and point the API
+at it with VECTOR_STORE_URL:
+
+    uvicorn backend.index_service:app --host 0.0.0.0 --port 8001
+    VECTOR_STORE_URL=http://localhost:8001 uvicorn backend.main:app --workers 4
+
+It owns the collections (Chroma or NumPy, sharded or not, as configured by
+VECTOR_BACKEND and VECTOR_SHARDS), their document catalogs and the
+collection version registry, so the embedded SQLite and HNSW files are
+only ever opened by one process. Workers call store, catalog and registry
+methods by name over HTTP; only the methods listed below are exposed.
+
+Collection version builds and swaps run here too, one build per alias at
+a time. Writes to a serving collection are held back while its alias is
+swapped, and those aimed at a version that was swapped out are refused
+with 409 so the worker retries them on the new one.
+"""
+from fastapi import FastAPI, HTTPException, Body, Path as FastAPIPath
+from fastapi.responses import Response
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+from .services.store_factory import create_vector_store
+from .services.vector_store import DEFAULT_COLLECTION_NAME
+from .services.tenant_stores import TenantVectorStores
+from .services.collection_versions import (CollectionVersions, VersionBuilds, VersionConflictError, WriteFences,
+                                           REGISTRY_PATH)
+from .services.metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .services.tracing import TraceIdFilter, setup_tracing, shutdown_tracing
+from .middleware.tracing_middleware import TracingMiddleware
+from .logging_config import setup_logging, shutdown_logging
+from .config import get_settings
+
+SERVICE_NAME = "multimodal-rag-index"
+
+# Never a client of another index service itself
+settings = get_settings().model_copy(update={"vector_store_url": ""})
+
+log_handler = setup_logging(settings)
+log_handler.addFilter(TraceIdFilter())
+trace_exporter = setup_tracing(settings, service_name=SERVICE_NAME)
+
+logger = logging.getLogger(__name__)
+
+STORE_METHODS = frozenset({
+    "add_document", "search", "warm_up", "list_documents", "count_documents", "delete_documents",
+    "get_chunks", "is_file_referenced", "persist", "reset"
+})
+# Store methods that change a collection; on a serving collection they take the alias's write fence
+WRITE_METHODS = frozenset({"add_document", "delete_documents", "reset"})
+CATALOG_METHODS = frozenset({
+    "upsert", "get", "get_many", "list", "count", "list_document_shards", "document_ids", "count_chunks",
+    "count_file_references", "get_meta", "set_meta"
+})
+VERSION_METHODS = frozenset({
+    "active_collection", "list_versions", "get_version", "create_version", "set_status", "delete_version"
+})
+# Activations and rollbacks are only exposed through the builds, which fence them
+BUILD_METHODS = frozenset({"building", "start", "activate", "rollback"})
+COLLECTION_NAME_PATTERN = "^[A-Za-z0-9][A-Za-z0-9_-]{0,62}$"
+
+app = FastAPI(
+    title="Multimodal RAG Index Service",
+    description="Vector collections, document catalogs and collection versions shared by the API workers",
+    version="1.0.0"
+)
+app.add_middleware(TracingMiddleware)
+
+# Open collections, keyed by physical collection name; workers resolve tenants and versions themselves
+stores = TenantVectorStores(
+    lambda collection_name: create_vector_store(settings, collection_name=collection_name),
+    max_open=settings.max_open_tenants,
+    resolve_collection=lambda collection_name: collection_name
+)
+collection_versions = CollectionVersions(REGISTRY_PATH)
+write_fences = WriteFences()
+_document_processor = None
+
+def document_processor():
+    """Processor for builds that re-process uploaded files, created by the first build"""
+    global _document_processor
+    if _document_processor is None:
+        # Its parsers and speech model are not needed to serve the index
+        from .services.document_processor import DocumentProcessor
+        _document_processor = DocumentProcessor()
+    return _document_processor
+
+version_builds = VersionBuilds(
+    collection_versions, stores, write_fences,
+    lambda collection_name, embedding_function: create_vector_store(
+        settings, embedding_function=embedding_function, collection_name=collection_name
+    ),
+    document_processor=document_processor
+)
+
+REGISTRY.callback("rag_open_tenant_stores", "Collections currently open", lambda: stores.open_tenants())
+REGISTRY.callback("rag_log_queue_depth", "Log records waiting for the writer thread", lambda: log_handler.queue.qsize())
+
+async def _invoke(target, method: str, arguments: Dict[str, Any]) -> Any:
+    """Call a whitelisted method off the event loop, so searches keep flowing.
+
+    Synchronous methods run on a thread; the stores' asynchronous ones hand
+    their blocking work to threads themselves.
+    """
+    function = getattr(target, method)
+    try:
+        if asyncio.iscoroutinefunction(function):
+            return await function(**arguments)
+        return await asyncio.to_thread(function, **arguments)
+    except VersionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in {method}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@asynccontextmanager
+async def _serving_write(collection_name: str):
+    """Hold a write to a serving collection against swaps of its alias.
+
+    Versions being built are written only by their build, so they are not
+    fenced. A write aimed at a version swapped out before it got through
+    is refused.
+    """
+    alias, status = collection_versions.collection_status(collection_name)
+    if status in ("building", "ready", "failed"):
+        yield
+        return
+    async with write_fences.write(alias):
+        if collection_versions.active_collection(alias) != collection_name:
+            raise HTTPException(status_code=409, detail=f"{collection_name} no longer serves {alias}")
+        yield
+
+@app.on_event("startup")
+async def startup_event():
+    """Open the registry and the default collection"""
+    logger.info("Starting Multimodal RAG Index Service")
+    os.makedirs("vector_db", exist_ok=True)
+    collection_versions.initialize()
+    async with stores.acquire(collection_versions.active_collection(DEFAULT_COLLECTION_NAME)):
+        pass
+    logger.info("Index service ready")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush and close every open collection"""
+    stores.close_all()
+    collection_versions.close()
+    logger.info("Collections persisted")
+    shutdown_tracing()
+    shutdown_logging()
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe; the service is ready once startup has opened the default collection"""
+    return {"status": "ready", "open_collections": stores.open_tenants()}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics of the index service: indexing counters and store stage latencies"""
+    return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.post("/collections/{collection_name}/catalog/{method}")
+async def call_catalog(collection_name: str = FastAPIPath(..., pattern=COLLECTION_NAME_PATTERN),
+                       method: str = FastAPIPath(...), arguments: Dict[str, Any] = Body({})):
+    """Call a method of a collection's document catalog"""
+    if method not in CATALOG_METHODS:
+        raise HTTPException(status_code=404, detail=f"Unknown catalog method: {method}")
+    async with stores.acquire(collection_name) as store:
+        return await _invoke(store.catalog, method, arguments)
+
+@app.post("/collections/{collection_name}/{method}")
+async def call_store(collection_name: str = FastAPIPath(..., pattern=COLLECTION_NAME_PATTERN),
+                     method: str = FastAPIPath(...), arguments: Dict[str, Any] = Body({})):
+    """Call a method of a collection's vector store"""
+    if method not in STORE_METHODS:
+        raise HTTPException(status_code=404, detail=f"Unknown store method: {method}")
+    if method not in WRITE_METHODS:
+        async with stores.acquire(collection_name) as store:
+            return await _invoke(store, method, arguments)
+    async with _serving_write(collection_name), stores.acquire(collection_name) as store:
+        return await _invoke(store, method, arguments)
+
+@app.delete("/collections/{collection_name}")
+async def drop_collection(collection_name: str = FastAPIPath(..., pattern=COLLECTION_NAME_PATTERN)):
+    """Delete a collection and its catalog for good"""
+    if not stores.retire(collection_name):
+        raise HTTPException(status_code=409, detail=f"Collection {collection_name} is still in use")
+    try:
+        store = create_vector_store(settings, collection_name=collection_name)
+        await store.initialize()
+        store.drop()
+    except Exception as e:
+        logger.error(f"Error dropping {collection_name}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    logger.info(f"Dropped {collection_name}")
+
+@app.post("/versions/{method}")
+async def call_versions(method: str, arguments: Dict[str, Any] = Body({})):
+    """Call a method of the collection version registry"""
+    if method not in VERSION_METHODS:
+        raise HTTPException(status_code=404, detail=f"Unknown registry method: {method}")
+    return await _invoke(collection_versions, method, arguments)
+
+@app.post("/builds/{method}")
+async def call_builds(method: str, arguments: Dict[str, Any] = Body({})):
+    """Start a version build, ask whether one is running, or activate or roll back a version"""
+    if method not in BUILD_METHODS:
+        raise HTTPException(status_code=404, detail=f"Unknown build method: {method}")
+    return await _invoke(version_builds, method, arguments)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,149 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from datetime import datetime, timezone
+
+# Pass as ``extra`` on per-request INFO records that LOG_SAMPLE_RATE may drop
+ROUTINE = {"routine": True}
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener = None
+_sample_rate = 1.0
+
+def keep_routine() -> bool:
+    """Sampling decision for a routine record; check it before building an expensive one"""
+    return _sample_rate >= 1.0 or random.random() < _sample_rate
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with ``extra`` fields as top-level keys"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and key != "routine":
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Keep LOG_SAMPLE_RATE of routine records; warnings, errors and everything else always pass"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or not getattr(record, "routine", False):
+            return True
+        return keep_routine()
+
+def process_path(path: str) -> str:
+    """Substitute ``{pid}``, so that worker processes sharing a setting each rotate their own file"""
+    return path.replace("{pid}", str(os.getpid()))
+
+class SizeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotates once the file has reached ``maxBytes``.
+
+    The stdlib handler formats every record twice, once only to predict
+    whether it would overflow the file; this lets the file overshoot by
+    at most one record instead.
+    """
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.stream is None:
+            self.stream = self._open()
+        return self.maxBytes > 0 and self.stream.tell() >= self.maxBytes
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the writer falls behind"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments now, while they are current, but leave the
+        # formatting (and the exception, for the JSON output) to the writer
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def setup_logging(settings) -> DroppingQueueHandler:
+    """Route the root logger through a bounded queue to a background writer thread.
+
+    Callers only pay for building the record and a queue put; formatting
+    and disk writes happen on the listener thread. The log file rotates at
+    ``log_max_bytes``, and routine records are sampled at
+    ``log_sample_rate``. Replaces whatever handlers the root logger had.
+    """
+    global _listener, _sample_rate
+    shutdown_logging()
+    _sample_rate = settings.log_sample_rate
+    # Neither output format writes these, and looking them up costs every record
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    formatter = (JsonFormatter() if settings.log_format == "json"
+                 else logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    handlers = []
+    if settings.log_file:
+        log_file = process_path(settings.log_file)
+        directory = os.path.dirname(log_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handlers.append(SizeRotatingFileHandler(
+            log_file, maxBytes=settings.log_max_bytes, backupCount=settings.log_backup_count,
+            encoding="utf-8"
+        ))
+    if settings.log_console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(settings.log_queue_size))
+    if settings.log_sample_rate < 1.0:
+        queue_handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(settings.log_level.upper())
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return queue_handler
+
+def shutdown_logging():
+    """Write out queued records and stop the writer thread"""
+    global _listener, _sample_rate
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    _sample_rate = 1.0
+
+atexit.register(shutdown_logging)
@@ -1,30 +1,40 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Query, Header, Path as FastAPIPath
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+import asyncio
 import logging
 import os
 from datetime import datetime
 from typing import List, Optional
 import aiofiles
 import json
+import time
 from pathlib import Path
 
-from .models import QueryRequest, QueryResponse, UploadResponse
+from .models import QueryRequest, QueryResponse, UploadResponse, BulkDeleteRequest, BulkDeleteResponse, CollectionVersionRequest, SESSION_ID_PATTERN
 from .services.document_processor import DocumentProcessor
-from .services.vector_store import VectorStore
+from .services.store_factory import (create_vector_store, create_collection_versions, create_version_builds,
+                                     close_index_client)
+from .services.tenant_stores import TenantVectorStores, DEFAULT_TENANT, TENANT_ID_PATTERN, tenant_collection_name
+from .services.collection_versions import WriteFences, VersionConflictError
 from .services.llm_service import LLMService
+from .services.single_flight import SingleFlight
+from .services.retrieval_depth import trim_results
+from .services.chat_sessions import ChatSessions, SESSIONS_PATH
+from .services.metrics import REGISTRY, UPLOAD_BYTES, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .services.tracing import TRACER, TraceIdFilter, setup_tracing, shutdown_tracing, stage
 from .middleware.logging_middleware import LoggingMiddleware
+from .middleware.tracing_middleware import TracingMiddleware
+from .middleware.profiling_middleware import ProfilingMiddleware
+from .middleware.admission_middleware import AdmissionMiddleware
+from .services.admission import AdmissionController, parse_lane_values
+from .logging_config import setup_logging, shutdown_logging, ROUTINE
 from .config import get_settings
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/app.log'),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging, with each record stamped with the trace it belongs to
+log_handler = setup_logging(get_settings())
+log_handler.addFilter(TraceIdFilter())
+trace_exporter = setup_tracing(get_settings())
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +44,17 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Per-lane concurrency limits and bounded queues; innermost, so a 429 still gets CORS headers, a log line and a span
+admission = None
+if get_settings().admission_max_concurrency > 0:
+    admission = AdmissionController(
+        get_settings().admission_max_concurrency,
+        parse_lane_values(get_settings().admission_weights),
+        queue_per_slot=get_settings().admission_queue_per_slot,
+        max_wait=parse_lane_values(get_settings().admission_max_wait_seconds)
+    )
+    app.add_middleware(AdmissionMiddleware, controller=admission)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -43,14 +64,137 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Profile single requests on demand; without a token, requests do not pass through it at all
+if get_settings().profile_token:
+    app.add_middleware(
+        ProfilingMiddleware,
+        token=get_settings().profile_token,
+        directory=get_settings().profile_dir,
+        interval=get_settings().profile_interval_ms / 1000
+    )
+
 # Add custom logging middleware
 app.add_middleware(LoggingMiddleware)
+# Outermost, so the request log line and everything below it carry the trace id
+app.add_middleware(TracingMiddleware)
 
 # Initialize services
 settings = get_settings()
 document_processor = DocumentProcessor()
-vector_store = VectorStore()
+# Local to this node, or shared through the index service with VECTOR_STORE_URL
+collection_versions = create_collection_versions(settings)
+tenant_stores = TenantVectorStores(
+    lambda collection_name: create_vector_store(settings, collection_name=collection_name),
+    max_open=settings.max_open_tenants,
+    resolve_collection=lambda tenant_id: collection_versions.resolve(tenant_collection_name(tenant_id))
+)
+# Uploads and deletes of each collection alias against the final pass and swap of a version build
+write_fences = WriteFences()
+# Builds and swaps run here, or in the index service where every worker's writes can be held back
+version_builds = create_version_builds(settings, collection_versions, tenant_stores, write_fences,
+                                       document_processor=lambda: document_processor)
 llm_service = LLMService()
+# Identical /query requests in flight at the same time share one retrieval and Gemini call
+query_flights = SingleFlight()
+chat_sessions = ChatSessions(
+    SESSIONS_PATH,
+    history_token_cap=settings.session_history_token_cap,
+    idle_seconds=settings.session_idle_seconds,
+    max_sessions=settings.max_sessions
+)
+# Session compactions run after the response; keep references so they are not garbage collected
+background_tasks = set()
+
+def _hit_ratio(cache) -> float:
+    lookups = cache.hits + cache.misses
+    return cache.hits / lookups if lookups else 0.0
+
+# Gauges and totals kept by the components themselves, read when /metrics is scraped
+REGISTRY.callback("rag_response_cache_entries", "Answers held in the response cache",
+                  lambda: llm_service.cache.stats()["entries"])
+REGISTRY.callback("rag_response_cache_hits_total", "Response cache lookups that found an answer",
+                  lambda: llm_service.cache.hits, kind="counter")
+REGISTRY.callback("rag_response_cache_misses_total", "Response cache lookups that found nothing",
+                  lambda: llm_service.cache.misses, kind="counter")
+REGISTRY.callback("rag_response_cache_hit_ratio", "Share of response cache lookups that hit since startup",
+                  lambda: _hit_ratio(llm_service.cache))
+REGISTRY.callback("rag_llm_in_flight", "Gemini calls in progress", lambda: llm_service.client.stats()["in_flight"])
+REGISTRY.callback("rag_llm_queue_depth", "Callers waiting for a Gemini call slot",
+                  lambda: llm_service.client.stats()["waiting"])
+REGISTRY.callback("rag_llm_retries_total", "Gemini attempts retried after a transient failure",
+                  lambda: llm_service.client.stats()["retries"], kind="counter")
+REGISTRY.callback("rag_query_in_flight", "Distinct /query computations in progress",
+                  lambda: query_flights.stats()["in_flight"])
+REGISTRY.callback("rag_query_coalesced_total", "/query requests answered by an identical request in flight",
+                  lambda: query_flights.coalesced, kind="counter")
+REGISTRY.callback("rag_open_tenant_stores", "Tenant vector stores currently open", lambda: tenant_stores.open_tenants())
+REGISTRY.callback("rag_active_sessions", "Chat sessions used within the idle timeout",
+                  lambda: chat_sessions.stats()["active"])
+REGISTRY.callback("rag_background_tasks", "Session compactions running after their response",
+                  lambda: len(background_tasks))
+REGISTRY.callback("rag_log_queue_depth", "Log records waiting for the writer thread", lambda: log_handler.queue.qsize())
+REGISTRY.callback("rag_log_records_dropped_total", "Log records dropped because the writer fell behind",
+                  lambda: log_handler.dropped, kind="counter")
+if admission:
+    REGISTRY.callback("rag_admission_active", "Requests holding an admission slot, by lane",
+                      lambda: {name: lane.active for name, lane in admission.lanes.items()}, labelnames=("lane",))
+    REGISTRY.callback("rag_admission_queue_depth", "Requests waiting for an admission slot, by lane",
+                      lambda: {name: lane.queued for name, lane in admission.lanes.items()}, labelnames=("lane",))
+if trace_exporter:
+    REGISTRY.callback("rag_traces_dropped_total", "Traces dropped because the trace writer fell behind",
+                      lambda: trace_exporter.dropped, kind="counter")
+
+def get_tenant_id(x_tenant_id: Optional[str] = Header(None)) -> str:
+    """Tenant from the X-Tenant-ID header; requests without one use the default tenant"""
+    if not x_tenant_id:
+        return DEFAULT_TENANT
+    if not TENANT_ID_PATTERN.match(x_tenant_id):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid X-Tenant-ID: use 1-24 letters, digits, '-' or '_'"
+        )
+    return x_tenant_id
+
+# Set once the startup warm-up has loaded the embedding model and index
+readiness = {"ready": False, "warmup_seconds": None, "error": None}
+_warmup_task = None
+
+async def warm_up():
+    """Run a dummy embedding and search so the first real query does not pay for cold start"""
+    start_time = time.perf_counter()
+    try:
+        async with tenant_stores.acquire(DEFAULT_TENANT) as vector_store:
+            await vector_store.warm_up()
+        await llm_service.warm_up()
+        readiness["warmup_seconds"] = round(time.perf_counter() - start_time, 2)
+        readiness["ready"] = True
+        logger.info(f"Warm-up finished in {readiness['warmup_seconds']}s, ready for traffic")
+    except Exception as e:
+        readiness["error"] = str(e)
+        logger.error(f"Warm-up failed: {e}")
+
+def tenant_upload_dir(tenant_id: str) -> Path:
+    """Uploads of the default tenant stay at the top of uploads/, other tenants get a subdirectory"""
+    if tenant_id == DEFAULT_TENANT:
+        return Path("uploads")
+    return Path("uploads") / tenant_id
+
+async def _write(tenant_id: str, operation):
+    """Run ``operation`` on the tenant's serving store under the alias's write fence.
+
+    With the index service, another worker may have swapped versions while
+    this one still resolves the old collection; the service then refuses
+    the write, and it is retried once on the collection now serving.
+    """
+    alias = tenant_collection_name(tenant_id)
+    async with write_fences.write(alias):
+        try:
+            async with tenant_stores.acquire(tenant_id) as vector_store:
+                return await operation(vector_store)
+        except VersionConflictError as e:
+            logger.info(f"Retrying write on the new version of {alias}: {e}")
+        async with tenant_stores.open(await collection_versions.resolve(alias, fresh=True)) as vector_store:
+            return await operation(vector_store)
 
 @app.on_event("startup")
 async def startup_event():
@@ -62,17 +206,63 @@ async def startup_event():
     os.makedirs("logs", exist_ok=True)
     os.makedirs("vector_db", exist_ok=True)
     
-    # Initialize vector store
-    await vector_store.initialize()
+    # Open the default tenant's vector store; other tenants are opened on first use
+    collection_versions.initialize()
+    chat_sessions.initialize()
+    async with tenant_stores.acquire(DEFAULT_TENANT):
+        pass
     logger.info("Vector store initialized")
+    
+    # Warm up in the background so / answers liveness probes while /ready reports 503
+    global _warmup_task
+    _warmup_task = asyncio.create_task(warm_up())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush and close every open tenant store, the Gemini connection pool and the log writer on shutdown"""
+    tenant_stores.close_all()
+    logger.info("Vector stores persisted")
+    await llm_service.close()
+    await close_index_client()
+    chat_sessions.close()
+    shutdown_tracing()
+    shutdown_logging()
 
 @app.get("/")
 async def root():
     """Health check endpoint"""
     return {"message": "Multimodal RAG Chatbot API is running", "timestamp": datetime.now().isoformat()}
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: succeeds only once the startup warm-up has completed"""
+    if not readiness["ready"]:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "failed" if readiness["error"] else "warming_up", "error": readiness["error"]}
+        )
+    return {"status": "ready", "warmup_seconds": readiness["warmup_seconds"]}
+
+@app.get("/stats")
+async def stats():
+    """Runtime counters for this worker"""
+    return {
+        "query_coalescing": query_flights.stats(),
+        "response_cache": llm_service.cache.stats(),
+        "sessions": chat_sessions.stats(),
+        "admission": admission.stats() if admission else None,
+        "logging": {"queued": log_handler.queue.qsize(), "dropped": log_handler.dropped},
+        "tracing": ({"queued": trace_exporter.queued(), "dropped": trace_exporter.dropped}
+                    if trace_exporter else None)
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics for this worker: stage latency histograms, pipeline counters and queue depths"""
+    return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.post("/upload", response_model=UploadResponse)
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...), tenant_id: str = Depends(get_tenant_id)):
     """Upload and process files (PDF, audio, video)"""
     try:
         # Validate file type
@@ -93,34 +283,45 @@ async def upload_file(file: UploadFile = File(...)):
         file_size = 0
         
         # Save file
-        file_path = f"uploads/{file.filename}"
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            file_size = len(content)
-            
-            if file_size > max_size:
-                raise HTTPException(
-                    status_code=413,
-                    detail=f"File too large. Maximum size: {settings.max_file_size_mb}MB"
-                )
-            
-            await f.write(content)
+        upload_dir = tenant_upload_dir(tenant_id)
+        upload_dir.mkdir(parents=True, exist_ok=True)
+        file_path = str(upload_dir / file.filename)
+        with stage("upload", "save"):
+            async with aiofiles.open(file_path, 'wb') as f:
+                content = await file.read()
+                file_size = len(content)
+                
+                if file_size > max_size:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File too large. Maximum size: {settings.max_file_size_mb}MB"
+                    )
+                
+                await f.write(content)
+        UPLOAD_BYTES.inc(file_size, file_type=file.content_type)
         
         logger.info(f"File uploaded: {file.filename}, size: {file_size} bytes")
         
         # Process the file
-        processed_content = await document_processor.process_file(file_path, file.content_type)
+        processing_start = time.perf_counter()
+        with stage("upload", "process", file_type=file.content_type, file_size=file_size) as span:
+            processed_content = await document_processor.process_file(file_path, file.content_type)
+            span.set_attribute("characters", len(processed_content))
+        processing_seconds = time.perf_counter() - processing_start
         
-        # Store in vector database
-        document_id = await vector_store.add_document(
+        # Store in the tenant's vector database
+        metadata = {
+            "filename": file.filename,
+            "file_type": file.content_type,
+            "file_size": file_size,
+            "upload_time": datetime.now().isoformat(),
+            "file_path": file_path
+        }
+        document_id = await _write(tenant_id, lambda vector_store: vector_store.add_document(
             content=processed_content,
-            metadata={
-                "filename": file.filename,
-                "file_type": file.content_type,
-                "file_size": file_size,
-                "upload_time": datetime.now().isoformat()
-            }
-        )
+            metadata=metadata,
+            processing_seconds=processing_seconds
+        ))
         
         logger.info(f"Document processed and stored with ID: {document_id}")
         
@@ -137,121 +338,356 @@ async def upload_file(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/query", response_model=QueryResponse)
-async def query_documents(request: QueryRequest):
-    """Query the RAG system with user input"""
+async def query_documents(request: QueryRequest, tenant_id: str = Depends(get_tenant_id)):
+    """Query the RAG system with user input; identical concurrent queries share one answer"""
     try:
-        logger.info(f"Received query: {request.query[:100]}...")
-        
-        # Retrieve relevant documents
-        relevant_docs = await vector_store.search(
-            query=request.query,
-            limit=request.max_results or 5
-        )
+        logger.info(f"Received query: {request.query[:100]}...", extra=ROUTINE)
         
-        if not relevant_docs:
-            return QueryResponse(
-                query=request.query,
-                answer="I couldn't find any relevant information in the uploaded documents to answer your question.",
-                sources=[],
-                confidence_score=0.0
-            )
-        
-        # Generate answer using LLM
-        answer, confidence = await llm_service.generate_answer(
-            query=request.query,
-            context_docs=relevant_docs
-        )
-        
-        # Format sources
-        sources = [
-            {
-                "content": doc["content"][:200] + "..." if len(doc["content"]) > 200 else doc["content"],
-                "metadata": {
-                    "title": doc["metadata"].get("title", doc["metadata"].get("filename", "Unknown Document")),
-                    "filename": doc["metadata"].get("filename", "Unknown File"),
-                    "file_type": doc["metadata"].get("file_type", "Unknown"),
-                    "chunk_index": doc["metadata"].get("chunk_index", 0),
-                    "document_id": doc["metadata"].get("document_id", "unknown")
-                },
-                "relevance_score": doc["score"]
-            }
-            for doc in relevant_docs
-        ]
-        
-        logger.info(f"Generated answer with confidence: {confidence}")
+        # Same tenant and session, same wording up to case and whitespace, same depth settings
+        key = (tenant_id, request.session_id, " ".join(request.query.split()).casefold(),
+               request.max_results or 5, _is_adaptive(request))
+        with TRACER.span("query.single_flight"):
+            response = await query_flights.run(key, lambda: _answer_query(request, tenant_id))
+        return response.model_copy(update={"query": request.query})
         
+    except Exception as e:
+        logger.error(f"Error processing query: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _answer_query(request: QueryRequest, tenant_id: str) -> QueryResponse:
+    # Retrieve relevant documents from the tenant's collection only
+    retrieved_at = time.time()
+    async with tenant_stores.acquire(tenant_id) as vector_store:
+        relevant_docs = await _retrieve(vector_store, request)
+    
+    if not relevant_docs:
         return QueryResponse(
             query=request.query,
-            answer=answer,
-            sources=sources,
-            confidence_score=confidence
+            answer="I couldn't find any relevant information in the uploaded documents to answer your question.",
+            sources=[],
+            confidence_score=0.0,
+            retrieval_depth=0,
+            session_id=request.session_id
         )
+    
+    # Generate answer using LLM, with the session's bounded history for follow-up questions
+    history = _history(tenant_id, request.session_id)
+    answer, confidence = await llm_service.generate_answer(
+        query=request.query,
+        context_docs=relevant_docs,
+        history=history,
+        retrieved_at=retrieved_at
+    )
+    if request.session_id and confidence > 0:
+        _record_turn(tenant_id, request.session_id, request.query, answer)
+    
+    sources = _format_sources(relevant_docs)
+    
+    logger.info(f"Generated answer with confidence: {confidence}", extra=ROUTINE)
+    
+    return QueryResponse(
+        query=request.query,
+        answer=answer,
+        sources=sources,
+        confidence_score=confidence,
+        retrieval_depth=len(relevant_docs),
+        session_id=request.session_id
+    )
+
+def _record_turn(tenant_id: str, session_id: str, question: str, answer: str):
+    """Add an exchange to the session and compact its history in the background once over the cap"""
+    if chat_sessions.append_turn(tenant_id, session_id, question, answer):
+        task = asyncio.create_task(chat_sessions.compact(tenant_id, session_id, llm_service.summarize_history))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+def _history(tenant_id: str, session_id: Optional[str]) -> str:
+    if not session_id:
+        return ""
+    with stage("query", "history") as span:
+        history = chat_sessions.history(tenant_id, session_id)
+        span.set_attribute("characters", len(history))
+        return history
+
+def _is_adaptive(request: QueryRequest) -> bool:
+    return settings.adaptive_retrieval if request.adaptive is None else request.adaptive
+
+async def _retrieve(vector_store, request: QueryRequest) -> List[dict]:
+    """Search for the query; in adaptive mode over-fetch and keep only the chunks the scores support"""
+    limit = request.max_results or 5
+    if not _is_adaptive(request):
+        with stage("query", "retrieve", limit=limit):
+            return await vector_store.search(query=request.query, limit=limit)
+    
+    with stage("query", "retrieve", limit=limit * settings.retrieval_overfetch_factor, adaptive=True) as span:
+        candidates = await vector_store.search(query=request.query, limit=limit * settings.retrieval_overfetch_factor)
+    relevant_docs = trim_results(
+        candidates,
+        max_depth=limit,
+        min_depth=settings.retrieval_min_depth,
+        score_floor=settings.retrieval_score_floor,
+        gap_ratio=settings.retrieval_gap_ratio
+    )
+    span.set_attribute("kept", len(relevant_docs))
+    logger.info(f"Adaptive retrieval kept {len(relevant_docs)} of {len(candidates)} candidates (max {limit})", extra=ROUTINE)
+    return relevant_docs
+
+def _format_sources(relevant_docs: List[dict]) -> List[dict]:
+    """Trimmed source snippets and metadata returned with an answer"""
+    return [
+        {
+            "content": doc["content"][:200] + "..." if len(doc["content"]) > 200 else doc["content"],
+            "metadata": {
+                "title": doc["metadata"].get("title", doc["metadata"].get("filename", "Unknown Document")),
+                "filename": doc["metadata"].get("filename", "Unknown File"),
+                "file_type": doc["metadata"].get("file_type", "Unknown"),
+                "chunk_index": doc["metadata"].get("chunk_index", 0),
+                "document_id": doc["metadata"].get("document_id", "unknown")
+            },
+            "relevance_score": doc["score"]
+        }
+        for doc in relevant_docs
+    ]
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/query/stream")
+async def query_documents_stream(request: QueryRequest, tenant_id: str = Depends(get_tenant_id)):
+    """Query the RAG system and stream the answer as server-sent events.
+
+    Emits one ``sources`` event, then ``token`` events as Gemini produces
+    text, then a ``done`` event with the confidence score and timings, or
+    an ``error`` event if generation fails part way.
+    """
+    start_time = time.perf_counter()
+    try:
+        logger.info(f"Received streaming query: {request.query[:100]}...", extra=ROUTINE)
         
+        retrieved_at = time.time()
+        async with tenant_stores.acquire(tenant_id) as vector_store:
+            relevant_docs = await _retrieve(vector_store, request)
+        retrieval_seconds = time.perf_counter() - start_time
+        history = _history(tenant_id, request.session_id)
     except Exception as e:
-        logger.error(f"Error processing query: {str(e)}")
+        logger.error(f"Error processing streaming query: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    
+    async def events():
+        yield _sse_event("sources", {"query": request.query, "sources": _format_sources(relevant_docs),
+                                     "retrieval_depth": len(relevant_docs)})
+        
+        first_token_seconds = None
+        pieces = []
+        try:
+            if not relevant_docs:
+                first_token_seconds = time.perf_counter() - start_time
+                yield _sse_event("token", {"text": "I couldn't find any relevant information in the uploaded documents to answer your question."})
+            else:
+                async for text in llm_service.stream_answer(request.query, relevant_docs, history, retrieved_at):
+                    if first_token_seconds is None:
+                        first_token_seconds = time.perf_counter() - start_time
+                    pieces.append(text)
+                    yield _sse_event("token", {"text": text})
+        except Exception as e:
+            logger.error(f"Error streaming answer: {str(e)}")
+            yield _sse_event("error", {"detail": str(e)})
+            return
+        
+        confidence = llm_service.confidence(relevant_docs)
+        if request.session_id and confidence > 0:
+            _record_turn(tenant_id, request.session_id, request.query, "".join(pieces))
+        total_seconds = time.perf_counter() - start_time
+        timings = {
+            "retrieval_seconds": round(retrieval_seconds, 4),
+            "time_to_first_token_seconds": round(first_token_seconds, 4) if first_token_seconds is not None else None,
+            "total_seconds": round(total_seconds, 4)
+        }
+        logger.info(
+            f"Streamed answer with confidence {confidence}: time to first token "
+            f"{timings['time_to_first_token_seconds']}s, total {timings['total_seconds']}s",
+            extra=ROUTINE
+        )
+        yield _sse_event("done", {"confidence_score": confidence, "timings": timings})
+    
+    # Tell proxies not to buffer, or tokens arrive in one burst at the end
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str = FastAPIPath(..., pattern=SESSION_ID_PATTERN),
+                         tenant_id: str = Depends(get_tenant_id)):
+    """Forget a chat session's history"""
+    if not chat_sessions.delete(tenant_id, session_id):
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+    return {"message": f"Session {session_id} deleted successfully"}
 
 @app.get("/documents")
-async def list_documents():
-    """List all uploaded documents"""
+async def list_documents(
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    sort_by: str = Query("upload_time", pattern="^(upload_time|filename|file_size|chunk_count|content_length)$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """List uploaded documents from the document catalog, one page at a time"""
     try:
-        documents = await vector_store.list_documents()
-        return {"documents": documents}
+        async with tenant_stores.acquire(tenant_id) as vector_store:
+            documents = await vector_store.list_documents(
+                limit=limit,
+                offset=offset,
+                sort_by=sort_by,
+                descending=order == "desc"
+            )
+            return {
+                "documents": documents,
+                "total": await asyncio.to_thread(vector_store.count_documents),
+                "limit": limit,
+                "offset": offset
+            }
     except Exception as e:
         logger.error(f"Error listing documents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.delete("/documents/{document_id}")
-async def delete_document(document_id: str):
-    """Delete a specific document"""
+@app.delete("/documents/batch", response_model=BulkDeleteResponse)
+async def delete_documents(request: BulkDeleteRequest, tenant_id: str = Depends(get_tenant_id)):
+    """Delete many documents in one batched vector store call"""
     try:
-        logger.info(f"Attempting to delete document: {document_id}")
+        logger.info(f"Attempting to delete {len(request.document_ids)} documents")
         
-        # First, try to find the document in the vector store
-        vector_store.delete_document(document_id)
+        async def delete(vector_store):
+            deleted = await asyncio.to_thread(vector_store.delete_documents, request.document_ids)
+            await asyncio.to_thread(_remove_uploaded_files, vector_store, deleted.values())
+            return deleted
         
-        # Delete file from uploads directory - try multiple filename patterns
-        uploads_dir = Path("uploads")
-        deleted = False
+        deleted = await _write(tenant_id, delete)
+        llm_service.cache.invalidate_documents(deleted.keys())
         
-        # Try exact filename match first
-        file_path = uploads_dir / document_id
-        if file_path.exists():
-            file_path.unlink()
-            deleted = True
-            logger.info(f"Deleted file: {file_path}")
-        else:
-            # Try to find files that contain the document_id
-            for file_path in uploads_dir.glob("*"):
-                if file_path.is_file() and (file_path.name == document_id or file_path.stem == document_id):
-                    file_path.unlink()
-                    deleted = True
-                    logger.info(f"Deleted file: {file_path}")
-                    break
+        return BulkDeleteResponse(
+            deleted=list(deleted.keys()),
+            not_found=[doc_id for doc_id in dict.fromkeys(request.document_ids) if doc_id not in deleted]
+        )
+    
+    except Exception as e:
+        logger.error(f"Error deleting documents: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error deleting documents: {str(e)}")
+
+@app.delete("/documents/{document_id}")
+async def delete_document(document_id: str, tenant_id: str = Depends(get_tenant_id)):
+    """Delete a specific document"""
+    async def delete(vector_store):
+        try:
+            logger.info(f"Attempting to delete document: {document_id}")
+            
+            deleted = await asyncio.to_thread(vector_store.delete_documents, [document_id])
+        except VersionConflictError:
+            raise
+        except Exception as e:
+            logger.error(f"Error deleting document {document_id}: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Error deleting document: {str(e)}")
         
         if not deleted:
-            logger.warning(f"No file found to delete for document_id: {document_id}")
+            raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
         
-        logger.info(f"Document {document_id} deletion completed")
-        return {"message": f"Document {document_id} deleted successfully"}
+        await asyncio.to_thread(_remove_uploaded_files, vector_store, deleted.values())
+        return deleted
+    
+    deleted = await _write(tenant_id, delete)
+    llm_service.cache.invalidate_documents(deleted.keys())
     
+    logger.info(f"Document {document_id} deletion completed")
+    return {"message": f"Document {document_id} deleted successfully"}
+
+@app.get("/collections/versions")
+async def list_collection_versions(tenant_id: str = Depends(get_tenant_id)):
+    """List the versions of the tenant's collection and which one is serving"""
+    alias = tenant_collection_name(tenant_id)
+    return {
+        "alias": alias,
+        "active": await asyncio.to_thread(collection_versions.active_collection, alias),
+        "building": await version_builds.building(alias),
+        "versions": await asyncio.to_thread(collection_versions.list_versions, alias)
+    }
+
+@app.post("/collections/versions", status_code=202)
+async def create_collection_version(request: CollectionVersionRequest, tenant_id: str = Depends(get_tenant_id)):
+    """Start building a new version of the tenant's collection in the background"""
+    try:
+        return await version_builds.start(tenant_collection_name(tenant_id), request.description, request.activate)
+    except VersionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/collections/versions/{version}/activate")
+async def activate_collection_version(version: int, tenant_id: str = Depends(get_tenant_id)):
+    """Atomically switch the tenant's queries to another ready or retired version"""
+    try:
+        return await version_builds.activate(tenant_collection_name(tenant_id), version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/collections/versions/rollback")
+async def rollback_collection_version(tenant_id: str = Depends(get_tenant_id)):
+    """Switch back to the version that was serving before the current one"""
+    try:
+        return await version_builds.rollback(tenant_collection_name(tenant_id))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/collections/versions/{version}")
+async def delete_collection_version(version: int, tenant_id: str = Depends(get_tenant_id)):
+    """Drop a version that is no longer serving"""
+    alias = tenant_collection_name(tenant_id)
+    entry = await asyncio.to_thread(collection_versions.get_version, alias, version)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Version {version} not found")
+    if entry["status"] in ("active", "building"):
+        raise HTTPException(status_code=409, detail=f"Version {version} is {entry['status']}")
+    if not tenant_stores.retire(entry["collection_name"]):
+        raise HTTPException(status_code=409, detail=f"Version {version} is still serving requests")
+    
+    try:
+        store = create_vector_store(settings, collection_name=entry["collection_name"])
+        await store.initialize()
+        await asyncio.to_thread(store.drop)
+        await asyncio.to_thread(collection_versions.delete_version, alias, version)
     except Exception as e:
-        logger.error(f"Error deleting document {document_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error deleting document: {str(e)}")
+        logger.error(f"Error dropping {entry['collection_name']}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error dropping version: {str(e)}")
+    
+    logger.info(f"Dropped {entry['collection_name']}")
+    return {"message": f"Version {version} deleted successfully"}
+
+def _remove_uploaded_files(vector_store, documents):
+    """Remove the stored uploads of deleted documents unless another document still uses them"""
+    for document in documents:
+        file_path = document.get("file_path")
+        if not file_path or vector_store.is_file_referenced(file_path):
+            continue
+        try:
+            Path(file_path).unlink(missing_ok=True)
+            logger.info(f"Deleted file: {file_path}")
+        except OSError as e:
+            logger.warning(f"Could not delete file {file_path}: {e}")
 
 @app.delete("/documents")
-async def clear_all_documents():
-    """Clear all uploaded documents and reset vector store"""
+async def clear_all_documents(tenant_id: str = Depends(get_tenant_id)):
+    """Clear the tenant's uploaded documents and reset its vector store"""
     try:
-        # Clear all files from uploads directory
-        uploads_dir = Path("uploads")
+        # Clear the tenant's files from the uploads directory
+        uploads_dir = tenant_upload_dir(tenant_id)
         if uploads_dir.exists():
             for file_path in uploads_dir.glob("*"):
                 if file_path.is_file():
                     file_path.unlink()
         
-        # Reset the vector store
-        vector_store.reset()
+        # Reset the tenant's vector store
+        async def reset(vector_store):
+            document_ids = await asyncio.to_thread(vector_store.catalog.document_ids)
+            await asyncio.to_thread(vector_store.reset)
+            return document_ids
+        
+        document_ids = await _write(tenant_id, reset)
+        llm_service.cache.invalidate_documents(document_ids)
         
         logger.info("All documents cleared successfully")
         return {"message": "All documents cleared successfully"}
@@ -0,0 +1,57 @@
+import json
+import time
+
+from ..services.admission import AdmissionController, AdmissionRejected
+from ..services.tracing import current_span
+
+# Endpoints behind each admission lane; everything else is never queued
+LANE_ROUTES = {
+    ("POST", "/query"): "query",
+    ("POST", "/query/stream"): "query",
+    ("POST", "/upload"): "upload",
+    ("GET", "/documents"): "documents",
+}
+
+class AdmissionMiddleware:
+    """Hold each request to its lane's concurrency limit, or turn it away early with 429.
+
+    The slot is held until the last response byte, so a streamed answer
+    counts for as long as it streams. Rejected requests get
+    ``Retry-After`` and never reach the endpoint, so their bodies are not
+    read.
+    """
+
+    def __init__(self, app, controller: AdmissionController):
+        unknown = set(controller.lanes) - set(LANE_ROUTES.values())
+        if unknown:
+            raise ValueError(f"Unknown admission lanes {sorted(unknown)}; use {sorted(set(LANE_ROUTES.values()))}")
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        lane = None
+        if scope["type"] == "http":
+            lane = self.controller.lane(LANE_ROUTES.get((scope["method"], scope["path"].rstrip("/") or "/")))
+        if lane is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await lane.acquire()
+        except AdmissionRejected as e:
+            current_span().set_attributes({"admission.lane": e.lane, "admission.rejected": e.reason})
+            body = json.dumps({"detail": f"Server busy: {e}. Retry in {e.retry_after}s"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                            (b"retry-after", str(e.retry_after).encode())]
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lane.release(time.perf_counter() - start_time)
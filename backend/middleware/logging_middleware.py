@@ -1,67 +1,94 @@
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
 import time
 import logging
-import json
-from datetime import datetime
+
+from ..logging_config import keep_routine
+from ..services.metrics import HTTP_REQUESTS, HTTP_REQUEST_SECONDS
 
 logger = logging.getLogger(__name__)
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        """Log request and response details"""
-        start_time = time.time()
-        timestamp = datetime.now().isoformat()
-        
-        # Log request details
-        request_info = {
-            "timestamp": timestamp,
-            "method": request.method,
-            "url": str(request.url),
-            "client_ip": request.client.host if request.client else "unknown",
-            "user_agent": request.headers.get("user-agent", "unknown")
-        }
-        
-        # Get request body size if available
-        if hasattr(request, 'body'):
-            try:
-                body = await request.body()
-                request_info["body_size"] = len(body)
-            except:
-                request_info["body_size"] = 0
-        
-        logger.info(f"Request: {json.dumps(request_info)}")
-        
+class LoggingMiddleware:
+    """Log one line per HTTP request with status, body sizes and timings.
+
+    A plain ASGI middleware rather than ``BaseHTTPMiddleware``: request
+    and response bodies are never buffered, only counted as their chunks
+    pass through, so uploads are not read twice and streamed responses
+    keep streaming. ``X-Process-Time`` is the time until the response
+    headers were sent; the log line also has the time until the last body
+    chunk, which for streamed answers is the whole generation. The same
+    values are attached as ``extra`` fields for the JSON log output.
+    Requests that did not fail are logged at LOG_SAMPLE_RATE, decided
+    before the record is built. Request counts and durations per route go
+    to /metrics whether or not the line is logged.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status = None
+        request_bytes = 0
+        response_bytes = 0
+        headers_seconds = None
+
+        async def counting_receive():
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                request_bytes += len(message.get("body", b""))
+            return message
+
+        async def timing_send(message):
+            nonlocal status, response_bytes, headers_seconds
+            if message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            elif message["type"] == "http.response.start":
+                status = message["status"]
+                headers_seconds = time.perf_counter() - start_time
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []),
+                                (b"x-process-time", f"{headers_seconds:.6f}".encode())]
+                }
+            await send(message)
+
         try:
-            # Process the request
-            response = await call_next(request)
-            
-            # Calculate processing time
-            process_time = time.time() - start_time
-            
-            # Log response details
-            response_info = {
-                "timestamp": datetime.now().isoformat(),
-                "status_code": response.status_code,
-                "process_time_seconds": round(process_time, 4),
-                "response_headers": dict(response.headers)
-            }
-            
-            logger.info(f"Response: {json.dumps(response_info)}")
-            
-            # Add processing time to response headers
-            response.headers["X-Process-Time"] = str(process_time)
-            
-            return response
-            
+            await self.app(scope, counting_receive, timing_send)
         except Exception as e:
-            # Log errors
-            process_time = time.time() - start_time
-            error_info = {
-                "timestamp": datetime.now().isoformat(),
-                "error": str(e),
-                "process_time_seconds": round(process_time, 4)
-            }
-            
-            logger.error(f"Request error: {json.dumps(error_info)}")
+            logger.error(
+                f"{scope['method']} {scope['path']} failed after "
+                f"{(time.perf_counter() - start_time) * 1000:.1f}ms: {e}"
+            )
             raise
+
+        # Label by route template, not raw path, to keep one series per endpoint
+        route = scope.get("route")
+        route = getattr(route, "path", "unmatched")
+        HTTP_REQUESTS.inc(method=scope["method"], route=route, status=status)
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start_time, method=scope["method"], route=route)
+
+        failed = status is None or status >= 500
+        if logger.isEnabledFor(logging.INFO) and (failed or keep_routine()):
+            client = scope.get("client")
+            query_string = scope.get("query_string", b"")
+            path = scope["path"] + ("?" + query_string.decode("latin-1") if query_string else "")
+            headers_ms = round(headers_seconds * 1000, 2) if headers_seconds is not None else None
+            total_ms = round((time.perf_counter() - start_time) * 1000, 2)
+            logger.info(
+                f"{scope['method']} {path} {status} in={request_bytes}B out={response_bytes}B "
+                f"headers={headers_ms}ms total={total_ms}ms",
+                extra={
+                    "client": client[0] if client else None,
+                    "method": scope["method"],
+                    "path": path,
+                    "status": status,
+                    "request_bytes": request_bytes,
+                    "response_bytes": response_bytes,
+                    "headers_ms": headers_ms,
+                    "total_ms": total_ms
+                }
+            )
@@ -0,0 +1,73 @@
+import hmac
+import logging
+import secrets
+import time
+from urllib.parse import parse_qs
+
+from ..services.profiler import RequestProfile
+from ..services.tracing import current_span
+
+logger = logging.getLogger(__name__)
+
+class ProfilingMiddleware:
+    """Profile single requests on demand and return the profile's id in ``X-Profile-Id``.
+
+    A request is profiled when it carries the admin token in an
+    ``X-Profile`` header or a ``profile`` query parameter. Other requests
+    only pay for a scan of the headers.
+    """
+
+    def __init__(self, app, token: str, directory: str, interval: float):
+        self.app = app
+        self.token = token.encode()
+        self.directory = directory
+        self.interval = interval
+
+    def _requested(self, scope) -> bool:
+        supplied = None
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                supplied = value
+                break
+        query_string = scope.get("query_string", b"")
+        if supplied is None and b"profile=" in query_string:
+            values = parse_qs(query_string.decode("latin-1")).get("profile")
+            supplied = values[0].encode("latin-1") if values else None
+        if supplied is None:
+            return False
+        if not hmac.compare_digest(supplied, self.token):
+            logger.warning(f"Ignoring profiling request with a wrong token for {scope['method']} {scope['path']}")
+            return False
+        return True
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{secrets.token_hex(4)}"
+        span = current_span()
+        span.set_attribute("profile.id", profile_id)
+        profile = RequestProfile(profile_id, self.directory, self.interval, {
+            "method": scope["method"],
+            "path": scope["path"],
+            "trace_id": span.trace_id
+        })
+        status = None
+
+        async def profiling_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]
+                }
+            await send(message)
+
+        profile.start()
+        try:
+            await self.app(scope, receive, profiling_send)
+        finally:
+            route = getattr(scope.get("route"), "path", None)
+            profile.stop(route=route, status=status)
@@ -0,0 +1,65 @@
+import re
+
+from ..services.tracing import TRACER, NOOP_SPAN
+
+# W3C trace context: version-traceid-parentid-flags
+TRACEPARENT_PATTERN = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+class TracingMiddleware:
+    """Open the root span of each HTTP request and return its trace id in ``X-Trace-ID``.
+
+    A caller's ``traceparent`` header is continued, so the spans join the
+    caller's trace. Spans opened while the request is handled, including
+    in tasks it starts, nest under this one. Requests left out by
+    TRACE_SAMPLE_RATE, or with tracing disabled, pass straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or TRACER.exporter is None:
+            await self.app(scope, receive, send)
+            return
+
+        trace_id = parent_id = tenant_id = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                match = TRACEPARENT_PATTERN.match(value.decode("latin-1").strip().lower())
+                if match and match.group(1) != "0" * 32:
+                    trace_id, parent_id = match.groups()
+            elif name == b"x-tenant-id":
+                tenant_id = value.decode("latin-1")
+
+        span = TRACER.start_trace(scope["method"], trace_id=trace_id, parent_id=parent_id, **{
+            "http.request.method": scope["method"],
+            "url.path": scope["path"],
+            "tenant.id": tenant_id
+        })
+        if span is NOOP_SPAN:
+            await self.app(scope, receive, send)
+            return
+
+        status = None
+
+        async def tracing_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []), (b"x-trace-id", span.trace_id.encode())]
+                }
+            await send(message)
+
+        with span:
+            try:
+                await self.app(scope, receive, tracing_send)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    span.name = f"{scope['method']} {route}"
+                    span.set_attribute("http.route", route)
+                span.set_attribute("http.response.status_code", status)
+                if status is not None and status >= 500:
+                    span.record_error(f"HTTP {status}")
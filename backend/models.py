@@ -1,9 +1,15 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 
+SESSION_ID_PATTERN = r"^[A-Za-z0-9_-]{8,64}$"
+
 class QueryRequest(BaseModel):
     query: str
     max_results: Optional[int] = 5
+    # Over-fetch and trim to the chunks the scores support; None follows ADAPTIVE_RETRIEVAL
+    adaptive: Optional[bool] = None
+    # Client-chosen id that carries the conversation across queries; omit for a one-off question
+    session_id: Optional[str] = Field(None, pattern=SESSION_ID_PATTERN)
 
 class SourceMetadata(BaseModel):
     title: str
@@ -22,6 +28,8 @@ class QueryResponse(BaseModel):
     answer: str
     sources: List[SourceInfo]
     confidence_score: float
+    retrieval_depth: Optional[int] = None
+    session_id: Optional[str] = None
 
 class UploadResponse(BaseModel):
     success: bool
@@ -36,3 +44,14 @@ class DocumentInfo(BaseModel):
     file_type: str
     upload_time: str
     content_length: int
+
+class BulkDeleteRequest(BaseModel):
+    document_ids: List[str] = Field(..., min_length=1, max_length=1000)
+
+class BulkDeleteResponse(BaseModel):
+    deleted: List[str]
+    not_found: List[str]
+
+class CollectionVersionRequest(BaseModel):
+    description: Optional[str] = None
+    activate: bool = True
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from .metrics import ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Reasons a request is turned away, as counted in /stats and /metrics
+REJECT_QUEUE_FULL = "queue_full"
+REJECT_OVERLOADED = "overloaded"
+REJECT_TIMEOUT = "timeout"
+
+DEFAULT_MAX_WAIT_SECONDS = 10.0
+
+def parse_lane_values(value: str) -> Dict[str, float]:
+    """Parse ``lane=number`` pairs separated by commas, as in ``query=6,upload=1``"""
+    values = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, _, number = item.partition("=")
+        try:
+            values[name.strip()] = float(number)
+        except ValueError:
+            raise ValueError(f"Invalid lane setting {item.strip()!r}: expected lane=number")
+    return values
+
+class AdmissionRejected(Exception):
+    """A request was turned away; ``retry_after`` is when trying again may succeed, in seconds"""
+
+    def __init__(self, lane: str, reason: str, retry_after: float):
+        super().__init__(f"{lane} lane {reason.replace('_', ' ')}")
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class Lane:
+    """Concurrency slots and a bounded FIFO queue for one class of endpoints.
+
+    Up to ``limit`` requests run at once and up to ``queue_size`` more wait
+    their turn, each for at most ``max_wait`` seconds. The expected wait of
+    a new arrival is estimated from the requests ahead of it and the
+    average time a request holds its slot; when that is already beyond
+    ``max_wait``, the request is rejected at once instead of timing out in
+    the queue.
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int, max_wait: float):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.active = 0
+        self.admitted = 0
+        self.rejected = {REJECT_QUEUE_FULL: 0, REJECT_OVERLOADED: 0, REJECT_TIMEOUT: 0}
+        # Moving average of the seconds a request holds a slot; None until one has finished
+        self.service_seconds: Optional[float] = None
+        self._waiters = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def expected_wait(self, position: int) -> float:
+        """Seconds until the request at ``position`` in the queue gets a slot"""
+        if self.service_seconds is None:
+            return 0.0
+        return (position + 1) * self.service_seconds / self.limit
+
+    async def acquire(self):
+        """Wait for a slot, or raise AdmissionRejected"""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self._admit(0.0)
+            return
+
+        position = len(self._waiters)
+        if position >= self.queue_size:
+            self._reject(REJECT_QUEUE_FULL, self.expected_wait(position))
+        expected = self.expected_wait(position)
+        if expected > self.max_wait:
+            self._reject(REJECT_OVERLOADED, expected)
+
+        start_time = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        deadline = asyncio.get_running_loop().call_later(self.max_wait, self._expire, waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # The client went away; a slot handed over meanwhile goes to the next in line
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                self.release(None)
+            raise
+        finally:
+            deadline.cancel()
+            if waiter.cancelled() and waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self._admit(time.perf_counter() - start_time)
+
+    def _expire(self, waiter: asyncio.Future):
+        if not waiter.done():
+            self._waiters.remove(waiter)
+            waiter.set_exception(self._rejection(REJECT_TIMEOUT, self.expected_wait(len(self._waiters))))
+
+    def release(self, seconds: Optional[float]):
+        """Free a slot after a request held it for ``seconds``, handing it to the oldest waiter"""
+        if seconds is not None:
+            self.service_seconds = (seconds if self.service_seconds is None
+                                    else 0.8 * self.service_seconds + 0.2 * seconds)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _admit(self, waited: float):
+        self.admitted += 1
+        ADMISSION_WAIT_SECONDS.observe(waited, lane=self.name)
+
+    def _rejection(self, reason: str, retry_after: float) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        ADMISSION_REJECTED.inc(lane=self.name, reason=reason)
+        return AdmissionRejected(self.name, reason, retry_after)
+
+    def _reject(self, reason: str, retry_after: float):
+        raise self._rejection(reason, retry_after)
+
+    def stats(self) -> Dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self.queued,
+            "queue_size": self.queue_size,
+            "max_wait_seconds": self.max_wait,
+            "service_seconds": round(self.service_seconds, 4) if self.service_seconds is not None else None,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected)
+        }
+
+class AdmissionController:
+    """Per-lane admission for this worker, with slots shared out by weight.
+
+    ``max_concurrency`` slots are split between the lanes in proportion to
+    ``weights``, each lane getting at least one, so a burst on one lane
+    never holds the slots of another: cheap catalog reads keep flowing
+    while queries wait on Gemini. Each lane queues up to
+    ``queue_per_slot`` requests per slot. Lanes without a weight are not
+    limited.
+    """
+
+    def __init__(self, max_concurrency: int, weights: Dict[str, float], queue_per_slot: int = 4,
+                 max_wait: Optional[Dict[str, float]] = None):
+        max_wait = max_wait or {}
+        total_weight = sum(weight for weight in weights.values() if weight > 0)
+        self.lanes: Dict[str, Lane] = {}
+        for name, weight in weights.items():
+            if weight <= 0:
+                continue
+            limit = max(1, round(max_concurrency * weight / total_weight))
+            self.lanes[name] = Lane(name, limit, queue_size=limit * queue_per_slot,
+                                    max_wait=max_wait.get(name, DEFAULT_MAX_WAIT_SECONDS))
+        logger.info("Admission limits: " + ", ".join(f"{name}={lane.limit}" for name, lane in self.lanes.items()))
+
+    def lane(self, name: str) -> Optional[Lane]:
+        return self.lanes.get(name)
+
+    def stats(self) -> Dict[str, Dict]:
+        return {name: lane.stats() for name, lane in self.lanes.items()}
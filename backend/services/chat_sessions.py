@@ -0,0 +1,225 @@
+import sqlite3
+import threading
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_PATH = os.path.join("vector_db", "chat_sessions.sqlite3")
+
+# Rough English average; good enough to keep the prompt under a budget without a tokenizer
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _format_turn(turn: Dict[str, Any]) -> str:
+    return f"User: {turn['question']}\nAssistant: {turn['answer']}"
+
+class ChatSessions:
+    """Conversation history of chat sessions, persisted in SQLite.
+
+    A session holds a rolling summary plus the turns that have not been
+    folded into it yet. Once summary and turns together exceed
+    ``history_token_cap``, ``compact`` folds the oldest turns into the
+    summary with one LLM call, leaving the newest turns verbatim.
+    ``history`` never returns more than the cap, even before a compaction
+    has caught up. Sessions idle for ``idle_seconds`` are deleted, as are
+    the least recently used ones beyond ``max_sessions``.
+    """
+
+    def __init__(self, db_path: str, history_token_cap: int = 1000, idle_seconds: float = 3600,
+                 max_sessions: int = 10000):
+        self.db_path = db_path
+        self.history_token_cap = history_token_cap
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self.compactions = 0
+        self.evicted = 0
+        self._compacting = set()
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def initialize(self):
+        """Open the database and create the schema if needed"""
+        if self._conn is not None:
+            return
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                tenant_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                summary TEXT NOT NULL DEFAULT '',
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (tenant_id, session_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions(updated_at);
+            CREATE TABLE IF NOT EXISTS session_turns (
+                turn_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tenant_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                FOREIGN KEY (tenant_id, session_id) REFERENCES sessions(tenant_id, session_id) ON DELETE CASCADE
+            );
+            CREATE INDEX IF NOT EXISTS idx_session_turns_session ON session_turns(tenant_id, session_id, turn_id);
+        """)
+        self._conn.commit()
+        logger.info(f"Chat sessions ready at {self.db_path}")
+
+    def _load(self, tenant_id: str, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, updated_at FROM sessions WHERE tenant_id = ? AND session_id = ?",
+                (tenant_id, session_id)
+            ).fetchone()
+            if row is None or time.time() - row["updated_at"] > self.idle_seconds:
+                return {"summary": "", "turns": []}
+            turns = self._conn.execute(
+                "SELECT turn_id, question, answer FROM session_turns "
+                "WHERE tenant_id = ? AND session_id = ? ORDER BY turn_id",
+                (tenant_id, session_id)
+            ).fetchall()
+        return {"summary": row["summary"], "turns": [dict(turn) for turn in turns]}
+
+    def history(self, tenant_id: str, session_id: str) -> str:
+        """Conversation so far for the prompt: the summary plus the newest turns that fit the cap"""
+        session = self._load(tenant_id, session_id)
+        budget = self.history_token_cap
+        summary = session["summary"][:budget * CHARS_PER_TOKEN]
+        budget -= estimate_tokens(summary)
+
+        recent = []
+        for turn in reversed(session["turns"]):
+            text = _format_turn(turn)
+            if estimate_tokens(text) > budget:
+                if not recent and budget > 0:
+                    # Keep the start of the latest exchange rather than losing it entirely
+                    recent.append(text[:budget * CHARS_PER_TOKEN])
+                break
+            recent.append(text)
+            budget -= estimate_tokens(text)
+
+        parts = []
+        if summary:
+            parts.append(f"Summary of the earlier conversation: {summary}")
+        parts.extend(reversed(recent))
+        return "\n\n".join(parts)
+
+    def append_turn(self, tenant_id: str, session_id: str, question: str, answer: str) -> bool:
+        """Record an exchange; returns whether the history now needs compacting"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT updated_at FROM sessions WHERE tenant_id = ? AND session_id = ?", (tenant_id, session_id)
+            ).fetchone()
+            if row is not None and now - row["updated_at"] > self.idle_seconds:
+                # Expired but not swept yet: start the conversation afresh
+                self._conn.execute(
+                    "DELETE FROM sessions WHERE tenant_id = ? AND session_id = ?", (tenant_id, session_id)
+                )
+            self._conn.execute(
+                """
+                INSERT INTO sessions (tenant_id, session_id, created_at, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(tenant_id, session_id) DO UPDATE SET updated_at = excluded.updated_at
+                """,
+                (tenant_id, session_id, now, now)
+            )
+            self._conn.execute(
+                "INSERT INTO session_turns (tenant_id, session_id, question, answer) VALUES (?, ?, ?, ?)",
+                (tenant_id, session_id, question, answer)
+            )
+            self._evict(now)
+        return self._history_tokens(tenant_id, session_id) > self.history_token_cap
+
+    def _history_tokens(self, tenant_id: str, session_id: str) -> int:
+        session = self._load(tenant_id, session_id)
+        return estimate_tokens(session["summary"]) + sum(
+            estimate_tokens(_format_turn(turn)) for turn in session["turns"]
+        )
+
+    async def compact(self, tenant_id: str, session_id: str,
+                      summarize: Callable[[str, List[Dict[str, Any]], int], Awaitable[str]]):
+        """Fold the oldest turns into the summary, keeping about half the cap for verbatim turns"""
+        key = (tenant_id, session_id)
+        if key in self._compacting:
+            return
+        self._compacting.add(key)
+        try:
+            session = self._load(tenant_id, session_id)
+            budget = self.history_token_cap // 2
+            keep = 0
+            for turn in reversed(session["turns"]):
+                budget -= estimate_tokens(_format_turn(turn))
+                if budget < 0:
+                    break
+                keep += 1
+            folded = session["turns"][:len(session["turns"]) - keep]
+            if not folded:
+                return
+
+            summary = await summarize(session["summary"], folded, self.history_token_cap // 2)
+            summary = summary.strip()[:(self.history_token_cap // 2) * CHARS_PER_TOKEN]
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "UPDATE sessions SET summary = ? WHERE tenant_id = ? AND session_id = ?",
+                    (summary, tenant_id, session_id)
+                )
+                # Turns recorded while the summary was being written stay verbatim
+                self._conn.execute(
+                    "DELETE FROM session_turns WHERE tenant_id = ? AND session_id = ? AND turn_id <= ?",
+                    (tenant_id, session_id, folded[-1]["turn_id"])
+                )
+            self.compactions += 1
+            logger.info(f"Compacted {len(folded)} turns of session {session_id} into its summary")
+        except Exception as e:
+            # The history stays capped without the summary; the next turn will try again
+            logger.error(f"Error compacting session {session_id}: {e}")
+        finally:
+            self._compacting.discard(key)
+
+    def delete(self, tenant_id: str, session_id: str) -> bool:
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM sessions WHERE tenant_id = ? AND session_id = ?", (tenant_id, session_id)
+            ).rowcount > 0
+
+    def _evict(self, now: float):
+        idle = self._conn.execute(
+            "DELETE FROM sessions WHERE updated_at < ?", (now - self.idle_seconds,)
+        ).rowcount
+        overflow = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - self.max_sessions
+        if overflow > 0:
+            self._conn.execute(
+                """
+                DELETE FROM sessions WHERE rowid IN (
+                    SELECT rowid FROM sessions ORDER BY updated_at LIMIT ?
+                )
+                """,
+                (overflow,)
+            )
+        self.evicted += idle + max(overflow, 0)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            active = self._conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE updated_at >= ?", (time.time() - self.idle_seconds,)
+            ).fetchone()[0]
+        return {"active": active, "compactions": self.compactions, "evicted": self.evicted}
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
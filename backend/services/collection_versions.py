@@ -0,0 +1,433 @@
+import asyncio
+import sqlite3
+import threading
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Callable, List, Dict, Any, Optional, Set, Tuple
+
+from .vector_store import VectorStore
+from .document_catalog import DocumentCatalog
+from .embeddings import create_embedding_function
+from .tenant_stores import TenantVectorStores
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_PATH = os.path.join("vector_db", "collection_versions.sqlite3")
+
+# Version statuses: building -> ready -> active -> retired (rollback target), or failed
+ACTIVATABLE_STATUSES = ("ready", "retired")
+
+class VersionConflictError(Exception):
+    """A build or write conflicts with the state of the alias, e.g. it targets a retired version"""
+
+class CollectionVersions:
+    """Registry of versioned physical collections behind each logical collection.
+
+    A logical collection (the alias) is served by exactly one active
+    version. New versions are built next to it and swapped in with a single
+    transaction; the previous version is kept as ``retired`` so it can be
+    rolled back to. Version 0 is the original unversioned collection, named
+    after the alias itself. Every worker reads the registry per request, so
+    a swap is picked up everywhere without a restart.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def initialize(self):
+        """Open the database and create the schema if needed"""
+        if self._conn is not None:
+            return
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS collection_versions (
+                alias TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                collection_name TEXT NOT NULL,
+                status TEXT NOT NULL,
+                description TEXT,
+                created_at TEXT,
+                activated_at TEXT,
+                PRIMARY KEY (alias, version)
+            );
+        """)
+        self._conn.commit()
+
+    def active_collection(self, alias: str) -> str:
+        """Name of the physical collection currently serving the alias"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT collection_name FROM collection_versions WHERE alias = ? AND status = 'active'",
+                (alias,)
+            ).fetchone()
+        return row["collection_name"] if row else alias
+
+    async def resolve(self, alias: str, fresh: bool = False) -> str:
+        """``active_collection`` for the request path; the local registry is always current"""
+        return self.active_collection(alias)
+
+    def collection_status(self, collection_name: str) -> Tuple[str, Optional[str]]:
+        """Alias and status of a physical collection; an unversioned collection is its own alias"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT alias, status FROM collection_versions WHERE collection_name = ?", (collection_name,)
+            ).fetchone()
+        if row is None:
+            return collection_name, None
+        return row["alias"], row["status"]
+
+    def list_versions(self, alias: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM collection_versions WHERE alias = ? ORDER BY version", (alias,)
+            ).fetchall()
+        if not rows:
+            return [{"alias": alias, "version": 0, "collection_name": alias, "status": "active",
+                     "description": "Original collection", "created_at": None, "activated_at": None}]
+        return [dict(row) for row in rows]
+
+    def get_version(self, alias: str, version: int) -> Optional[Dict[str, Any]]:
+        return next((row for row in self.list_versions(alias) if row["version"] == version), None)
+
+    def create_version(self, alias: str, description: Optional[str] = None) -> Dict[str, Any]:
+        """Register a new version in the ``building`` state"""
+        with self._lock, self._conn:
+            self._ensure_original(alias)
+            version = self._conn.execute(
+                "SELECT MAX(version) FROM collection_versions WHERE alias = ?", (alias,)
+            ).fetchone()[0] + 1
+            self._conn.execute(
+                """
+                INSERT INTO collection_versions (alias, version, collection_name, status, description, created_at)
+                VALUES (?, ?, ?, 'building', ?, ?)
+                """,
+                (alias, version, f"{alias}_v{version}", description, datetime.now().isoformat())
+            )
+        return self.get_version(alias, version)
+
+    def set_status(self, alias: str, version: int, status: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE collection_versions SET status = ? WHERE alias = ? AND version = ?",
+                (status, alias, version)
+            )
+
+    def activate(self, alias: str, version: int) -> Dict[str, Any]:
+        """Atomically make ``version`` the active one; the current version becomes retired"""
+        with self._lock, self._conn:
+            self._ensure_original(alias)
+            row = self._conn.execute(
+                "SELECT status FROM collection_versions WHERE alias = ? AND version = ?", (alias, version)
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Version {version} of {alias} does not exist")
+            if row["status"] == "active":
+                return self._get_version(alias, version)
+            if row["status"] not in ACTIVATABLE_STATUSES:
+                raise ValueError(f"Version {version} of {alias} is {row['status']} and cannot be activated")
+            self._conn.execute(
+                "UPDATE collection_versions SET status = 'retired' WHERE alias = ? AND status = 'active'", (alias,)
+            )
+            self._conn.execute(
+                "UPDATE collection_versions SET status = 'active', activated_at = ? WHERE alias = ? AND version = ?",
+                (datetime.now().isoformat(), alias, version)
+            )
+            activated = self._get_version(alias, version)
+        logger.info(f"Activated {activated['collection_name']} for {alias}")
+        return activated
+
+    def rollback(self, alias: str) -> Dict[str, Any]:
+        """Reactivate the most recently active retired version"""
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT version FROM collection_versions
+                WHERE alias = ? AND status = 'retired'
+                ORDER BY activated_at IS NULL, activated_at DESC, version DESC LIMIT 1
+                """,
+                (alias,)
+            ).fetchone()
+        if row is None:
+            raise ValueError(f"{alias} has no previous version to roll back to")
+        return self.activate(alias, row["version"])
+
+    def delete_version(self, alias: str, version: int):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM collection_versions WHERE alias = ? AND version = ? AND status != 'active'",
+                (alias, version)
+            )
+
+    def _get_version(self, alias: str, version: int) -> Dict[str, Any]:
+        row = self._conn.execute(
+            "SELECT * FROM collection_versions WHERE alias = ? AND version = ?", (alias, version)
+        ).fetchone()
+        return dict(row)
+
+    def _ensure_original(self, alias: str):
+        # The unversioned collection becomes version 0 the first time the alias is versioned
+        self._conn.execute(
+            """
+            INSERT OR IGNORE INTO collection_versions (alias, version, collection_name, status, description)
+            SELECT ?, 0, ?, 'active', 'Original collection'
+            WHERE NOT EXISTS (SELECT 1 FROM collection_versions WHERE alias = ?)
+            """,
+            (alias, alias, alias)
+        )
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class WriteFences:
+    """Per-alias fence between document writes and version swaps.
+
+    Uploads and deletes of an alias run side by side under ``write``.
+    ``swap`` holds new writes back, waits for those in progress to finish
+    and keeps the alias to itself until the block ends, so a final
+    reconcile pass and the swap after it see no write half done. Writes
+    resolve the serving collection only once inside the fence, so those
+    held back land on the new version.
+    """
+
+    def __init__(self):
+        self._writers: Dict[str, int] = {}
+        self._swapping: Set[str] = set()
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def write(self, alias: str) -> AsyncIterator[None]:
+        async with self._condition:
+            await self._condition.wait_for(lambda: alias not in self._swapping)
+            self._writers[alias] = self._writers.get(alias, 0) + 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._writers[alias] -= 1
+                if not self._writers[alias]:
+                    del self._writers[alias]
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def swap(self, alias: str) -> AsyncIterator[None]:
+        async with self._condition:
+            await self._condition.wait_for(lambda: alias not in self._swapping)
+            self._swapping.add(alias)
+            try:
+                await self._condition.wait_for(lambda: alias not in self._writers)
+            except BaseException:
+                self._swapping.discard(alias)
+                self._condition.notify_all()
+                raise
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._swapping.discard(alias)
+                self._condition.notify_all()
+
+class VersionBuilds:
+    """Builds, activations and rollbacks of collection versions.
+
+    Run by the one process that writes the collections: the API without
+    VECTOR_STORE_URL, the index service otherwise. At most one build runs
+    per alias. A build fills the new version while the active one keeps
+    serving, then runs its last pass and the swap under the alias's
+    ``WriteFences.swap``, which activations and rollbacks take as well.
+    ``store_factory`` makes a store from a collection name and embedding
+    function; ``document_processor`` returns the processor used to
+    re-process uploaded files, or None to copy chunks instead.
+    """
+
+    def __init__(self, registry: CollectionVersions, stores: TenantVectorStores, fences: WriteFences,
+                 store_factory: Callable[[str, Any], VectorStore],
+                 document_processor: Optional[Callable[[], Any]] = None):
+        self.registry = registry
+        self.stores = stores
+        self.fences = fences
+        self.store_factory = store_factory
+        self.document_processor = document_processor
+        self._builds: Dict[str, asyncio.Task] = {}
+
+    async def building(self, alias: str) -> bool:
+        build = self._builds.get(alias)
+        return build is not None and not build.done()
+
+    async def start(self, alias: str, description: Optional[str] = None, activate: bool = False,
+                    version: Optional[int] = None, model_name: Optional[str] = None) -> Dict[str, Any]:
+        """Start building a new version of the alias, or finish filling the ``building`` one given.
+
+        The version embeds with ``model_name``, by default the model the
+        serving collection was embedded with.
+        """
+        if await self.building(alias):
+            raise VersionConflictError(f"A version of {alias} is already being built")
+        if version is None:
+            entry = self.registry.create_version(alias, description)
+        else:
+            entry = self.registry.get_version(alias, version)
+            if entry is None or entry["status"] != "building":
+                raise ValueError(f"Version {version} of {alias} is not an unfinished build")
+        self._builds[alias] = asyncio.create_task(self._build(entry, activate, model_name))
+        logger.info(f"Started building {entry['collection_name']}")
+        return entry
+
+    async def _build(self, version: Dict[str, Any], activate: bool, model_name: Optional[str]):
+        alias = version["alias"]
+        target = None
+        try:
+            # The re-embedding tool fills its version through the open stores; close that copy
+            # first, so the build is the only one writing the files
+            while not self.stores.retire(version["collection_name"]):
+                await asyncio.sleep(0.1)
+            document_processor = None
+            if self.document_processor is not None:
+                document_processor = await asyncio.to_thread(self.document_processor)
+            async with self.stores.open(self.registry.active_collection(alias)) as source:
+                # Record the model the same way the re-embedding tool does
+                model_name = model_name or await asyncio.to_thread(source.catalog.get_meta, "embedding_model")
+                target = self.store_factory(version["collection_name"], create_embedding_function(model_name))
+                await target.initialize()
+                if model_name:
+                    await asyncio.to_thread(target.catalog.set_meta, "embedding_model", model_name)
+                stats = await build_collection_version(source, target, document_processor)
+                await target.warm_up()
+            # Catch up on writes made meanwhile, holding new ones back until the swap
+            async with self.fences.swap(alias), \
+                    self.stores.open(self.registry.active_collection(alias)) as source:
+                await build_collection_version(source, target, document_processor)
+                await asyncio.to_thread(target.persist)
+                await asyncio.to_thread(target.close)
+                self.registry.set_status(alias, version["version"], "ready")
+                if activate:
+                    self._activate(alias, version["version"])
+            logger.info(f"Built {version['collection_name']}: {stats}")
+        except Exception as e:
+            logger.error(f"Error building {version['collection_name']}: {str(e)}")
+            self.registry.set_status(alias, version["version"], "failed")
+            try:
+                if target is not None:
+                    target.close()
+            except Exception:
+                pass
+
+    async def activate(self, alias: str, version: int) -> Dict[str, Any]:
+        """Atomically switch the alias to another ready or retired version"""
+        async with self.fences.swap(alias):
+            return self._activate(alias, version)
+
+    async def rollback(self, alias: str) -> Dict[str, Any]:
+        """Switch back to the version that was serving before the current one"""
+        async with self.fences.swap(alias):
+            previous = self.registry.active_collection(alias)
+            activated = self.registry.rollback(alias)
+            self.stores.retire(previous)
+            return activated
+
+    def _activate(self, alias: str, version: int) -> Dict[str, Any]:
+        # Close the store that was serving
+        previous = self.registry.active_collection(alias)
+        activated = self.registry.activate(alias, version)
+        if activated["collection_name"] != previous:
+            self.stores.retire(previous)
+        return activated
+
+def collection_document_ids(catalog: DocumentCatalog, page_size: int = 10000) -> Set[str]:
+    """Every document id in the catalog, read a page at a time"""
+    document_ids = set()
+    after = ""
+    while True:
+        page = catalog.list_document_shards(after=after, limit=page_size)
+        if not page:
+            return document_ids
+        document_ids.update(row["document_id"] for row in page)
+        after = page[-1]["document_id"]
+
+async def build_collection_version(source: VectorStore, target: VectorStore,
+                                   document_processor=None) -> Dict[str, int]:
+    """Fill ``target`` with every document of ``source`` while ``source`` keeps serving.
+
+    Documents are re-processed from their uploaded files, so chunking and
+    embedding changes take effect; documents whose file is gone, and all of
+    them without a ``document_processor``, are copied chunk by chunk and
+    re-embedded. Uploads and deletes that land on the
+    source during the build are reconciled in further passes, and the
+    function returns only after a pass finds nothing left to do. For the
+    last pass and the swap after it, callers hold the alias's
+    ``WriteFences.swap``, so no write can slip in between. Catalog reads,
+    processing and embedding run in threads, so the event loop keeps serving.
+    """
+    stats = {"reprocessed": 0, "copied": 0, "removed": 0, "passes": 0}
+    start_time = time.perf_counter()
+    while True:
+        stats["passes"] += 1
+        source_ids = await asyncio.to_thread(collection_document_ids, source.catalog)
+        target_ids = await asyncio.to_thread(collection_document_ids, target.catalog)
+        missing = sorted(source_ids - target_ids)
+        stale = list(target_ids - source_ids)
+        if not missing and not stale:
+            logger.info(f"Built {target.collection_name} in {time.perf_counter() - start_time:.1f}s: {stats}")
+            return stats
+
+        if stale:
+            await asyncio.to_thread(target.delete_documents, stale)
+            stats["removed"] += len(stale)
+
+        for position, document_id in enumerate(missing, 1):
+            document = await asyncio.to_thread(source.catalog.get, document_id)
+            if document is None:
+                continue  # Deleted from the source since this pass started
+            await _rebuild_document(source, target, document, document_processor, stats)
+            if position % 100 == 0:
+                logger.info(f"Building {target.collection_name}: {position}/{len(missing)} documents "
+                            f"in pass {stats['passes']}")
+
+def _upload_metadata(document: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: document.get(key) for key in ("filename", "file_type", "file_size", "upload_time", "file_path")}
+
+async def copy_document(target: VectorStore, document: Dict[str, Any], chunks: List[str],
+                        embeddings: Optional[List[List[float]]] = None):
+    """Write a document's existing chunks into ``target`` under the same id and catalog attributes"""
+    if not chunks:
+        # Nothing to embed; carry the catalog row over so the document is not lost
+        logger.warning(f"Document {document['document_id']} has no chunks; copying its catalog entry only")
+        await asyncio.to_thread(target.catalog.upsert, {**document, "chunk_count": 0, "shard": None})
+        return
+
+    await target.add_document("", _upload_metadata(document), document_id=document["document_id"],
+                              processing_seconds=document.get("processing_seconds"),
+                              chunks=chunks, embeddings=embeddings)
+    # Keep the original content length rather than that of the empty placeholder
+    copied = await asyncio.to_thread(target.catalog.get, document["document_id"])
+    copied["content_length"] = document.get("content_length", 0)
+    await asyncio.to_thread(target.catalog.upsert, copied)
+
+async def _rebuild_document(source: VectorStore, target: VectorStore, document: Dict[str, Any],
+                            document_processor, stats: Dict[str, int]):
+    file_path = document.get("file_path")
+    if document_processor is not None and file_path and os.path.exists(file_path):
+        processing_start = time.perf_counter()
+        content = await document_processor.process_file(file_path, document["file_type"])
+        await target.add_document(content, _upload_metadata(document), document_id=document["document_id"],
+                                  processing_seconds=time.perf_counter() - processing_start)
+        stats["reprocessed"] += 1
+        return
+
+    chunks = (await asyncio.to_thread(source.get_chunks, [document["document_id"]])).get(document["document_id"], [])
+    await copy_document(target, document, chunks)
+    stats["copied"] += 1
@@ -0,0 +1,229 @@
+import sqlite3
+import threading
+import logging
+import os
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Columns the /documents endpoint is allowed to sort on
+SORTABLE_COLUMNS = {
+    "upload_time": "upload_time",
+    "filename": "filename COLLATE NOCASE",
+    "file_size": "file_size",
+    "chunk_count": "chunk_count",
+    "content_length": "content_length",
+}
+
+class DocumentCatalog:
+    """Document-level catalog persisted in SQLite.
+
+    The vector store keeps one row per chunk; this catalog keeps one row per
+    document so listing documents never has to scan the chunk collection.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def initialize(self):
+        """Open the database and create the schema if needed"""
+        if self._conn is not None:
+            return
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                document_id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                file_type TEXT,
+                file_size INTEGER DEFAULT 0,
+                upload_time TEXT,
+                content_length INTEGER DEFAULT 0,
+                chunk_count INTEGER DEFAULT 0,
+                processing_seconds REAL,
+                indexing_seconds REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_documents_upload_time ON documents(upload_time);
+            CREATE TABLE IF NOT EXISTS catalog_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self._add_missing_columns({"file_path": "TEXT", "shard": "INTEGER"})
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_file_path ON documents(file_path)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_shard ON documents(shard)")
+        self._conn.commit()
+        logger.info(f"Document catalog ready at {self.db_path}")
+
+    def _add_missing_columns(self, columns: Dict[str, str]):
+        """Add columns introduced after a catalog was first created"""
+        existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        for name, column_type in columns.items():
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE documents ADD COLUMN {name} {column_type}")
+                logger.info(f"Added column {name} to document catalog")
+
+    def upsert(self, document: Dict[str, Any]):
+        """Insert or replace a document row"""
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO documents (
+                    document_id, filename, file_type, file_size, upload_time,
+                    content_length, chunk_count, processing_seconds, indexing_seconds, file_path, shard
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    document["document_id"],
+                    document.get("filename", "Unknown"),
+                    document.get("file_type", "Unknown"),
+                    document.get("file_size", 0),
+                    document.get("upload_time"),
+                    document.get("content_length", 0),
+                    document.get("chunk_count", 0),
+                    document.get("processing_seconds"),
+                    document.get("indexing_seconds"),
+                    document.get("file_path"),
+                    document.get("shard"),
+                ),
+            )
+            self._conn.commit()
+
+    def get(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """Return a single document row or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM documents WHERE document_id = ?", (document_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_many(self, document_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Return the rows for the given ids, keyed by document_id"""
+        if not document_ids:
+            return {}
+        placeholders = ",".join("?" * len(document_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM documents WHERE document_id IN ({placeholders})",
+                list(document_ids),
+            ).fetchall()
+        return {row["document_id"]: dict(row) for row in rows}
+
+    def list(self, limit: int = 50, offset: int = 0, sort_by: str = "upload_time",
+             descending: bool = True) -> List[Dict[str, Any]]:
+        """Return one page of documents in the requested order"""
+        if sort_by not in SORTABLE_COLUMNS:
+            raise ValueError(f"Cannot sort documents by '{sort_by}'")
+
+        direction = "DESC" if descending else "ASC"
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM documents ORDER BY {SORTABLE_COLUMNS[sort_by]} {direction}, "
+                f"document_id {direction} LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self) -> int:
+        """Return the number of documents in the catalog"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def delete(self, document_id: str) -> bool:
+        """Remove a document row, returning whether it existed"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM documents WHERE document_id = ?", (document_id,)
+            )
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def delete_many(self, document_ids: List[str]) -> int:
+        """Remove several document rows in one transaction"""
+        if not document_ids:
+            return 0
+        placeholders = ",".join("?" * len(document_ids))
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM documents WHERE document_id IN ({placeholders})",
+                list(document_ids),
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def set_shard(self, document_id: str, shard: Optional[int]):
+        """Record which shard now holds a document's chunks"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE documents SET shard = ? WHERE document_id = ?", (shard, document_id)
+            )
+            self._conn.commit()
+
+    def list_document_shards(self, after: str = "", limit: int = 1000) -> List[Dict[str, Any]]:
+        """Page through (document_id, shard, chunk_count) in document_id order"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT document_id, shard, chunk_count FROM documents WHERE document_id > ? "
+                "ORDER BY document_id LIMIT ?",
+                (after, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def document_ids(self) -> List[str]:
+        """Return the id of every document"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT document_id FROM documents")]
+
+    def count_chunks(self) -> int:
+        """Return the total number of chunks over all documents"""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(chunk_count), 0) FROM documents").fetchone()[0]
+
+    def count_file_references(self, file_path: str) -> int:
+        """Return how many documents were uploaded from the given stored file"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM documents WHERE file_path = ?", (file_path,)
+            ).fetchone()[0]
+
+    def clear(self):
+        """Remove every document row"""
+        with self._lock:
+            self._conn.execute("DELETE FROM documents")
+            self._conn.commit()
+
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """Read a catalog-wide setting such as the chunk schema version"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM catalog_meta WHERE key = ?", (key,)
+            ).fetchone()
+        return row["value"] if row else default
+
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO catalog_meta (key, value) VALUES (?, ?)", (key, value)
+            )
+            self._conn.commit()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def drop(self):
+        """Close the catalog and delete its database files"""
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
@@ -1,3 +1,4 @@
+import asyncio
 import fitz  # PyMuPDF
 import vosk
 import json
@@ -9,6 +10,9 @@ import logging
 from typing import Dict, Any
 from moviepy.editor import VideoFileClip
 
+from .metrics import EXTRACTED_CHARACTERS
+from .tracing import stage
+
 logger = logging.getLogger(__name__)
 
 class DocumentProcessor:
@@ -32,30 +36,36 @@ class DocumentProcessor:
         """Process different file types and extract text content"""
         try:
             if content_type == "application/pdf":
-                return await self._process_pdf(file_path)
+                extract = self._process_pdf
             elif content_type.startswith("audio/"):
-                return await self._process_audio(file_path)
+                extract = self._process_audio
             elif content_type.startswith("video/"):
-                return await self._process_video(file_path)
+                extract = self._process_video
             else:
                 raise ValueError(f"Unsupported content type: {content_type}")
+            # Parsing, conversion and transcription are blocking; keep them off the event loop
+            content = await asyncio.to_thread(extract, file_path)
+            EXTRACTED_CHARACTERS.inc(len(content), file_type=content_type)
+            return content
         except Exception as e:
             logger.error(f"Error processing file {file_path}: {e}")
             raise
     
-    async def _process_pdf(self, file_path: str) -> str:
+    def _process_pdf(self, file_path: str) -> str:
         """Extract text from PDF using PyMuPDF"""
         try:
-            doc = fitz.open(file_path)
-            text_content = []
-            
-            for page_num in range(doc.page_count):
-                page = doc[page_num]
-                text = page.get_text()
-                if text.strip():
-                    text_content.append(f"Page {page_num + 1}:\n{text}")
-            
-            doc.close()
+            with stage("upload", "extract_pdf") as span:
+                doc = fitz.open(file_path)
+                span.set_attribute("pages", doc.page_count)
+                text_content = []
+                
+                for page_num in range(doc.page_count):
+                    page = doc[page_num]
+                    text = page.get_text()
+                    if text.strip():
+                        text_content.append(f"Page {page_num + 1}:\n{text}")
+                
+                doc.close()
             
             if not text_content:
                 return "No text content found in PDF"
@@ -66,7 +76,7 @@ class DocumentProcessor:
             logger.error(f"Error processing PDF: {e}")
             raise
     
-    async def _process_audio(self, file_path: str) -> str:
+    def _process_audio(self, file_path: str) -> str:
         """Transcribe audio using Vosk"""
         if not self.vosk_model:
             filename = os.path.basename(file_path)
@@ -79,10 +89,11 @@ For now, you can upload PDF files for text-based document processing."""
         
         try:
             # Convert audio to WAV format if needed
-            wav_path = await self._convert_to_wav(file_path)
+            with stage("upload", "convert_audio"):
+                wav_path = self._convert_to_wav(file_path)
             
             # Transcribe using Vosk
-            with wave.open(wav_path, 'rb') as wf:
+            with stage("upload", "transcribe"), wave.open(wav_path, 'rb') as wf:
                 if wf.getnchannels() != 1:
                     raise Exception("Audio must be mono channel")
                 if wf.getsampwidth() != 2:
@@ -117,13 +128,13 @@ For now, you can upload PDF files for text-based document processing."""
             logger.error(f"Error transcribing audio: {e}")
             raise
     
-    async def _process_video(self, file_path: str) -> str:
+    def _process_video(self, file_path: str) -> str:
         """Extract audio from video and transcribe"""
         try:
             # Check if Vosk model is available
             if not self.vosk_model:
                 logger.warning("Vosk model not available. Extracting basic video metadata instead.")
-                return await self._extract_video_metadata(file_path)
+                return self._extract_video_metadata(file_path)
             
             logger.info(f"Starting video processing for: {file_path}")
             
@@ -142,18 +153,19 @@ For now, you can upload PDF files for text-based document processing."""
                 if video.audio is None:
                     video.close()
                     logger.warning("No audio track found in video")
-                    return await self._extract_video_metadata(file_path)
+                    return self._extract_video_metadata(file_path)
                 
                 # Write audio as WAV with specific settings for Vosk
                 audio = video.audio
-                audio.write_audiofile(
-                    temp_audio_path,
-                    fps=16000,  # 16kHz sample rate
-                    nbytes=2,   # 16-bit
-                    codec='pcm_s16le',  # PCM format
-                    verbose=False,
-                    logger=None
-                )
+                with stage("upload", "extract_audio", seconds=video.duration):
+                    audio.write_audiofile(
+                        temp_audio_path,
+                        fps=16000,  # 16kHz sample rate
+                        nbytes=2,   # 16-bit
+                        codec='pcm_s16le',  # PCM format
+                        verbose=False,
+                        logger=None
+                    )
                 
                 video.close()
                 audio.close()
@@ -161,7 +173,9 @@ For now, you can upload PDF files for text-based document processing."""
                 logger.info(f"Audio extracted successfully to: {temp_audio_path}")
                 
                 # Transcribe the audio
-                transcription = await self._transcribe_audio_file(temp_audio_path)
+                with stage("upload", "transcribe") as span:
+                    transcription = self._transcribe_audio_file(temp_audio_path)
+                    span.set_attribute("characters", len(transcription or ""))
                 
                 # Clean up
                 os.unlink(temp_audio_path)
@@ -171,19 +185,19 @@ For now, you can upload PDF files for text-based document processing."""
                     return transcription
                 else:
                     logger.warning("Transcription was empty or too short")
-                    return await self._extract_video_metadata(file_path)
+                    return self._extract_video_metadata(file_path)
                     
             except Exception as audio_error:
                 logger.error(f"Audio extraction failed: {audio_error}")
                 if os.path.exists(temp_audio_path):
                     os.unlink(temp_audio_path)
-                return await self._extract_video_metadata(file_path)
+                return self._extract_video_metadata(file_path)
             
         except Exception as e:
             logger.error(f"Error processing video: {e}")
-            return await self._extract_video_metadata(file_path)
+            return self._extract_video_metadata(file_path)
     
-    async def _extract_video_metadata(self, file_path: str) -> str:
+    def _extract_video_metadata(self, file_path: str) -> str:
         """Extract basic metadata from video when transcription is not available"""
         try:
             video = VideoFileClip(file_path)
@@ -207,7 +221,7 @@ To enable audio transcription, please download the Vosk model or use PDF files f
             logger.error(f"Error extracting video metadata: {e}")
             return f"Video file uploaded but could not be processed. Filename: {os.path.basename(file_path)}"
     
-    async def _transcribe_audio_file(self, audio_path: str) -> str:
+    def _transcribe_audio_file(self, audio_path: str) -> str:
         """Transcribe audio file directly using Vosk"""
         if not self.vosk_model:
             return "Vosk model not available"
@@ -283,7 +297,7 @@ To enable audio transcription, please download the Vosk model or use PDF files f
             logger.error(f"Error during transcription: {e}")
             return f"Transcription failed: {str(e)}"
     
-    async def _extract_audio_with_ffmpeg(self, file_path: str) -> str:
+    def _extract_audio_with_ffmpeg(self, file_path: str) -> str:
         """Extract audio using FFmpeg"""
         with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_audio:
             temp_audio_path = temp_audio.name
@@ -302,7 +316,7 @@ To enable audio transcription, please download the Vosk model or use PDF files f
         subprocess.run(cmd, check=True, capture_output=True)
         return temp_audio_path
     
-    async def _extract_audio_with_moviepy(self, file_path: str) -> str:
+    def _extract_audio_with_moviepy(self, file_path: str) -> str:
         """Extract audio using MoviePy and convert to Vosk format"""
         with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_audio:
             temp_audio_path = temp_audio.name
@@ -321,9 +335,9 @@ To enable audio transcription, please download the Vosk model or use PDF files f
         audio.close()
         
         # Now convert the audio to the proper format using a simple conversion
-        return await self._convert_moviepy_audio_to_vosk_format(temp_audio_path)
+        return self._convert_moviepy_audio_to_vosk_format(temp_audio_path)
     
-    async def _convert_moviepy_audio_to_vosk_format(self, input_path: str) -> str:
+    def _convert_moviepy_audio_to_vosk_format(self, input_path: str) -> str:
         """Convert MoviePy audio output to Vosk-compatible format"""
         import wave
         import numpy as np
@@ -368,14 +382,14 @@ To enable audio transcription, please download the Vosk model or use PDF files f
             # If conversion fails, return original file and hope for the best
             return input_path
     
-    async def _convert_to_wav(self, file_path: str) -> str:
+    def _convert_to_wav(self, file_path: str) -> str:
         """Convert audio file to WAV format using scipy and soundfile"""
         try:
             # Check if it's already a WAV file
             if file_path.lower().endswith('.wav'):
                 logger.info(f"File is already WAV format: {file_path}")
                 # Still need to check if it's mono and correct format
-                return await self._ensure_vosk_format(file_path)
+                return self._ensure_vosk_format(file_path)
             
             import tempfile
             import soundfile as sf
@@ -422,13 +436,13 @@ To enable audio transcription, please download the Vosk model or use PDF files f
             except Exception as sf_error:
                 logger.warning(f"Soundfile conversion failed: {sf_error}")
                 # Fallback to MoviePy if soundfile fails
-                return await self._convert_with_moviepy(file_path)
+                return self._convert_with_moviepy(file_path)
                 
         except Exception as e:
             logger.error(f"Error converting audio: {e}")
             raise Exception(f"Audio conversion failed: {str(e)}")
     
-    async def _ensure_vosk_format(self, wav_path: str) -> str:
+    def _ensure_vosk_format(self, wav_path: str) -> str:
         """Ensure WAV file is in correct format for Vosk (mono, 16kHz, 16-bit)"""
         try:
             import soundfile as sf
@@ -481,7 +495,7 @@ To enable audio transcription, please download the Vosk model or use PDF files f
             logger.error(f"Error ensuring Vosk format: {e}")
             return wav_path
     
-    async def _convert_with_moviepy(self, file_path: str) -> str:
+    def _convert_with_moviepy(self, file_path: str) -> str:
         """Fallback conversion using MoviePy"""
         try:
             from moviepy.editor import AudioFileClip
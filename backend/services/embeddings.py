@@ -0,0 +1,10 @@
+from chromadb.utils import embedding_functions
+
+# Chroma's built-in all-MiniLM-L6-v2 running on ONNX Runtime
+DEFAULT_EMBEDDING_MODEL = "default"
+
+def create_embedding_function(model_name: str = DEFAULT_EMBEDDING_MODEL):
+    """Embedding function for a model name; any other name is loaded with sentence-transformers"""
+    if not model_name or model_name == DEFAULT_EMBEDDING_MODEL:
+        return embedding_functions.DefaultEmbeddingFunction()
+    return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model_name)
@@ -0,0 +1,221 @@
+import asyncio
+import contextlib
+import json
+import logging
+import random
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com"
+
+# Rate limiting, request timeouts and transient server errors are worth retrying
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class GeminiError(Exception):
+    """A Gemini API call failed; ``retryable`` tells whether trying again may help"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retryable: bool = False,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+class GeminiClient:
+    """Asynchronous client for the Gemini REST API.
+
+    One pooled ``httpx.AsyncClient`` is reused for every call, so
+    connections stay open between requests. A semaphore caps the number of
+    calls in flight across the whole process, each attempt has its own
+    deadline, and retryable failures are retried with exponential backoff
+    and full jitter (honouring ``Retry-After``). ``base_url`` can point at a
+    local mock server.
+    """
+
+    def __init__(self, api_key: str, model: str = "gemini-1.5-flash", base_url: str = DEFAULT_BASE_URL,
+                 max_concurrency: int = 8, timeout: float = 60.0, connect_timeout: float = 5.0,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = None
+        self.waiting = 0
+        self.in_flight = 0
+        self.retries = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"x-goog-api-key": self.api_key},
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency)
+            )
+        return self._client
+
+    async def generate_content(self, prompt: str, usage: Optional[Dict[str, int]] = None) -> str:
+        """Generate a completion for the prompt and return its text.
+
+        ``usage``, if given, is filled with the token counts Gemini reports.
+        """
+        data = await self._call("POST", f"/v1beta/models/{self.model}:generateContent",
+                                json={"contents": [{"role": "user", "parts": [{"text": prompt}]}]})
+        if usage is not None:
+            self.update_usage(usage, data)
+        return self.response_text(data)
+
+    async def stream_content(self, prompt: str, usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+        """Yield the completion text piece by piece as the model produces it.
+
+        Failures before the first piece are retried like any other call;
+        once text has been yielded, a failure is raised to the caller.
+        ``usage`` is filled as in ``generate_content`` once the stream ends.
+        """
+        path = f"/v1beta/models/{self.model}:streamGenerateContent"
+        body = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        attempt = 0
+        while True:
+            streamed = False
+            try:
+                async with self._slot():
+                    client = self._get_client()
+                    request = client.build_request("POST", path, params={"alt": "sse"}, json=body)
+                    response = await asyncio.wait_for(client.send(request, stream=True), timeout=self.timeout)
+                    try:
+                        if response.status_code >= 400:
+                            await response.aread()
+                            raise self._error_for(response)
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = json.loads(line[len("data:"):])
+                            if usage is not None:
+                                self.update_usage(usage, data)
+                            text = self.response_text(data)
+                            if text:
+                                streamed = True
+                                yield text
+                        return
+                    finally:
+                        await response.aclose()
+            except asyncio.TimeoutError:
+                error = GeminiError(f"Gemini stream timed out after {self.timeout}s", retryable=True)
+            except httpx.TransportError as e:
+                error = GeminiError(f"Gemini connection error: {e}", retryable=True)
+            except GeminiError as e:
+                error = e
+
+            if streamed or not error.retryable or attempt >= self.max_retries:
+                raise error
+            delay = self._backoff(attempt, error.retry_after)
+            attempt += 1
+            self.retries += 1
+            logger.warning(f"{error}; retry {attempt}/{self.max_retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def get_model(self) -> Dict[str, Any]:
+        """Fetch the model description; cheap, so it doubles as a connection warm-up"""
+        return await self._call("GET", f"/v1beta/models/{self.model}")
+
+    @staticmethod
+    def response_text(data: Dict[str, Any]) -> str:
+        candidates = data.get("candidates") or []
+        if not candidates:
+            return ""
+        parts = (candidates[0].get("content") or {}).get("parts") or []
+        return "".join(part.get("text", "") for part in parts)
+
+    @staticmethod
+    def update_usage(usage: Dict[str, int], data: Dict[str, Any]):
+        # Stream chunks carry running totals, so the last one wins
+        metadata = data.get("usageMetadata") or {}
+        for key, field in (("prompt_tokens", "promptTokenCount"), ("output_tokens", "candidatesTokenCount"),
+                           ("total_tokens", "totalTokenCount")):
+            if field in metadata:
+                usage[key] = metadata[field]
+
+    @contextlib.asynccontextmanager
+    async def _slot(self):
+        """Hold one of the ``max_concurrency`` call slots, counting the callers queued for one"""
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": self.in_flight, "waiting": self.waiting, "retries": self.retries}
+
+    async def _call(self, method: str, path: str, json: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        attempt = 0
+        while True:
+            try:
+                async with self._slot():
+                    return await asyncio.wait_for(self._request(method, path, json), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                error = GeminiError(f"Gemini call timed out after {self.timeout}s", retryable=True)
+            except httpx.TransportError as e:
+                error = GeminiError(f"Gemini connection error: {e}", retryable=True)
+            except GeminiError as e:
+                error = e
+
+            if not error.retryable or attempt >= self.max_retries:
+                raise error
+            delay = self._backoff(attempt, error.retry_after)
+            if delay is None:
+                # Waiting out a long Retry-After would hold the request far past its budget
+                raise error
+            attempt += 1
+            self.retries += 1
+            logger.warning(f"{error}; retry {attempt}/{self.max_retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def _request(self, method: str, path: str, json: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        response = await self._get_client().request(method, path, json=json)
+        if response.status_code >= 400:
+            raise self._error_for(response)
+        return response.json()
+
+    @staticmethod
+    def _error_for(response: httpx.Response) -> GeminiError:
+        try:
+            message = response.json().get("error", {}).get("message", response.text)
+        except ValueError:
+            message = response.text
+        retry_after = response.headers.get("retry-after")
+        return GeminiError(
+            f"Gemini API returned {response.status_code}: {message}",
+            status_code=response.status_code,
+            retryable=response.status_code in RETRYABLE_STATUS_CODES,
+            retry_after=float(retry_after) if retry_after and retry_after.replace(".", "", 1).isdigit() else None
+        )
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> Optional[float]:
+        """Delay before the next attempt, or None if Retry-After asks for more than backoff_max"""
+        if retry_after is not None and retry_after > self.backoff_max:
+            return None
+        # Full jitter spreads out the retries of requests that failed together
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -1,53 +1,102 @@
-import google.generativeai as genai
 import logging
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 import os
+import time
+
+from .gemini_client import GeminiClient
+from .response_cache import ResponseCache, CACHE_PATH, prompt_fingerprint
+from .metrics import STAGE_SECONDS, LLM_REQUESTS, LLM_PROMPT_CHARACTERS, LLM_ANSWER_CHARACTERS
+from .tracing import TRACER, SPAN_KIND_CLIENT, stage
+from ..config import get_settings
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever _create_prompt or _format_context changes, so cached answers are not reused
+PROMPT_TEMPLATE_VERSION = "1"
+
 class LLMService:
     def __init__(self):
-        self.model = None
+        self.client = None
         self._initialize_gemini()
+        settings = get_settings()
+        self.cache = ResponseCache(
+            CACHE_PATH,
+            max_entries=settings.response_cache_max_entries,
+            ttl_seconds=settings.response_cache_ttl_seconds
+        )
+        self.cache.initialize()
     
     def _initialize_gemini(self):
-        """Initialize Gemini AI model"""
+        """Initialize the Gemini API client"""
         try:
             api_key = os.getenv("GOOGLE_API_KEY")
             if not api_key:
                 raise ValueError("GOOGLE_API_KEY environment variable not set")
             
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
-            logger.info("Gemini model initialized successfully")
+            settings = get_settings()
+            self.client = GeminiClient(
+                api_key=api_key,
+                model=settings.gemini_model,
+                base_url=settings.gemini_base_url,
+                max_concurrency=settings.llm_max_concurrency,
+                timeout=settings.llm_timeout_seconds,
+                connect_timeout=settings.llm_connect_timeout_seconds,
+                max_retries=settings.llm_max_retries,
+                backoff_base=settings.llm_backoff_base_seconds,
+                backoff_max=settings.llm_backoff_max_seconds
+            )
+            logger.info(f"Gemini client initialized for {settings.gemini_model} at {settings.gemini_base_url}")
             
         except Exception as e:
             logger.error(f"Failed to initialize Gemini model: {e}")
             raise
     
-    async def generate_answer(self, query: str, context_docs: List[Dict[str, Any]]) -> Tuple[str, float]:
-        """Generate an answer using the LLM with retrieved context"""
+    async def warm_up(self):
+        """Open the connection to the Gemini API before the first query needs it"""
+        try:
+            await self.client.get_model()
+            logger.info("Gemini client warmed up")
+        except Exception as e:
+            # The API may be briefly unreachable; queries will retry the connection
+            logger.warning(f"Gemini warm-up request failed: {e}")
+    
+    async def generate_answer(self, query: str, context_docs: List[Dict[str, Any]], history: str = "",
+                              retrieved_at: Optional[float] = None) -> Tuple[str, float]:
+        """Generate an answer using the LLM with retrieved context.
+
+        ``retrieved_at`` is when retrieval started; the answer is not cached
+        if one of its documents was deleted after that.
+        """
         try:
             if not context_docs:
                 return "I don't have enough information to answer your question.", 0.0
             
-            # Prepare context from retrieved documents
-            context_text = self._format_context(context_docs)
+            with stage("query", "prompt", context_chunks=len(context_docs)) as span:
+                # Prepare context from retrieved documents
+                context_text = self._format_context(context_docs)
+                
+                # Create prompt with context and query
+                prompt = self._create_prompt(query, context_text, history)
+                span.set_attribute("prompt_characters", len(prompt))
             
-            # Create prompt with context and query
-            prompt = self._create_prompt(query, context_text)
+            # Reuse the answer to an identical prompt, otherwise generate without blocking the event loop
+            cache_key = self._cache_key(prompt)
+            with stage("query", "cache_lookup") as span:
+                response_text = self.cache.get(cache_key)
+                span.set_attribute("hit", response_text is not None)
+            if response_text is None:
+                response_text = await self._generate(prompt, kind="generate")
+                if response_text:
+                    self.cache.put(cache_key, response_text, self._document_ids(context_docs), since=retrieved_at)
             
-            # Generate response
-            response = self.model.generate_content(prompt)
-            
-            if not response.text:
+            if not response_text:
                 return "I couldn't generate a response. Please try rephrasing your question.", 0.0
             
             # Calculate confidence based on context relevance
             confidence = self._calculate_confidence(context_docs)
             
             # Ensure the response includes source references
-            answer = self._add_source_references(response.text, context_docs)
+            answer = self._add_source_references(response_text, context_docs)
             
             return answer, confidence
             
@@ -55,6 +104,97 @@ class LLMService:
             logger.error(f"Error generating answer: {e}")
             return f"An error occurred while generating the answer: {str(e)}", 0.0
     
+    async def stream_answer(self, query: str, context_docs: List[Dict[str, Any]], history: str = "",
+                            retrieved_at: Optional[float] = None) -> AsyncIterator[str]:
+        """Stream the answer text as Gemini produces it, using the same prompt as generate_answer"""
+        if not context_docs:
+            yield "I don't have enough information to answer your question."
+            return
+        
+        with stage("query", "prompt", context_chunks=len(context_docs)) as span:
+            prompt = self._create_prompt(query, self._format_context(context_docs), history)
+            span.set_attribute("prompt_characters", len(prompt))
+        cache_key = self._cache_key(prompt)
+        with stage("query", "cache_lookup") as span:
+            cached = self.cache.get(cache_key)
+            span.set_attribute("hit", cached is not None)
+        if cached is not None:
+            yield cached
+            return
+        
+        pieces = []
+        usage = {}
+        LLM_PROMPT_CHARACTERS.inc(len(prompt))
+        start_time = time.perf_counter()
+        # The span cannot be made current across the yields, so it is recorded once the stream ends
+        start_ns = time.time_ns()
+        first_token_seconds = None
+        try:
+            async for text in self.client.stream_content(prompt, usage=usage):
+                if not pieces:
+                    first_token_seconds = time.perf_counter() - start_time
+                    STAGE_SECONDS.observe(first_token_seconds, pipeline="query", stage="first_token")
+                pieces.append(text)
+                yield text
+        except Exception as e:
+            LLM_REQUESTS.inc(kind="stream", outcome="error")
+            TRACER.record("query.stream", start_ns, time.time_ns(), span_kind=SPAN_KIND_CLIENT, error=str(e), **usage)
+            raise
+        answer_characters = sum(len(piece) for piece in pieces)
+        STAGE_SECONDS.observe(time.perf_counter() - start_time, pipeline="query", stage="stream")
+        TRACER.record("query.stream", start_ns, time.time_ns(), span_kind=SPAN_KIND_CLIENT,
+                      first_token_seconds=first_token_seconds, pieces=len(pieces),
+                      answer_characters=answer_characters, **usage)
+        LLM_REQUESTS.inc(kind="stream", outcome="ok")
+        LLM_ANSWER_CHARACTERS.inc(answer_characters)
+        if pieces:
+            self.cache.put(cache_key, "".join(pieces), self._document_ids(context_docs), since=retrieved_at)
+    
+    def confidence(self, context_docs: List[Dict[str, Any]]) -> float:
+        """Confidence score reported alongside a streamed answer"""
+        return self._calculate_confidence(context_docs) if context_docs else 0.0
+    
+    async def summarize_history(self, summary: str, turns: List[Dict[str, Any]], max_tokens: int) -> str:
+        """Fold conversation turns into the running summary of a chat session"""
+        exchanges = "\n\n".join(f"User: {turn['question']}\nAssistant: {turn['answer']}" for turn in turns)
+        prompt = f"""Update the summary of a conversation between a user and a document research assistant.
+
+Current summary:
+{summary or "(none yet)"}
+
+New exchanges:
+{exchanges}
+
+Write the updated summary in at most {max_tokens * 3 // 4} words. Keep the topics, documents, names and facts the user may refer back to; drop formatting and pleasantries. Reply with the summary only."""
+        return await self._generate(prompt, kind="summarize", pipeline="session")
+    
+    async def _generate(self, prompt: str, kind: str, pipeline: str = "query") -> str:
+        """One Gemini call, timed and counted under ``kind``"""
+        LLM_PROMPT_CHARACTERS.inc(len(prompt))
+        try:
+            with stage(pipeline, kind, span_kind=SPAN_KIND_CLIENT, prompt_characters=len(prompt)) as span:
+                usage = {}
+                text = await self.client.generate_content(prompt, usage=usage)
+                span.set_attributes(usage)
+                span.set_attribute("answer_characters", len(text))
+        except Exception:
+            LLM_REQUESTS.inc(kind=kind, outcome="error")
+            raise
+        LLM_REQUESTS.inc(kind=kind, outcome="ok")
+        LLM_ANSWER_CHARACTERS.inc(len(text))
+        return text
+    
+    def _cache_key(self, prompt: str) -> str:
+        return prompt_fingerprint(self.client.model, PROMPT_TEMPLATE_VERSION, prompt)
+    
+    def _document_ids(self, context_docs: List[Dict[str, Any]]) -> List[str]:
+        return [doc.get('metadata', {}).get('document_id', 'unknown') for doc in context_docs]
+    
+    async def close(self):
+        """Close pooled connections to the Gemini API and the response cache"""
+        await self.client.aclose()
+        self.cache.close()
+    
     def _format_context(self, context_docs: List[Dict[str, Any]]) -> str:
         """Format retrieved documents into context text with titles"""
         context_parts = []
@@ -103,8 +243,12 @@ class LLMService:
         
         return "\n\n".join(context_parts)
     
-    def _create_prompt(self, query: str, context: str) -> str:
+    def _create_prompt(self, query: str, context: str, history: str = "") -> str:
         """Create a modern, sophisticated prompt for the LLM"""
+        history_section = ""
+        if history:
+            history_section = f"💬 **CONVERSATION SO FAR** (use it to understand follow-up questions):\n{history}\n\n"
+        
         prompt = f"""You are an advanced AI research assistant with expertise in analyzing and synthesizing information from academic papers, technical documents, and multimedia content. Your responses should be modern, engaging, and professionally crafted.
 
 🎯 **CORE INSTRUCTIONS:**
@@ -124,7 +268,7 @@ class LLMService:
 🔍 **CONTEXT ANALYSIS:**
 {context}
 
-❓ **USER QUERY:** {query}
+{history_section}❓ **USER QUERY:** {query}
 
 **Instructions for Response:**
 1. **Analyze** the context thoroughly to understand the main concepts
@@ -0,0 +1,199 @@
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple, Union
+
+# Upper bounds in seconds, from a catalog lookup up to transcribing a long video
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple([labels[name] for name in self.labelnames])
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """Monotonically increasing total, one per combination of label values"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: "Histogram", labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets, plus their sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: [count per bucket (the last one is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def time(self, **labels) -> _Timer:
+        """Context manager observing the seconds spent in its block"""
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(float(bound))}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+class CallbackMetric(_Metric):
+    """Gauge or counter whose value is read from the owning component at scrape time.
+
+    ``callback`` returns a number, or a mapping from label values (a tuple
+    in ``labelnames`` order) to numbers.
+    """
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], Union[float, Dict]],
+                 kind: str = "gauge", labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.callback = callback
+
+    def samples(self):
+        value = self.callback()
+        if not isinstance(value, dict):
+            yield self.name, {}, value
+            return
+        for key, item in value.items():
+            key = key if isinstance(key, tuple) else (key,)
+            yield self.name, dict(zip(self.labelnames, key)), item
+
+class MetricsRegistry:
+    """Named metrics rendered together in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        # Re-registering a name replaces the metric, so a reloaded module does not duplicate it
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, callback: Callable[[], Union[float, Dict]],
+                 kind: str = "gauge", labelnames: Sequence[str] = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, callback, kind, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_duration_seconds", "Time spent in each stage of the upload and query pipelines",
+    ("pipeline", "stage")
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "rag_http_request_duration_seconds", "HTTP request time until the last response byte, by route",
+    ("method", "route")
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    "rag_http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+UPLOAD_BYTES = REGISTRY.counter("rag_upload_bytes_total", "Bytes of uploaded files", ("file_type",))
+EXTRACTED_CHARACTERS = REGISTRY.counter(
+    "rag_extracted_characters_total", "Characters of text extracted or transcribed from uploads", ("file_type",)
+)
+DOCUMENTS_INDEXED = REGISTRY.counter("rag_documents_indexed_total", "Documents added to the vector store")
+CHUNKS_INDEXED = REGISTRY.counter("rag_chunks_indexed_total", "Chunks embedded and added to the vector store")
+CHUNKS_RETRIEVED = REGISTRY.counter("rag_chunks_retrieved_total", "Chunks returned by vector searches")
+LLM_REQUESTS = REGISTRY.counter(
+    "rag_llm_requests_total", "Gemini calls by kind and outcome", ("kind", "outcome")
+)
+LLM_PROMPT_CHARACTERS = REGISTRY.counter("rag_llm_prompt_characters_total", "Characters of prompts sent to Gemini")
+LLM_ANSWER_CHARACTERS = REGISTRY.counter(
+    "rag_llm_answer_characters_total", "Characters of answers generated by Gemini"
+)
+ADMISSION_REJECTED = REGISTRY.counter(
+    "rag_admission_rejected_total", "Requests turned away with 429 by admission control", ("lane", "reason")
+)
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "rag_admission_wait_seconds", "Time admitted requests waited in their lane's queue", ("lane",)
+)
@@ -0,0 +1,785 @@
+import numpy as np
+import sqlite3
+import threading
+import shutil
+import logging
+import json
+import os
+from typing import List, Dict, Any, Optional
+from chromadb.utils import embedding_functions
+
+from .vector_store import VectorStore, CHUNK_SCHEMA_VERSION, DEFAULT_COLLECTION_NAME
+from .document_catalog import DocumentCatalog
+from .quantization import create_quantizer
+
+logger = logging.getLogger(__name__)
+
+# Rows upcast and scored per matrix product; small blocks keep the float32
+# scratch copy in cache, which matters more than BLAS call overhead
+SEARCH_BLOCK_ROWS = 4096
+
+# Rows an index needs before its quantizer, and its IVF partitioning per list, are trained
+QUANTIZER_TRAINING_ROWS = 10000
+IVF_TRAINING_ROWS_PER_LIST = 39
+
+class NumpyCollection:
+    """Chunk collection backed by a memory-mapped float16 matrix.
+
+    Implements the subset of the chromadb Collection API that VectorStore
+    uses (add, get, query, update, delete, count), so the rest of the store
+    works unchanged. Chunk texts and metadata live in SQLite; embeddings are
+    L2-normalised and stored row by row in ``vectors.f16``, and a query is an
+    exact top-k over blocked matrix-vector products. With ``ivf_lists`` set,
+    rows are partitioned by a spherical k-means and only the ``ivf_probes``
+    closest partitions are scanned.
+
+    The quantizer and the partitioning are trained on a background thread
+    once enough rows are in, or by ``train``/``persist``; until then
+    searches scan the full vectors.
+
+    With ``quantization`` set to ``int8`` or ``pq``, only compact codes are
+    held in RAM for the first pass; full-precision float32 vectors stay on
+    disk (``vectors.f32``) and are read back just for the top
+    ``k * rescore_factor`` candidates.
+    """
+
+    def __init__(self, directory: str, embedding_function, ivf_lists: int = 0, ivf_probes: int = 8,
+                 quantization: str = "none", pq_subspaces: int = 48, rescore_factor: int = 8):
+        self.directory = directory
+        self.embedding_function = embedding_function
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = ivf_probes
+        self.quantizer = create_quantizer(quantization, pq_subspaces=pq_subspaces)
+        self.pq_subspaces = pq_subspaces
+        self.rescore_factor = rescore_factor
+        self.dtype = np.float16 if self.quantizer is None else np.float32
+        self.vectors_path = os.path.join(directory, "vectors.f16" if self.quantizer is None else "vectors.f32")
+        self.ivf_path = os.path.join(directory, "ivf.npz")
+        self.quantizer_path = os.path.join(directory, "quantizer.npz")
+        self.codes_path = os.path.join(directory, "codes.npy")
+        self.compact_path = self.vectors_path + ".compact"
+        self._lock = threading.RLock()
+        self._training_lock = threading.RLock()
+        self._training_thread = None
+        # Bumped whenever rows are renumbered or their vectors rewritten
+        self._generation = 0
+        self._conn = None
+        self._vectors = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._dim = 0
+        self._capacity = 0
+        self._size = 0
+        self._centroids = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._list_rows = []
+        self._codes = None
+
+    def open(self):
+        """Open or create the on-disk index"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(self.directory, "chunks.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                chunk_id TEXT UNIQUE NOT NULL,
+                document_id TEXT,
+                chunk_index INTEGER,
+                content TEXT,
+                metadata TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_document_id ON chunks(document_id);
+            CREATE TABLE IF NOT EXISTS index_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self._conn.commit()
+
+        self._dim = int(self._get_meta("dim", "0"))
+        self._capacity = int(self._get_meta("capacity", "0"))
+        self._check_format()
+        # Stored codes and list assignments are numbered by the rows before a compaction
+        rows_moved = self._finish_compaction()
+        max_row = self._conn.execute("SELECT MAX(row) FROM chunks").fetchone()[0]
+        self._size = 0 if max_row is None else max_row + 1
+
+        if self._capacity and os.path.exists(self.vectors_path):
+            self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r+",
+                                      shape=(self._capacity, self._dim))
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        rows = np.fromiter((row for (row,) in self._conn.execute("SELECT row FROM chunks")), dtype=np.int64)
+        self._alive[rows] = True
+
+        if self.ivf_lists and os.path.exists(self.ivf_path):
+            data = np.load(self.ivf_path)
+            self._centroids = data["centroids"]
+            self._assignments = np.full(self._capacity, -1, dtype=np.int32)
+            assignments = data["assignments"] if not rows_moved else self._assignments[:0]
+            self._assignments[:len(assignments)] = assignments[:self._capacity]
+            self._assign_rows(np.flatnonzero(self._alive[:self._size] & (self._assignments[:self._size] < 0)))
+            self._rebuild_lists()
+
+        if self.quantizer is not None and os.path.exists(self.quantizer_path):
+            self.quantizer.load_state(dict(np.load(self.quantizer_path)))
+            self._codes = np.zeros((self._capacity, self.quantizer.code_size(self._dim)),
+                                   dtype=np.uint8 if self.quantizer.kind == "pq" else np.int8)
+            stored = np.load(self.codes_path) if os.path.exists(self.codes_path) and not rows_moved \
+                else self._codes[:0]
+            stored = stored[:self._size]
+            self._codes[:len(stored)] = stored
+            # Rows added after the last persist are re-encoded from disk
+            self._encode_rows(np.arange(len(stored), self._size))
+
+        logger.info(f"Opened NumPy index at {self.directory} with {self.count()} chunks")
+
+    def _check_format(self):
+        """Refuse to open vectors written under another NUMPY_QUANTIZATION setting.
+
+        The setting decides the file name and dtype of the stored vectors
+        and the kind of quantizer state, so an index can only be read with
+        the setting it was built with. Indexes from before the format was
+        recorded are recognised by their files.
+        """
+        quantization = self.quantizer.kind if self.quantizer is not None else "none"
+        storage = np.dtype(self.dtype).name
+        if self._capacity:
+            stored_storage = self._get_meta("storage", "") or self._detect_storage()
+            stored_quantization = self._get_meta("quantization", "") or self._detect_quantization(stored_storage)
+            if stored_storage != storage or stored_quantization not in ("", quantization):
+                # An untrained float32 index reads the same under either quantizer
+                built_with = stored_quantization or "int8"
+                raise ValueError(
+                    f"NumPy index at {self.directory} was built with NUMPY_QUANTIZATION={built_with} "
+                    f"({stored_storage} vectors), not {quantization}. Set NUMPY_QUANTIZATION back, or rebuild "
+                    f"the collection into a new version with python -m backend.tools.reembed_collection "
+                    f"--source-quantization {built_with} --activate"
+                )
+        self._set_meta("storage", storage)
+        self._set_meta("quantization", quantization)
+
+    def _detect_storage(self) -> str:
+        if os.path.exists(os.path.join(self.directory, "vectors.f16")):
+            return np.dtype(np.float16).name
+        if os.path.exists(os.path.join(self.directory, "vectors.f32")):
+            return np.dtype(np.float32).name
+        return np.dtype(self.dtype).name
+
+    def _detect_quantization(self, storage: str) -> str:
+        """The quantizer kind of an index without recorded format, or "" if no quantizer was trained yet"""
+        if storage == np.dtype(np.float16).name:
+            return "none"
+        if os.path.exists(self.quantizer_path):
+            return "pq" if "codebooks" in np.load(self.quantizer_path).files else "int8"
+        return ""
+
+    def close(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._vectors = None
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def drop(self):
+        """Delete the index from disk"""
+        self.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def count(self) -> int:
+        return int(self._alive[:self._size].sum())
+
+    # ------------------------------------------------------------------
+    # Chroma-compatible API
+    # ------------------------------------------------------------------
+
+    def add(self, ids: List[str], documents: Optional[List[str]] = None,
+            metadatas: Optional[List[Dict[str, Any]]] = None, embeddings=None):
+        if embeddings is None:
+            embeddings = self.embedding_function(documents)
+        vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [{}] * len(ids)
+
+        with self._lock:
+            if not self._dim:
+                self._dim = vectors.shape[1]
+                self._set_meta("dim", str(self._dim))
+            start = self._size
+            rows = np.arange(start, start + len(ids))
+            self._ensure_capacity(start + len(ids))
+
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO chunks (row, chunk_id, document_id, chunk_index, content, metadata) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (int(row), chunk_id, (metadata or {}).get("document_id"),
+                         (metadata or {}).get("chunk_index"), document, json.dumps(metadata or {}))
+                        for row, chunk_id, document, metadata in zip(rows, ids, documents, metadatas)
+                    ],
+                )
+            self._vectors[start:start + len(ids)] = vectors
+            self._vectors.flush()
+            self._alive[rows] = True
+            self._size = start + len(ids)
+
+            if self._codes is not None:
+                self._codes[rows] = self.quantizer.encode(vectors)
+
+            if self._centroids is not None:
+                self._assign_rows(rows)
+                for label in np.unique(self._assignments[rows]):
+                    new_rows = rows[self._assignments[rows] == label]
+                    self._list_rows[label] = np.concatenate([self._list_rows[label], new_rows])
+
+        if self.training_due():
+            self._train_in_background()
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Optional[List[str]] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None) -> Dict[str, Any]:
+        include = ["metadatas", "documents"] if include is None else include
+        clauses, params = self._where_sql(ids, where)
+        sql = "SELECT row, chunk_id, content, metadata FROM chunks"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY row"
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params += [-1 if limit is None else limit, offset or 0]
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            result = {"ids": [chunk_id for _, chunk_id, _, _ in rows]}
+            if "documents" in include:
+                result["documents"] = [content for _, _, content, _ in rows]
+            if "metadatas" in include:
+                result["metadatas"] = [json.loads(metadata) for _, _, _, metadata in rows]
+            if "embeddings" in include:
+                row_numbers = np.array([row for row, _, _, _ in rows], dtype=np.int64)
+                result["embeddings"] = self._vectors[row_numbers].astype(np.float32) if len(rows) else []
+        return result
+
+    def query(self, query_texts: Optional[List[str]] = None, query_embeddings=None,
+              n_results: int = 10, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        include = ["metadatas", "documents", "distances"] if include is None else include
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(query_texts)
+        queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32))
+
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query in queries:
+            # A compaction in between would renumber the rows before they are fetched
+            with self._lock:
+                rows, scores = self.search_rows(query, n_results)
+                fetched = self._fetch_rows(rows)
+            result["ids"].append([item[0] for item in fetched])
+            result["documents"].append([item[1] for item in fetched])
+            result["metadatas"].append([json.loads(item[2]) for item in fetched])
+            # Cosine distance, so VectorStore's 1 - distance is the cosine similarity
+            result["distances"].append([float(1.0 - score) for score in scores])
+        return result
+
+    def update(self, ids: List[str], metadatas: Optional[List[Dict[str, Any]]] = None,
+               documents: Optional[List[str]] = None, embeddings=None):
+        with self._lock:
+            current = self.get(ids=ids, include=["metadatas"])
+            merged = dict(zip(current["ids"], current["metadatas"]))
+            with self._conn:
+                for i, chunk_id in enumerate(ids):
+                    if chunk_id not in merged:
+                        continue
+                    if metadatas is not None:
+                        metadata = merged[chunk_id]
+                        for key, value in metadatas[i].items():
+                            if value is None:
+                                metadata.pop(key, None)
+                            else:
+                                metadata[key] = value
+                        self._conn.execute(
+                            "UPDATE chunks SET metadata = ?, document_id = ?, chunk_index = ? WHERE chunk_id = ?",
+                            (json.dumps(metadata), metadata.get("document_id"), metadata.get("chunk_index"), chunk_id),
+                        )
+                    if documents is not None:
+                        self._conn.execute("UPDATE chunks SET content = ? WHERE chunk_id = ?",
+                                           (documents[i], chunk_id))
+
+            if documents is not None and embeddings is None:
+                embeddings = self.embedding_function(documents)
+            if embeddings is not None:
+                vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+                for chunk_id, vector in zip(ids, vectors):
+                    row = self._conn.execute("SELECT row FROM chunks WHERE chunk_id = ?", (chunk_id,)).fetchone()
+                    if row:
+                        self._vectors[row[0]] = vector
+                        if self._codes is not None:
+                            self._codes[row[0]] = self.quantizer.encode(vector[None, :])[0]
+                self._vectors.flush()
+                self._generation += 1
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        clauses, params = self._where_sql(ids, where)
+        if not clauses:
+            return
+        with self._lock:
+            with self._conn:
+                rows = [row for (row,) in self._conn.execute(
+                    "SELECT row FROM chunks WHERE " + " AND ".join(clauses), params)]
+                self._conn.execute("DELETE FROM chunks WHERE " + " AND ".join(clauses), params)
+            self._alive[rows] = False
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def search_rows(self, query: np.ndarray, k: int):
+        """Return (rows, scores) of the k best rows for a normalised query, best first"""
+        with self._lock:
+            if not self._size or k <= 0:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+            # Quantized codes only shortlist candidates; the final order comes
+            # from full-precision vectors
+            quantized = self._codes is not None
+            shortlist = k * self.rescore_factor if quantized else k
+
+            if self._centroids is not None:
+                probes = min(self.ivf_probes, len(self._centroids))
+                nearest = np.argpartition(-(self._centroids @ query), probes - 1)[:probes]
+                candidates = np.sort(np.concatenate([self._list_rows[c] for c in nearest]))
+                candidates = candidates[self._alive[candidates]]
+                rows, scores = self._top_k(candidates, self._first_pass_scores(candidates, query), shortlist)
+            else:
+                best_rows = np.zeros(0, dtype=np.int64)
+                best_scores = np.zeros(0, dtype=np.float32)
+                for start in range(0, self._size, SEARCH_BLOCK_ROWS):
+                    end = min(start + SEARCH_BLOCK_ROWS, self._size)
+                    scores = self._first_pass_scores(slice(start, end), query)
+                    scores[~self._alive[start:end]] = -np.inf
+                    rows, scores = self._top_k(np.arange(start, end), scores, shortlist)
+                    best_rows = np.concatenate([best_rows, rows])
+                    best_scores = np.concatenate([best_scores, scores])
+                rows, scores = self._top_k(best_rows, best_scores, shortlist)
+
+            if quantized and len(rows):
+                order = np.argsort(rows)
+                rows = rows[order]
+                scores = self._vectors[rows].astype(np.float32) @ query
+            return self._top_k(rows, scores, k)
+
+    def _first_pass_scores(self, rows, query: np.ndarray) -> np.ndarray:
+        if self._codes is not None:
+            return self.quantizer.score(self._codes[rows], query)
+        return self._vectors[rows].astype(np.float32) @ query
+
+    @staticmethod
+    def _top_k(rows: np.ndarray, scores: np.ndarray, k: int):
+        keep = np.isfinite(scores)
+        rows, scores = rows[keep], scores[keep]
+        if len(scores) > k:
+            part = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[part], scores[part]
+        order = np.argsort(-scores, kind="stable")
+        return rows[order], scores[order]
+
+    def training_due(self) -> bool:
+        """Whether the quantizer or the IVF partitioning has enough rows to be trained"""
+        return self._quantizer_due() or self._ivf_due()
+
+    def _quantizer_due(self, force: bool = False) -> bool:
+        return (self.quantizer is not None and self._codes is None
+                and (force or self.count() >= QUANTIZER_TRAINING_ROWS))
+
+    def _ivf_due(self, force: bool = False) -> bool:
+        return (bool(self.ivf_lists) and self._centroids is None
+                and (force or self.count() >= self.ivf_lists * IVF_TRAINING_ROWS_PER_LIST))
+
+    def train(self, force: bool = False):
+        """Train the quantizer and the IVF partitioning once they are due, or now with ``force``"""
+        with self._training_lock:
+            if self._quantizer_due(force):
+                self.train_quantizer()
+            if self._ivf_due(force):
+                self.train_ivf()
+
+    def _train_in_background(self):
+        with self._lock:
+            if self._training_thread is not None and self._training_thread.is_alive():
+                return
+            self._training_thread = threading.Thread(target=self._train_logged, name="numpy-index-training",
+                                                     daemon=True)
+            self._training_thread.start()
+
+    def _train_logged(self):
+        try:
+            self.train()
+        except Exception as e:
+            logger.error(f"Error training NumPy index at {self.directory}: {e}")
+
+    def train_ivf(self, sample_size: int = 100000, iterations: int = 10):
+        """Partition the index with spherical k-means over a sample of rows.
+
+        Clustering and assigning the existing rows run outside the index
+        lock, so searches keep scanning the whole index until the lists are
+        swapped in.
+        """
+        with self._training_lock:
+            with self._lock:
+                alive_rows = np.flatnonzero(self._alive[:self._size])
+                lists = min(self.ivf_lists, len(alive_rows))
+                if lists == 0:
+                    return
+                rng = np.random.default_rng(0)
+                sample = rng.choice(alive_rows, size=min(sample_size, len(alive_rows)), replace=False)
+                data = self._vectors[np.sort(sample)].astype(np.float32)
+                vectors, size, generation = self._vectors, self._size, self._generation
+            centroids = data[rng.choice(len(data), size=lists, replace=False)]
+
+            for _ in range(iterations):
+                labels = np.argmax(data @ centroids.T, axis=1)
+                order = np.argsort(labels, kind="stable")
+                present, starts = np.unique(labels[order], return_index=True)
+                # Empty lists keep their previous centroid
+                sums = centroids.copy()
+                sums[present] = np.add.reduceat(data[order], starts)
+                centroids = self._normalize(sums)
+            labels = self._nearest_lists(vectors, centroids, alive_rows)
+
+            with self._lock:
+                if self._conn is None:
+                    return  # Closed meanwhile
+                if self._generation != generation:
+                    # Rows were renumbered or rewritten meanwhile; assign them all again below
+                    alive_rows, labels, size = alive_rows[:0], labels[:0], 0
+                self._centroids = centroids
+                self._assignments = np.full(self._capacity, -1, dtype=np.int32)
+                self._assignments[alive_rows] = labels
+                # Rows added while the lists were trained
+                self._assign_rows(size + np.flatnonzero(self._alive[size:self._size]))
+                self._rebuild_lists()
+                self._save_ivf()
+            logger.info(f"Trained IVF index with {lists} lists over {len(alive_rows)} rows")
+
+    def train_quantizer(self, sample_size: int = 100000):
+        """Fit a quantizer on a sample of rows and encode the whole index.
+
+        Fitting and encoding run outside the index lock, so searches keep
+        scanning the full vectors until the codes are swapped in.
+        """
+        with self._training_lock:
+            with self._lock:
+                alive_rows = np.flatnonzero(self._alive[:self._size])
+                if not len(alive_rows):
+                    return
+                rng = np.random.default_rng(0)
+                sample = rng.choice(alive_rows, size=min(sample_size, len(alive_rows)), replace=False)
+                data = self._vectors[np.sort(sample)].astype(np.float32)
+                vectors, size, generation = self._vectors, self._size, self._generation
+            quantizer = create_quantizer(self.quantizer.kind, pq_subspaces=self.pq_subspaces)
+            quantizer.fit(data)
+            codes = self._encode(quantizer, vectors, np.arange(size))
+
+            with self._lock:
+                if self._conn is None:
+                    return  # Closed meanwhile
+                if self._generation != generation:
+                    codes, size = codes[:0], 0
+                self.quantizer = quantizer
+                self._codes = np.zeros((self._capacity, quantizer.code_size(self._dim)), dtype=codes.dtype)
+                self._codes[:size] = codes
+                # Rows added while the quantizer was trained
+                self._encode_rows(np.arange(size, self._size))
+                self._save_quantizer()
+            logger.info(f"Trained {quantizer.kind} quantizer over {len(sample)} rows")
+
+    def _encode_rows(self, rows: np.ndarray):
+        self._codes[rows] = self._encode(self.quantizer, self._vectors, rows)
+
+    def _encode(self, quantizer, vectors, rows: np.ndarray) -> np.ndarray:
+        codes = np.zeros((len(rows), quantizer.code_size(self._dim)),
+                         dtype=np.uint8 if quantizer.kind == "pq" else np.int8)
+        for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+            block = rows[start:start + SEARCH_BLOCK_ROWS]
+            codes[start:start + len(block)] = quantizer.encode(vectors[block].astype(np.float32))
+        return codes
+
+    def _save_quantizer(self):
+        if self._codes is not None:
+            np.savez(self.quantizer_path, **self.quantizer.state())
+            np.save(self.codes_path, self._codes[:self._size])
+
+    def touch(self) -> int:
+        """Fault the memory-mapped vectors scanned by the first pass into the page cache.
+
+        Quantized indexes only scan the in-RAM codes, so their on-disk
+        vectors are left alone. Returns the number of bytes paged in.
+        """
+        with self._lock:
+            if self._vectors is None or self._codes is not None:
+                return 0
+            # One element per row is enough to hit every page of the matrix
+            for start in range(0, self._size, SEARCH_BLOCK_ROWS):
+                np.asarray(self._vectors[start:start + SEARCH_BLOCK_ROWS, 0]).sum()
+            return self._size * self._dim * np.dtype(self.dtype).itemsize
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Bytes held in RAM for the first-pass search versus the on-disk vectors"""
+        resident = self._alive.nbytes + self._assignments.nbytes
+        if self._codes is not None:
+            resident += self._codes[:self._size].nbytes
+        else:
+            resident += self._size * self._dim * np.dtype(self.dtype).itemsize
+        return {
+            "resident_bytes": int(resident),
+            "on_disk_vector_bytes": int(self._size * self._dim * np.dtype(self.dtype).itemsize),
+            "float32_equivalent_bytes": int(self._size * self._dim * 4),
+        }
+
+    def _assign_rows(self, rows: np.ndarray):
+        self._assignments[rows] = self._nearest_lists(self._vectors, self._centroids, rows)
+
+    @staticmethod
+    def _nearest_lists(vectors, centroids: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        labels = np.zeros(len(rows), dtype=np.int32)
+        for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+            block = rows[start:start + SEARCH_BLOCK_ROWS]
+            scores = vectors[block].astype(np.float32) @ centroids.T
+            labels[start:start + len(block)] = np.argmax(scores, axis=1)
+        return labels
+
+    def _rebuild_lists(self):
+        rows = np.flatnonzero(self._assignments[:self._size] >= 0)
+        labels = self._assignments[rows]
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(len(self._centroids) + 1))
+        self._list_rows = [rows[order[bounds[i]:bounds[i + 1]]] for i in range(len(self._centroids))]
+
+    def _save_ivf(self):
+        if self._centroids is not None:
+            np.savez(self.ivf_path, centroids=self._centroids, assignments=self._assignments[:self._size])
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def persist(self, compact_threshold: float = 0.25):
+        """Train what is due, then flush to disk, compacting first if enough rows have been deleted"""
+        if self.training_due():
+            self.train()
+        with self._lock:
+            if self._size and 1 - self.count() / self._size > compact_threshold:
+                self.compact()
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._save_ivf()
+            self._save_quantizer()
+
+    def compact(self):
+        """Rewrite the matrix without deleted rows.
+
+        The live rows are copied into a new file, the row renumbering is
+        committed together with a marker, and only then does the new file
+        replace the old one. A crash at any point leaves either the old
+        matrix with the old numbering or a committed compaction that
+        ``open`` finishes.
+        """
+        with self._lock:
+            alive_rows = np.flatnonzero(self._alive[:self._size])
+            with open(self.compact_path, "wb") as f:
+                f.truncate(self._capacity * self._dim * np.dtype(self.dtype).itemsize)
+            vectors = np.memmap(self.compact_path, dtype=self.dtype, mode="r+", shape=(self._capacity, self._dim))
+            for start in range(0, len(alive_rows), SEARCH_BLOCK_ROWS):
+                block = alive_rows[start:start + SEARCH_BLOCK_ROWS]
+                vectors[start:start + len(block)] = self._vectors[block]
+            vectors.flush()
+            with open(self.compact_path, "rb+") as f:
+                os.fsync(f.fileno())
+            with self._conn:
+                self._conn.executemany(
+                    "UPDATE chunks SET row = ? WHERE row = ?",
+                    [(new, int(old)) for new, old in enumerate(alive_rows) if new != old],
+                )
+                self._conn.execute("INSERT OR REPLACE INTO index_meta (key, value) VALUES (?, ?)",
+                                   ("pending_compaction", "1"))
+            # The mapping follows the file across the rename
+            self._vectors = vectors
+            os.replace(self.compact_path, self.vectors_path)
+            self._set_meta("pending_compaction", "")
+            if self._centroids is not None:
+                self._assignments[:len(alive_rows)] = self._assignments[alive_rows]
+                self._assignments[len(alive_rows):] = -1
+            if self._codes is not None:
+                self._codes[:len(alive_rows)] = self._codes[alive_rows]
+            self._alive[:] = False
+            self._alive[:len(alive_rows)] = True
+            self._size = len(alive_rows)
+            self._generation += 1
+            if self._centroids is not None:
+                self._rebuild_lists()
+            logger.info(f"Compacted NumPy index to {self._size} rows")
+
+    def _finish_compaction(self) -> bool:
+        """Complete or discard a compaction a crash interrupted; True if rows were renumbered"""
+        if self._get_meta("pending_compaction", ""):
+            # The renumbering is committed, so the compacted matrix is the valid one
+            if os.path.exists(self.compact_path):
+                os.replace(self.compact_path, self.vectors_path)
+            self._set_meta("pending_compaction", "")
+            logger.warning(f"Finished an interrupted compaction of the NumPy index at {self.directory}")
+            return True
+        if os.path.exists(self.compact_path):
+            os.unlink(self.compact_path)
+        return False
+
+    def _ensure_capacity(self, needed: int):
+        if needed <= self._capacity:
+            return
+        capacity = max(needed, self._capacity * 2, 1024)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(capacity * self._dim * np.dtype(self.dtype).itemsize)
+        self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r+", shape=(capacity, self._dim))
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - self._capacity, dtype=bool)])
+        if self._centroids is not None:
+            self._assignments = np.concatenate(
+                [self._assignments, np.full(capacity - self._capacity, -1, dtype=np.int32)])
+        if self._codes is not None:
+            self._codes = np.concatenate(
+                [self._codes, np.zeros((capacity - self._capacity, self._codes.shape[1]), dtype=self._codes.dtype)])
+        self._capacity = capacity
+        self._set_meta("capacity", str(capacity))
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def _fetch_rows(self, rows: np.ndarray):
+        if not len(rows):
+            return []
+        placeholders = ",".join("?" * len(rows))
+        fetched = {
+            row: (chunk_id, content, metadata)
+            for row, chunk_id, content, metadata in self._conn.execute(
+                f"SELECT row, chunk_id, content, metadata FROM chunks WHERE row IN ({placeholders})",
+                [int(row) for row in rows],
+            )
+        }
+        return [fetched[int(row)] for row in rows if int(row) in fetched]
+
+    @staticmethod
+    def _where_sql(ids: Optional[List[str]], where: Optional[Dict[str, Any]]):
+        clauses, params = [], []
+        if ids is not None:
+            clauses.append(f"chunk_id IN ({','.join('?' * len(ids))})")
+            params.extend(ids)
+        for key, condition in (where or {}).items():
+            column = key if key in ("document_id", "chunk_index") else f"json_extract(metadata, '$.{key}')"
+            if isinstance(condition, dict) and "$in" in condition:
+                values = list(condition["$in"])
+                clauses.append(f"{column} IN ({','.join('?' * len(values))})")
+                params.extend(values)
+            elif isinstance(condition, dict) and "$eq" in condition:
+                clauses.append(f"{column} = ?")
+                params.append(condition["$eq"])
+            elif isinstance(condition, dict):
+                raise ValueError(f"Unsupported where operator for {key}: {condition}")
+            else:
+                clauses.append(f"{column} = ?")
+                params.append(condition)
+        return clauses, params
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.atleast_2d(vectors)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _get_meta(self, key: str, default: str) -> str:
+        row = self._conn.execute("SELECT value FROM index_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key: str, value: str):
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO index_meta (key, value) VALUES (?, ?)", (key, value))
+
+
+class NumpyVectorStore(VectorStore):
+    """VectorStore that searches an in-process NumPy index instead of Chroma"""
+
+    def __init__(self, embedding_function=None, ivf_lists: int = 0, ivf_probes: int = 8,
+                 quantization: str = "none", pq_subspaces: int = 48, rescore_factor: int = 8,
+                 collection_name: str = DEFAULT_COLLECTION_NAME, catalog: Optional[DocumentCatalog] = None,
+                 shard_id: Optional[int] = None):
+        super().__init__(embedding_function=embedding_function, collection_name=collection_name,
+                         catalog=catalog, shard_id=shard_id)
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = ivf_probes
+        self.quantization = quantization
+        self.pq_subspaces = pq_subspaces
+        self.rescore_factor = rescore_factor
+        self.index_directory = os.path.join(self.persist_directory, "numpy_index", self.collection_name)
+        self.catalog = catalog or DocumentCatalog(os.path.join(self.index_directory, "document_catalog.sqlite3"))
+
+    async def initialize(self):
+        """Open the NumPy index and the document catalog"""
+        try:
+            self._resolve_embedding_function()
+            if self.embedding_function is None:
+                self.embedding_function = embedding_functions.DefaultEmbeddingFunction()
+            self.collection = self._open_collection()
+            self._initialize_catalog()
+        except Exception as e:
+            logger.error(f"Failed to initialize NumPy vector index: {e}")
+            raise
+
+    def _open_collection(self) -> NumpyCollection:
+        collection = NumpyCollection(
+            directory=os.path.join(self.index_directory, "index"),
+            embedding_function=self.embedding_function,
+            ivf_lists=self.ivf_lists,
+            ivf_probes=self.ivf_probes,
+            quantization=self.quantization,
+            pq_subspaces=self.pq_subspaces,
+            rescore_factor=self.rescore_factor
+        )
+        collection.open()
+        return collection
+
+    def persist(self):
+        """Flush the index to disk, compacting away deleted rows"""
+        self.collection.persist()
+
+    def _warm_up(self, query_embeddings=None):
+        super()._warm_up(query_embeddings)
+        paged = self.collection.touch()
+        logger.info(f"Paged in {paged / 2**20:.1f} MiB of vectors for {self.collection_name}")
+
+    def close(self):
+        """Persist and unmap the index"""
+        self.collection.persist()
+        self.collection.close()
+        self.catalog.close()
+
+    def drop(self):
+        """Delete the index and its catalog for good"""
+        self.collection.drop()
+        self.catalog.drop()
+        shutil.rmtree(self.index_directory, ignore_errors=True)
+        logger.info(f"Dropped NumPy index {self.collection_name}")
+
+    def reset(self):
+        """Drop the index and start empty"""
+        try:
+            self.collection.drop()
+            self.collection = self._open_collection()
+            self.catalog.clear()
+            self.catalog.set_meta("chunk_schema_version", CHUNK_SCHEMA_VERSION)
+            logger.info("NumPy vector index reset successfully")
+        except Exception as e:
+            logger.error(f"Error resetting NumPy vector index: {str(e)}")
+            raise
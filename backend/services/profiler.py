@@ -0,0 +1,137 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Frame labels are shortened by stripping the longest matching import root
+_PATH_PREFIXES = sorted({path for path in [os.getcwd(), *sys.path, *sysconfig.get_paths().values()] if path},
+                        key=len, reverse=True)
+
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+_labels: Dict[Any, str] = {}
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        for prefix in _PATH_PREFIXES:
+            if filename.startswith(prefix):
+                filename = filename[len(prefix):].lstrip(os.sep)
+                break
+        # Semicolons separate frames in the folded format
+        label = _labels[code] = f"{code.co_qualname} ({filename}:{code.co_firstlineno})".replace(";", ",")
+    return label
+
+def _await_chain(coro) -> List:
+    """Frames of a suspended coroutine and everything it is awaiting, outermost first"""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "ag_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "ag_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+class RequestProfile:
+    """Wall-clock sampling profile of one request, written as folded stacks for flame graphs.
+
+    A background thread samples the event loop thread every ``interval``
+    seconds. A sample counts for the request only if the loop is running
+    one of the request's tasks (the task handling it, and tasks it started
+    while profiled); tasks that are suspended are sampled at the ``await``
+    they are waiting on, so time spent waiting for Gemini shows up too.
+    Other requests running concurrently are left out. Work offloaded to
+    thread pools appears as the frame awaiting it.
+    """
+
+    def __init__(self, profile_id: str, directory: str, interval: float, details: Dict[str, Any]):
+        self.profile_id = profile_id
+        self.directory = directory
+        self.interval = interval
+        self.details = details
+        self.tasks = []
+        self.counts = Counter()
+        self.samples = 0
+        self._loop_thread = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profile-{profile_id}", daemon=True)
+
+    def start(self):
+        self.tasks.append(asyncio.current_task())
+        _install_task_factory(asyncio.get_running_loop())
+        self._token = _current_profile.set(self)
+        self._start_time = time.perf_counter()
+        self._thread.start()
+
+    def stop(self, **details):
+        """Stop sampling; the sampler thread writes the files, so this never waits on disk"""
+        _current_profile.reset(self._token)
+        self.details.update(details, duration_seconds=round(time.perf_counter() - self._start_time, 6))
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+        try:
+            self._write()
+        except Exception as e:
+            logger.error(f"Error writing profile {self.profile_id}: {e}")
+
+    def _sample(self):
+        frame = sys._current_frames().get(self._loop_thread)
+        running = []
+        while frame is not None:
+            running.append(frame)
+            frame = frame.f_back
+        on_loop = {id(frame): position for position, frame in enumerate(running)}
+        self.samples += 1
+        for task in list(self.tasks):
+            if task.done():
+                continue
+            chain = _await_chain(task.get_coro())
+            if not chain:
+                continue
+            position = on_loop.get(id(chain[0]))
+            if position is not None:
+                # Running right now: the real stack, down to whatever synchronous call it is in
+                stack = running[position::-1]
+            else:
+                stack = chain
+            self.counts[";".join(_label(frame.f_code) for frame in stack)] += 1
+
+    def _write(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{self.profile_id}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(self.directory, f"{self.profile_id}.json"), "w", encoding="utf-8") as f:
+            json.dump({**self.details, "profile_id": self.profile_id, "interval_seconds": self.interval,
+                       "samples": self.samples, "tasks": len(self.tasks)}, f, indent=2)
+        logger.info(f"Wrote profile {self.profile_id} with {self.samples} samples to {path}")
+
+def _install_task_factory(loop: asyncio.AbstractEventLoop):
+    """Record tasks started while a profiled request is handled as part of its profile"""
+    previous = loop.get_task_factory()
+    if getattr(previous, "_records_profiled_tasks", False):
+        return
+
+    def task_factory(loop, coro, **kwargs):
+        task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.tasks.append(task)
+        return task
+
+    task_factory._records_profiled_tasks = True
+    loop.set_task_factory(task_factory)
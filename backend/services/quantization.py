@@ -0,0 +1,130 @@
+import numpy as np
+import logging
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+class ScalarQuantizer:
+    """Per-dimension int8 scalar quantization (4x smaller than float32).
+
+    Each dimension is mapped linearly from its observed [min, max] range onto
+    the 256 int8 levels. Inner products are computed against the decoded
+    values without materialising them: q . x ~= q . offset + (q * scale) . code
+    """
+
+    kind = "int8"
+
+    def __init__(self):
+        self.offset = None
+        self.scale = None
+
+    @property
+    def trained(self) -> bool:
+        return self.offset is not None
+
+    def code_size(self, dim: int) -> int:
+        return dim
+
+    def fit(self, data: np.ndarray):
+        low = data.min(axis=0)
+        high = data.max(axis=0)
+        self.scale = np.maximum(high - low, 1e-6).astype(np.float32) / 255.0
+        self.offset = (low + 128 * self.scale).astype(np.float32)
+
+    def encode(self, data: np.ndarray) -> np.ndarray:
+        codes = np.rint((data - self.offset) / self.scale)
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) @ (query * self.scale) + float(query @ self.offset)
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"offset": self.offset, "scale": self.scale}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        self.offset = state["offset"]
+        self.scale = state["scale"]
+
+
+class ProductQuantizer:
+    """Product quantization with 256 centroids per subspace (one byte per subspace).
+
+    Vectors are split into ``subspaces`` equal slices and each slice is
+    replaced by the id of its nearest sub-centroid. Queries are scored with
+    asymmetric distance computation: a per-query lookup table of sub-centroid
+    inner products is summed over each row's codes.
+    """
+
+    kind = "pq"
+
+    def __init__(self, subspaces: int = 48, iterations: int = 15):
+        self.subspaces = subspaces
+        self.iterations = iterations
+        self.codebooks = None
+
+    @property
+    def trained(self) -> bool:
+        return self.codebooks is not None
+
+    def code_size(self, dim: int) -> int:
+        return self.subspaces
+
+    def fit(self, data: np.ndarray):
+        dim = data.shape[1]
+        if dim % self.subspaces:
+            raise ValueError(f"Embedding dimension {dim} is not divisible into {self.subspaces} subspaces")
+        if len(data) < 256:
+            raise ValueError("Product quantization needs at least 256 training vectors")
+
+        sub_dim = dim // self.subspaces
+        rng = np.random.default_rng(0)
+        codebooks = np.empty((self.subspaces, 256, sub_dim), dtype=np.float32)
+        for m in range(self.subspaces):
+            part = data[:, m * sub_dim:(m + 1) * sub_dim]
+            centroids = part[rng.choice(len(part), size=256, replace=False)].copy()
+            for _ in range(self.iterations):
+                labels = self._nearest(part, centroids)
+                order = np.argsort(labels, kind="stable")
+                present, starts = np.unique(labels[order], return_index=True)
+                counts = np.diff(np.append(starts, len(labels)))
+                centroids[present] = np.add.reduceat(part[order], starts) / counts[:, None]
+            codebooks[m] = centroids
+        self.codebooks = codebooks
+
+    def encode(self, data: np.ndarray) -> np.ndarray:
+        sub_dim = self.codebooks.shape[2]
+        codes = np.empty((len(data), self.subspaces), dtype=np.uint8)
+        for m in range(self.subspaces):
+            codes[:, m] = self._nearest(data[:, m * sub_dim:(m + 1) * sub_dim], self.codebooks[m])
+        return codes
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        sub_dim = self.codebooks.shape[2]
+        table = np.einsum("mkd,md->mk", self.codebooks, query.reshape(self.subspaces, sub_dim))
+        scores = np.zeros(len(codes), dtype=np.float32)
+        for m in range(self.subspaces):
+            scores += table[m][codes[:, m]]
+        return scores
+
+    @staticmethod
+    def _nearest(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        distances = (centroids ** 2).sum(axis=1) - 2 * data @ centroids.T
+        return np.argmin(distances, axis=1)
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        self.codebooks = state["codebooks"]
+        self.subspaces = self.codebooks.shape[0]
+
+
+def create_quantizer(kind: str, pq_subspaces: int = 48):
+    """Return a quantizer for the given NUMPY_QUANTIZATION setting, or None"""
+    if kind in ("", "none", None):
+        return None
+    if kind == "int8":
+        return ScalarQuantizer()
+    if kind == "pq":
+        return ProductQuantizer(subspaces=pq_subspaces)
+    raise ValueError(f"Unknown vector quantization: {kind}")
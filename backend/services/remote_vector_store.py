@@ -0,0 +1,329 @@
+import asyncio
+import logging
+import time
+from typing import List, Dict, Any, Optional
+
+import httpx
+import numpy as np
+
+from .vector_store import VectorStore, DEFAULT_COLLECTION_NAME, WARM_UP_QUERY
+from .collection_versions import VersionConflictError
+from .embeddings import create_embedding_function
+from .tracing import current_span, stage, SPAN_KIND_CLIENT
+
+logger = logging.getLogger(__name__)
+
+class IndexServiceError(Exception):
+    """The index service failed a call or could not be reached"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class IndexClient:
+    """Pooled connections from one API worker to the index service.
+
+    Every remote store and the remote version registry of a worker share
+    it. Synchronous store methods use a blocking client, meant for tools and
+    threads, asynchronous ones an ``httpx.AsyncClient``. Calls made inside a
+    traced request carry a ``traceparent`` header.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 30.0):
+        self.base_url = base_url.rstrip("/")
+        self._client = httpx.Client(base_url=self.base_url, timeout=timeout)
+        self._async_client = httpx.AsyncClient(base_url=self.base_url, timeout=timeout)
+
+    @staticmethod
+    def _headers() -> Dict[str, str]:
+        span = current_span()
+        if span.span_id is None:
+            return {}
+        return {"traceparent": f"00-{span.trace_id}-{span.span_id}-01"}
+
+    def call(self, path: str, method: str = "POST", **arguments) -> Any:
+        try:
+            response = self._client.request(method, path, json=arguments, headers=self._headers())
+        except httpx.HTTPError as e:
+            raise IndexServiceError(f"Index service unreachable at {self.base_url}: {e}") from e
+        return self._result(response)
+
+    async def acall(self, path: str, **arguments) -> Any:
+        try:
+            response = await self._async_client.post(path, json=arguments, headers=self._headers())
+        except httpx.HTTPError as e:
+            raise IndexServiceError(f"Index service unreachable at {self.base_url}: {e}") from e
+        return self._result(response)
+
+    @staticmethod
+    def _result(response: httpx.Response) -> Any:
+        if response.status_code == 200:
+            return response.json()
+        try:
+            detail = response.json().get("detail", response.text)
+        except ValueError:
+            detail = response.text
+        # Invalid arguments and state transitions keep their exception type across the wire
+        if response.status_code == 400:
+            raise ValueError(detail)
+        if response.status_code == 409:
+            raise VersionConflictError(detail)
+        raise IndexServiceError(f"Index service returned {response.status_code}: {detail}", response.status_code)
+
+    async def close(self):
+        self._client.close()
+        await self._async_client.aclose()
+
+def _json_embeddings(embeddings) -> List[List[float]]:
+    return np.asarray(embeddings, dtype=np.float32).tolist()
+
+class RemoteCatalog:
+    """Document catalog of a collection held by the index service"""
+
+    def __init__(self, client: IndexClient, collection_name: str):
+        self.client = client
+        self.path = f"/collections/{collection_name}/catalog"
+
+    def initialize(self):
+        pass
+
+    def upsert(self, document: Dict[str, Any]):
+        self.client.call(f"{self.path}/upsert", document=document)
+
+    def get(self, document_id: str) -> Optional[Dict[str, Any]]:
+        return self.client.call(f"{self.path}/get", document_id=document_id)
+
+    def get_many(self, document_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        return self.client.call(f"{self.path}/get_many", document_ids=document_ids)
+
+    def list(self, limit: int = 50, offset: int = 0, sort_by: str = "upload_time",
+             descending: bool = True) -> List[Dict[str, Any]]:
+        return self.client.call(f"{self.path}/list", limit=limit, offset=offset, sort_by=sort_by,
+                                descending=descending)
+
+    def count(self) -> int:
+        return self.client.call(f"{self.path}/count")
+
+    def list_document_shards(self, after: str = "", limit: int = 1000) -> List[Dict[str, Any]]:
+        return self.client.call(f"{self.path}/list_document_shards", after=after, limit=limit)
+
+    def document_ids(self) -> List[str]:
+        return self.client.call(f"{self.path}/document_ids")
+
+    def count_chunks(self) -> int:
+        return self.client.call(f"{self.path}/count_chunks")
+
+    def count_file_references(self, file_path: str) -> int:
+        return self.client.call(f"{self.path}/count_file_references", file_path=file_path)
+
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        return self.client.call(f"{self.path}/get_meta", key=key, default=default)
+
+    def set_meta(self, key: str, value: str):
+        self.client.call(f"{self.path}/set_meta", key=key, value=value)
+
+    def close(self):
+        pass
+
+class RemoteVectorStore(VectorStore):
+    """VectorStore whose collection and catalog live in the index service.
+
+    Content is split and embedded in the calling worker, so that CPU work
+    scales with the number of API workers; only chunks, vectors and
+    results cross the network. The service stores, searches and keeps the
+    catalog for every worker, which is what makes running several workers
+    or nodes safe. ``close`` leaves the collection open in the service,
+    where other workers may still be using it.
+    """
+
+    def __init__(self, client: IndexClient, embedding_function=None,
+                 collection_name: str = DEFAULT_COLLECTION_NAME):
+        super().__init__(embedding_function=embedding_function, collection_name=collection_name,
+                         catalog=RemoteCatalog(client, collection_name))
+        self.index = client
+        self.path = f"/collections/{collection_name}"
+
+    async def initialize(self):
+        """Open the collection in the index service and load the embedding model it was built with"""
+        try:
+            model_name = await self.index.acall(f"{self.path}/catalog/get_meta", key="embedding_model")
+            if self.embedding_function is None:
+                self.embedding_function = create_embedding_function(model_name)
+        except Exception as e:
+            logger.error(f"Failed to open remote collection {self.collection_name}: {e}")
+            raise
+
+    async def add_document(self, content: str, metadata: Dict[str, Any],
+                           processing_seconds: Optional[float] = None,
+                           document_id: Optional[str] = None,
+                           chunks: Optional[List[str]] = None,
+                           embeddings: Optional[List[List[float]]] = None) -> str:
+        """Split and embed the document here, then store it in the index service"""
+        try:
+            if chunks is None:
+                with stage("upload", "chunk", characters=len(content)) as span:
+                    chunks = self._split_content(content)
+                    span.set_attribute("chunks", len(chunks))
+            if embeddings is None:
+                embeddings = await asyncio.to_thread(self._embed, chunks, pipeline="upload")
+
+            with stage("upload", "insert", span_kind=SPAN_KIND_CLIENT, collection=self.collection_name,
+                       chunks=len(chunks)):
+                return await self.index.acall(
+                    f"{self.path}/add_document",
+                    content=content,
+                    metadata=metadata,
+                    processing_seconds=processing_seconds,
+                    document_id=document_id,
+                    chunks=chunks,
+                    embeddings=_json_embeddings(embeddings)
+                )
+        except VersionConflictError:
+            # The version was swapped out; the caller retries on the new one
+            raise
+        except Exception as e:
+            logger.error(f"Error adding document to remote collection {self.collection_name}: {e}")
+            raise
+
+    async def search(self, query: str, limit: int = 5,
+                     query_embeddings: Optional[List[List[float]]] = None) -> List[Dict[str, Any]]:
+        """Embed the query here and search the collection in the index service"""
+        try:
+            if query_embeddings is None:
+                query_embeddings = await asyncio.to_thread(self._embed, [query], pipeline="query")
+            with stage("query", "search", span_kind=SPAN_KIND_CLIENT, collection=self.collection_name,
+                       limit=limit) as span:
+                results = await self.index.acall(
+                    f"{self.path}/search",
+                    query=query,
+                    limit=limit,
+                    query_embeddings=_json_embeddings(query_embeddings)
+                )
+                span.set_attribute("chunks", len(results))
+            return results
+        except Exception as e:
+            logger.error(f"Error searching remote collection {self.collection_name}: {e}")
+            raise
+
+    async def warm_up(self, query_embeddings: Optional[List[List[float]]] = None):
+        """Load the embedding model here and the index in the service"""
+        start_time = time.perf_counter()
+        if query_embeddings is None:
+            query_embeddings = await asyncio.to_thread(self.embedding_function, [WARM_UP_QUERY])
+        await self.index.acall(f"{self.path}/warm_up", query_embeddings=_json_embeddings(query_embeddings))
+        logger.info(f"Warmed up remote collection {self.collection_name} in {time.perf_counter() - start_time:.2f}s")
+
+    async def list_documents(self, limit: int = 50, offset: int = 0, sort_by: str = "upload_time",
+                             descending: bool = True) -> List[Dict[str, Any]]:
+        return await self.index.acall(f"{self.path}/list_documents", limit=limit, offset=offset,
+                                      sort_by=sort_by, descending=descending)
+
+    def count_documents(self) -> int:
+        return self.index.call(f"{self.path}/count_documents")
+
+    def delete_documents(self, document_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        return self.index.call(f"{self.path}/delete_documents", document_ids=document_ids)
+
+    def get_chunks(self, document_ids: List[str]) -> Dict[str, List[str]]:
+        return self.index.call(f"{self.path}/get_chunks", document_ids=document_ids)
+
+    def is_file_referenced(self, file_path: str) -> bool:
+        return self.index.call(f"{self.path}/is_file_referenced", file_path=file_path)
+
+    def migrate_chunk_metadata(self, batch_size: int = 1000) -> int:
+        raise IndexServiceError("Run maintenance tools on the index service host, without VECTOR_STORE_URL")
+
+    def persist(self):
+        self.index.call(f"{self.path}/persist")
+
+    def close(self):
+        pass
+
+    def drop(self):
+        """Delete the collection and its catalog in the index service"""
+        self.index.call(self.path, method="DELETE")
+        logger.info(f"Dropped remote collection {self.collection_name}")
+
+    def reset(self):
+        self.index.call(f"{self.path}/reset")
+
+class RemoteCollectionVersions:
+    """Collection version registry held by the index service.
+
+    ``resolve`` is asked on every request, so its answers are reused for
+    ``cache_seconds``; reads pick up a version swap made elsewhere within
+    that time. Writes cannot land on the retired version meanwhile: the
+    service refuses them, and callers retry with ``fresh=True``.
+    Activations and rollbacks go through the service's version builds,
+    which hold the writes of every worker back for the swap.
+    """
+
+    def __init__(self, client: IndexClient, cache_seconds: float = 1.0):
+        self.client = client
+        self.cache_seconds = cache_seconds
+        self._active: Dict[str, tuple] = {}
+
+    def initialize(self):
+        pass
+
+    def active_collection(self, alias: str) -> str:
+        return self.client.call("/versions/active_collection", alias=alias)
+
+    async def resolve(self, alias: str, fresh: bool = False) -> str:
+        cached = self._active.get(alias)
+        if not fresh and cached is not None and time.monotonic() - cached[1] < self.cache_seconds:
+            return cached[0]
+        collection_name = await self.client.acall("/versions/active_collection", alias=alias)
+        self._active[alias] = (collection_name, time.monotonic())
+        return collection_name
+
+    def list_versions(self, alias: str) -> List[Dict[str, Any]]:
+        return self.client.call("/versions/list_versions", alias=alias)
+
+    def get_version(self, alias: str, version: int) -> Optional[Dict[str, Any]]:
+        return self.client.call("/versions/get_version", alias=alias, version=version)
+
+    def create_version(self, alias: str, description: Optional[str] = None) -> Dict[str, Any]:
+        return self.client.call("/versions/create_version", alias=alias, description=description)
+
+    def set_status(self, alias: str, version: int, status: str):
+        self.client.call("/versions/set_status", alias=alias, version=version, status=status)
+
+    def activate(self, alias: str, version: int) -> Dict[str, Any]:
+        self._active.pop(alias, None)
+        return self.client.call("/builds/activate", alias=alias, version=version)
+
+    def rollback(self, alias: str) -> Dict[str, Any]:
+        self._active.pop(alias, None)
+        return self.client.call("/builds/rollback", alias=alias)
+
+    def delete_version(self, alias: str, version: int):
+        self.client.call("/versions/delete_version", alias=alias, version=version)
+
+    def close(self):
+        pass
+
+class RemoteVersionBuilds:
+    """Version builds run by the index service.
+
+    Builds and swaps of an alias happen next to its collections, under the
+    service's lock and write fence, so two workers cannot build the same
+    alias and none can write to a version while it is being swapped out.
+    """
+
+    def __init__(self, client: IndexClient):
+        self.client = client
+
+    async def building(self, alias: str) -> bool:
+        return await self.client.acall("/builds/building", alias=alias)
+
+    async def start(self, alias: str, description: Optional[str] = None, activate: bool = False,
+                    version: Optional[int] = None, model_name: Optional[str] = None) -> Dict[str, Any]:
+        return await self.client.acall("/builds/start", alias=alias, description=description, activate=activate,
+                                       version=version, model_name=model_name)
+
+    async def activate(self, alias: str, version: int) -> Dict[str, Any]:
+        return await self.client.acall("/builds/activate", alias=alias, version=version)
+
+    async def rollback(self, alias: str) -> Dict[str, Any]:
+        return await self.client.acall("/builds/rollback", alias=alias)
@@ -0,0 +1,232 @@
+import hashlib
+import sqlite3
+import threading
+import logging
+import os
+import time
+from typing import Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.path.join("vector_db", "response_cache.sqlite3")
+
+# How long deleted documents are remembered; answers that took longer to produce are not cached
+INVALIDATION_HORIZON_SECONDS = 3600.0
+
+def prompt_fingerprint(model: str, template_version: str, prompt: str) -> str:
+    """Cache key for a generated answer: changing the model, template or prompt misses"""
+    return hashlib.sha256(f"{model}\0{template_version}\0{prompt}".encode()).hexdigest()
+
+class ResponseCache:
+    """Generated answers persisted in SQLite, keyed by prompt fingerprint.
+
+    Entries expire ``ttl_seconds`` after they were written and the least
+    recently used ones are evicted beyond ``max_entries``. Each entry is
+    tagged with the documents whose chunks were in the prompt, so deleting
+    a document drops every answer built from it. Deletions are remembered
+    for a while, so an answer still being generated when one of its
+    documents is deleted is not cached afterwards. A ``max_entries`` of 0
+    disables the cache.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 10000, ttl_seconds: float = 7 * 24 * 3600):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidated = 0
+        self.stale = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def initialize(self):
+        """Open the database and create the schema if needed"""
+        if self._conn is not None or not self.enabled:
+            return
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_responses_last_used_at ON responses(last_used_at);
+            CREATE INDEX IF NOT EXISTS idx_responses_created_at ON responses(created_at);
+            CREATE TABLE IF NOT EXISTS response_documents (
+                cache_key TEXT NOT NULL REFERENCES responses(cache_key) ON DELETE CASCADE,
+                document_id TEXT NOT NULL,
+                PRIMARY KEY (cache_key, document_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_response_documents_document_id ON response_documents(document_id);
+            CREATE TABLE IF NOT EXISTS invalidated_documents (
+                document_id TEXT PRIMARY KEY,
+                invalidated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_invalidated_documents_invalidated_at
+                ON invalidated_documents(invalidated_at);
+            -- Entry count kept by triggers, so eviction never has to count the table
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS cache_counts (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO cache_counts (name, value) SELECT 'entries', COUNT(*) FROM responses;
+            CREATE TRIGGER IF NOT EXISTS responses_count_insert AFTER INSERT ON responses BEGIN
+                UPDATE cache_counts SET value = value + 1 WHERE name = 'entries';
+            END;
+            CREATE TRIGGER IF NOT EXISTS responses_count_delete AFTER DELETE ON responses BEGIN
+                UPDATE cache_counts SET value = value - 1 WHERE name = 'entries';
+            END;
+            COMMIT;
+        """)
+        self._conn.commit()
+        logger.info(f"Response cache ready at {self.db_path}")
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """Cached answer for the key, refreshing its position in the LRU order"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT answer, created_at FROM responses WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is not None and now - row["created_at"] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE cache_key = ?", (cache_key,))
+                self.evictions += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used_at = ? WHERE cache_key = ?", (now, cache_key))
+            self.hits += 1
+            return row["answer"]
+
+    def put(self, cache_key: str, answer: str, document_ids: Iterable[str], since: Optional[float] = None):
+        """Store an answer tagged with the documents it was generated from.
+
+        ``since`` is when retrieval of those documents started; the answer
+        is dropped if any of them has been deleted since then.
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        document_ids = set(document_ids)
+        if since is not None and now - since > INVALIDATION_HORIZON_SECONDS:
+            self.stale += 1
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO responses (cache_key, answer, created_at, last_used_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    answer = excluded.answer, created_at = excluded.created_at, last_used_at = excluded.last_used_at
+                """,
+                (cache_key, answer, now, now)
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO response_documents (cache_key, document_id) VALUES (?, ?)",
+                [(cache_key, document_id) for document_id in document_ids]
+            )
+            # Checked after the insert, inside its write transaction, so a deletion is either
+            # seen here or comes later and removes the entry itself
+            if since is not None and self._deleted_since(document_ids, since):
+                self._conn.execute("DELETE FROM responses WHERE cache_key = ?", (cache_key,))
+                self.stale += 1
+                return
+            self._evict(now)
+
+    def _deleted_since(self, document_ids: Set[str], since: float) -> bool:
+        document_ids = list(document_ids)
+        for start in range(0, len(document_ids), 500):
+            batch = document_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            if self._conn.execute(
+                f"""
+                SELECT 1 FROM invalidated_documents
+                WHERE invalidated_at >= ? AND document_id IN ({placeholders}) LIMIT 1
+                """,
+                [since, *batch]
+            ).fetchone():
+                return True
+        return False
+
+    def _evict(self, now: float):
+        expired = self._conn.execute(
+            "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        overflow = self._entries() - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                """
+                DELETE FROM responses WHERE cache_key IN (
+                    SELECT cache_key FROM responses ORDER BY last_used_at LIMIT ?
+                )
+                """,
+                (overflow,)
+            )
+        self.evictions += expired + max(overflow, 0)
+
+    def invalidate_documents(self, document_ids: Iterable[str]) -> int:
+        """Drop every answer generated from any of the documents"""
+        document_ids = list(document_ids)
+        if not self.enabled or not document_ids:
+            return 0
+        removed = 0
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO invalidated_documents (document_id, invalidated_at) VALUES (?, ?)",
+                [(document_id, now) for document_id in document_ids]
+            )
+            self._conn.execute(
+                "DELETE FROM invalidated_documents WHERE invalidated_at < ?", (now - INVALIDATION_HORIZON_SECONDS,)
+            )
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(document_ids), 500):
+                batch = document_ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                removed += self._conn.execute(
+                    f"""
+                    DELETE FROM responses WHERE cache_key IN (
+                        SELECT cache_key FROM response_documents WHERE document_id IN ({placeholders})
+                    )
+                    """,
+                    batch
+                ).rowcount
+        self.invalidated += removed
+        if removed:
+            logger.info(f"Evicted {removed} cached answers built from {len(document_ids)} deleted documents")
+        return removed
+
+    def _entries(self) -> int:
+        return self._conn.execute("SELECT value FROM cache_counts WHERE name = 'entries'").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        entries = 0
+        if self.enabled:
+            with self._lock:
+                entries = self._entries()
+        return {"entries": entries, "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "invalidated": self.invalidated, "stale": self.stale}
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
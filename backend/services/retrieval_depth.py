@@ -0,0 +1,33 @@
+from typing import List, Sequence
+
+def choose_depth(scores: Sequence[float], max_depth: int, min_depth: int = 1,
+                 score_floor: float = 0.0, gap_ratio: float = 0.5) -> int:
+    """Number of leading results worth passing to the LLM.
+
+    ``scores`` are the similarity scores of an over-fetched result list,
+    best first. Results are taken in order until one falls below
+    ``score_floor``, or until the drop from the previous result is at least
+    ``gap_ratio`` of the whole spread of scores (a cliff separating the
+    relevant hits from the rest), or ``max_depth`` is reached. The first
+    ``min_depth`` results are always kept, so a question still gets an
+    answer from its best matches when nothing clears the floor.
+    """
+    available = min(len(scores), max_depth)
+    depth = min(min_depth, available)
+    if available <= depth:
+        return depth
+
+    spread = scores[0] - scores[-1]
+    for position in range(depth, available):
+        if scores[position] < score_floor:
+            break
+        if spread > 0 and scores[position - 1] - scores[position] >= gap_ratio * spread:
+            break
+        depth = position + 1
+    return depth
+
+def trim_results(results: List[dict], max_depth: int, min_depth: int = 1,
+                 score_floor: float = 0.0, gap_ratio: float = 0.5) -> List[dict]:
+    """Keep the leading search results that ``choose_depth`` selects"""
+    depth = choose_depth([result["score"] for result in results], max_depth, min_depth, score_floor, gap_ratio)
+    return results[:depth]
@@ -0,0 +1,240 @@
+import hashlib
+import heapq
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Dict, Any, Optional, Callable
+
+from .vector_store import VectorStore, DEFAULT_COLLECTION_NAME, WARM_UP_QUERY
+from .embeddings import create_embedding_function
+from .tracing import stage
+
+logger = logging.getLogger(__name__)
+
+def shard_for_document(document_id: str, num_shards: int) -> int:
+    """Jump consistent hash of a document id onto ``num_shards`` buckets.
+
+    Growing from n to n + 1 shards only moves about 1 / (n + 1) of the
+    documents, all of them onto the new shard.
+    """
+    key = int.from_bytes(hashlib.md5(document_id.encode()).digest()[:8], "little")
+    bucket, candidate = -1, 0
+    while candidate < num_shards:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+class ShardedVectorStore(VectorStore):
+    """VectorStore that hash-partitions documents across several shard stores.
+
+    Every shard is an ordinary VectorStore (Chroma or NumPy) over its own
+    collection, and all of them share one document catalog whose ``shard``
+    column records where a document's chunks live. Ingestion routes each
+    document to a single shard; searches embed the query once, fan out to
+    all shards on a thread pool and merge the per-shard top-k. Documents
+    written before sharding was enabled stay in the unsharded collection
+    (catalog shard NULL) and are still searched until ``rebalance`` moves
+    them.
+    """
+
+    def __init__(self, store_factory: Callable[..., VectorStore], num_shards: int, embedding_function,
+                 collection_name: str = DEFAULT_COLLECTION_NAME, search_threads: int = 0):
+        self.legacy = store_factory(collection_name=collection_name)
+        super().__init__(embedding_function=embedding_function, collection_name=collection_name,
+                         catalog=self.legacy.catalog)
+        self.num_shards = num_shards
+        self.shards = [
+            store_factory(collection_name=f"{collection_name}_shard{i}", catalog=self.catalog, shard_id=i)
+            for i in range(num_shards)
+        ]
+        self._executor = ThreadPoolExecutor(max_workers=search_threads or num_shards + 1,
+                                            thread_name_prefix="shard-search")
+        self._legacy_has_chunks = False
+
+    async def initialize(self):
+        """Initialize the unsharded collection and every shard"""
+        await self.legacy.initialize()
+        # Every shard embeds with the same model so a query is embedded once
+        self.embedding_function = (self.embedding_function or self.legacy.embedding_function
+                                   or create_embedding_function())
+        for shard in self.shards:
+            shard.embedding_function = self.embedding_function
+            await shard.initialize()
+        self._legacy_has_chunks = self.legacy.collection.count() > 0
+        logger.info(f"Sharded vector store ready with {self.num_shards} shards")
+
+    def _store_for(self, shard: Optional[int]) -> VectorStore:
+        if shard is None:
+            return self.legacy
+        if shard >= self.num_shards:
+            raise ValueError(f"Document is on shard {shard} but only {self.num_shards} shards are configured")
+        return self.shards[shard]
+
+    def _search_stores(self) -> List[VectorStore]:
+        return self.shards + ([self.legacy] if self._legacy_has_chunks else [])
+
+    async def add_document(self, content: str, metadata: Dict[str, Any],
+                           processing_seconds: Optional[float] = None,
+                           document_id: Optional[str] = None,
+                           chunks: Optional[List[str]] = None,
+                           embeddings: Optional[List[List[float]]] = None) -> str:
+        """Add a document to the shard its id hashes to"""
+        document_id = document_id or str(uuid.uuid4())
+        shard = self.shards[shard_for_document(document_id, self.num_shards)]
+        return await shard.add_document(content, metadata, processing_seconds=processing_seconds,
+                                        document_id=document_id, chunks=chunks, embeddings=embeddings)
+
+    def _search(self, query: str, limit: int = 5,
+                query_embeddings: Optional[List[List[float]]] = None) -> List[Dict[str, Any]]:
+        """Search all shards in parallel and merge their top-k"""
+        try:
+            if query_embeddings is None:
+                query_embeddings = self._embed([query], pipeline="query")
+            stores = self._search_stores()
+            with stage("query", "search", shards=len(stores), limit=limit) as span:
+                per_shard = list(self._executor.map(partial(
+                    self._query_store,
+                    query_embeddings=query_embeddings,
+                    limit=limit
+                ), stores))
+                span.set_attribute("chunks", sum(len(results['documents'][0]) for results in per_shard
+                                                 if results['documents']))
+
+            candidates = []
+            for store, results in zip(stores, per_shard):
+                if results['documents'] and results['documents'][0]:
+                    # Shards created at different times may measure in different spaces
+                    distances = [store.cosine_distance(distance) for distance in results['distances'][0]]
+                    candidates.extend(zip(distances, results['documents'][0], results['metadatas'][0]))
+
+            best = heapq.nsmallest(limit, candidates, key=lambda candidate: candidate[0])
+            if not best:
+                return []
+
+            distances, documents, metadatas = zip(*best)
+            return self._format_results(list(documents), list(metadatas), list(distances))
+
+        except Exception as e:
+            logger.error(f"Error searching sharded vector store: {e}")
+            raise
+
+    @staticmethod
+    def _query_store(store: VectorStore, query_embeddings: List[List[float]], limit: int) -> Dict[str, Any]:
+        return store.collection.query(query_embeddings=query_embeddings, n_results=limit,
+                                      include=["documents", "metadatas", "distances"])
+
+    def _warm_up(self, query_embeddings=None):
+        # Embed once, then warm every collection in parallel
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function([WARM_UP_QUERY])
+        list(self._executor.map(lambda store: store._warm_up(query_embeddings), [self.legacy] + self.shards))
+
+    def get_chunks(self, document_ids: List[str]) -> Dict[str, List[str]]:
+        by_store = {}
+        for document_id, document in self.catalog.get_many(document_ids).items():
+            store = self._store_for(document['shard'])
+            by_store.setdefault(id(store), (store, []))[1].append(document_id)
+
+        chunks = {}
+        for store, ids in by_store.values():
+            chunks.update(store.get_chunks(ids))
+        return chunks
+
+    def delete_documents(self, document_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Delete documents from whichever shards hold them"""
+        document_ids = list(dict.fromkeys(document_ids))
+        documents = self.catalog.get_many(document_ids)
+
+        by_store = {}
+        for document_id in document_ids:
+            if document_id in documents:
+                store = self._store_for(documents[document_id]['shard'])
+                by_store.setdefault(id(store), (store, []))[1].append(document_id)
+
+        deleted = {}
+        for store, ids in by_store.values():
+            deleted.update(store.delete_documents(ids))
+
+        # Ids missing from the catalog may still have chunks anywhere
+        uncatalogued = [doc_id for doc_id in document_ids if doc_id not in documents]
+        if uncatalogued:
+            for store in self.shards + [self.legacy]:
+                deleted.update(store.delete_documents(uncatalogued))
+
+        if self._legacy_has_chunks:
+            self._legacy_has_chunks = self.legacy.collection.count() > 0
+        return deleted
+
+    def rebalance(self, batch_size: int = 500) -> Dict[str, int]:
+        """Move every document whose catalog shard differs from its hashed shard.
+
+        Chunks are copied with their stored embeddings (no re-embedding), the
+        source copy is removed and the catalog is updated document by
+        document, so the process can be interrupted and re-run.
+        """
+        moved = 0
+        moved_chunks = 0
+        scanned = 0
+        after = ""
+        while True:
+            page = self.catalog.list_document_shards(after=after, limit=batch_size)
+            if not page:
+                break
+            after = page[-1]['document_id']
+
+            for document in page:
+                scanned += 1
+                target_shard = shard_for_document(document['document_id'], self.num_shards)
+                if document['shard'] == target_shard:
+                    continue
+                moved_chunks += self._move_document(document, self._store_for(document['shard']),
+                                                    self.shards[target_shard])
+                moved += 1
+            logger.info(f"Rebalance progress: scanned {scanned} documents, moved {moved}")
+
+        self._legacy_has_chunks = self.legacy.collection.count() > 0
+        return {"scanned": scanned, "moved_documents": moved, "moved_chunks": moved_chunks}
+
+    def _move_document(self, document: Dict[str, Any], source: VectorStore, target: VectorStore) -> int:
+        chunk_ids = self._chunk_ids(document['document_id'], document['chunk_count'])
+        chunks = source.collection.get(ids=chunk_ids, include=["embeddings", "documents", "metadatas"])
+
+        if len(chunks['ids']):
+            # Clear any partial copy left by an interrupted run before re-adding
+            target.collection.delete(ids=list(chunks['ids']))
+            target.collection.add(
+                ids=list(chunks['ids']),
+                embeddings=chunks['embeddings'],
+                documents=chunks['documents'],
+                metadatas=chunks['metadatas']
+            )
+            source.collection.delete(ids=list(chunks['ids']))
+
+        self.catalog.set_shard(document['document_id'], target.shard_id)
+        return len(chunks['ids'])
+
+    def migrate_chunk_metadata(self, batch_size: int = 1000) -> int:
+        return sum(store.migrate_chunk_metadata(batch_size=batch_size) for store in [self.legacy] + self.shards)
+
+    def persist(self):
+        for store in [self.legacy] + self.shards:
+            store.persist()
+
+    def close(self):
+        for store in [self.legacy] + self.shards:
+            store.close()
+        self._executor.shutdown(wait=False)
+
+    def drop(self):
+        # Shards share the legacy store's catalog, which is dropped first
+        for store in [self.legacy] + self.shards:
+            store.drop()
+        self._executor.shutdown(wait=False)
+
+    def reset(self):
+        """Reset the unsharded collection and every shard"""
+        for store in [self.legacy] + self.shards:
+            store.reset()
+        self._legacy_has_chunks = False
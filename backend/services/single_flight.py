@@ -0,0 +1,41 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into a single execution.
+
+    The first caller for a key starts the computation as its own task;
+    callers arriving while it runs await the same task and get the same
+    result or exception. The task is shielded, so a caller that goes away
+    does not cancel the work the others are waiting on. Nothing is cached:
+    once the task finishes, the next call for the key runs again.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(compute())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception as retrieved in case every waiter was cancelled
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Coalesced call for {key!r} failed: {task.exception()}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._in_flight), "executed": self.executed, "coalesced": self.coalesced}
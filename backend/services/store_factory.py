@@ -0,0 +1,84 @@
+from ..config import Settings
+from .vector_store import VectorStore, DEFAULT_COLLECTION_NAME
+from .numpy_vector_store import NumpyVectorStore
+from .sharded_vector_store import ShardedVectorStore
+from .remote_vector_store import IndexClient, RemoteVectorStore, RemoteCollectionVersions, RemoteVersionBuilds
+from .collection_versions import CollectionVersions, VersionBuilds, WriteFences, REGISTRY_PATH
+from .tenant_stores import TenantVectorStores
+
+# One connection pool per worker, shared by every remote store
+_index_client = None
+
+def get_index_client(settings: Settings) -> IndexClient:
+    global _index_client
+    if _index_client is None:
+        _index_client = IndexClient(settings.vector_store_url, timeout=settings.vector_store_timeout_seconds)
+    return _index_client
+
+async def close_index_client():
+    global _index_client
+    if _index_client is not None:
+        await _index_client.close()
+        _index_client = None
+
+def create_collection_versions(settings: Settings):
+    """The collection version registry, held by the index service when VECTOR_STORE_URL is set"""
+    if settings.vector_store_url:
+        return RemoteCollectionVersions(get_index_client(settings))
+    return CollectionVersions(REGISTRY_PATH)
+
+def create_version_builds(settings: Settings, registry: CollectionVersions, stores: TenantVectorStores,
+                          fences: WriteFences, document_processor=None):
+    """Version builds run in this process, or by the index service when VECTOR_STORE_URL is set"""
+    if settings.vector_store_url:
+        return RemoteVersionBuilds(get_index_client(settings))
+    return VersionBuilds(
+        registry, stores, fences,
+        lambda collection_name, embedding_function: create_vector_store(
+            settings, embedding_function=embedding_function, collection_name=collection_name
+        ),
+        document_processor=document_processor
+    )
+
+def create_vector_store(settings: Settings, embedding_function=None,
+                        collection_name: str = DEFAULT_COLLECTION_NAME) -> VectorStore:
+    """Build the vector store described by the backend and sharding settings.
+
+    With VECTOR_STORE_URL set, the store is a client of the index service,
+    which applies the backend and sharding settings on its side.
+    """
+    if settings.vector_store_url:
+        return RemoteVectorStore(get_index_client(settings), embedding_function=embedding_function,
+                                 collection_name=collection_name)
+
+    def make_store(collection_name: str, catalog=None, shard_id=None) -> VectorStore:
+        if settings.vector_backend == "numpy":
+            return NumpyVectorStore(
+                embedding_function=embedding_function,
+                ivf_lists=settings.numpy_ivf_lists,
+                ivf_probes=settings.numpy_ivf_probes,
+                quantization=settings.numpy_quantization,
+                pq_subspaces=settings.numpy_pq_subspaces,
+                rescore_factor=settings.numpy_rescore_factor,
+                collection_name=collection_name,
+                catalog=catalog,
+                shard_id=shard_id
+            )
+        return VectorStore(
+            embedding_function=embedding_function,
+            collection_name=collection_name,
+            catalog=catalog,
+            shard_id=shard_id,
+            memory_limit_bytes=settings.chroma_memory_limit_bytes
+        )
+
+    if settings.vector_shards > 1:
+        return ShardedVectorStore(
+            make_store,
+            num_shards=settings.vector_shards,
+            embedding_function=embedding_function,
+            collection_name=collection_name,
+            search_threads=settings.vector_shard_search_threads
+        )
+
+    return make_store(collection_name)
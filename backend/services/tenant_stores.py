@@ -0,0 +1,131 @@
+import asyncio
+import inspect
+import logging
+import re
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Union
+
+from .vector_store import VectorStore, DEFAULT_COLLECTION_NAME
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = "default"
+
+# Short enough that "<collection>_t_<tenant>_v<n>_shard<n>" stays within Chroma's 63 character limit
+TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9_-]{0,22}[A-Za-z0-9])?$")
+
+def tenant_collection_name(tenant_id: str) -> str:
+    """Collection holding a tenant's chunks; the default tenant keeps the original collection"""
+    if tenant_id == DEFAULT_TENANT:
+        return DEFAULT_COLLECTION_NAME
+    return f"{DEFAULT_COLLECTION_NAME}_t_{tenant_id}"
+
+class TenantVectorStores:
+    """Bounded LRU of per-tenant vector stores.
+
+    Each tenant gets its own collection (and catalog), so a query only
+    searches that tenant's index. ``resolve_collection`` maps a tenant to
+    the collection currently serving it, directly or as a coroutine, which
+    lets a new collection version be swapped in between requests. At most ``max_open`` stores are
+    kept open; opening another one closes the least recently used. A store
+    closed while requests are still using it is closed when the last of
+    them releases it, or revived if it is requested again first.
+    """
+
+    def __init__(self, store_factory: Callable[[str], VectorStore], max_open: int = 64,
+                 resolve_collection: Optional[Callable[[str], Union[str, Awaitable[str]]]] = None):
+        self.store_factory = store_factory
+        self.max_open = max(1, max_open)
+        self.resolve_collection = resolve_collection or tenant_collection_name
+        self._open: "OrderedDict[str, VectorStore]" = OrderedDict()
+        self._evicted: Dict[str, VectorStore] = {}
+        self._in_use: Dict[str, int] = {}
+        self._lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def acquire(self, tenant_id: str) -> AsyncIterator[VectorStore]:
+        """Yield the tenant's current store, keeping it open for the duration of the block"""
+        collection_name = self.resolve_collection(tenant_id)
+        if inspect.isawaitable(collection_name):
+            collection_name = await collection_name
+        async with self.open(collection_name) as store:
+            yield store
+
+    @asynccontextmanager
+    async def open(self, collection_name: str) -> AsyncIterator[VectorStore]:
+        """Yield the store of a physical collection, keeping it open for the duration of the block"""
+        store = await self._checkout(collection_name)
+        try:
+            yield store
+        finally:
+            self._release(collection_name)
+
+    async def _checkout(self, collection_name: str) -> VectorStore:
+        store = self._open.get(collection_name)
+        if store is None:
+            async with self._lock:
+                store = self._open.get(collection_name) or await self._open_store(collection_name)
+        self._open.move_to_end(collection_name)
+        self._in_use[collection_name] = self._in_use.get(collection_name, 0) + 1
+        return store
+
+    async def _open_store(self, collection_name: str) -> VectorStore:
+        store = self._evicted.pop(collection_name, None)
+        if store is None:
+            store = self.store_factory(collection_name)
+            await store.initialize()
+            logger.info(f"Opened vector store {collection_name}")
+
+        self._open[collection_name] = store
+        while len(self._open) > self.max_open:
+            self._evict(next(iter(self._open)))
+        return store
+
+    def _evict(self, collection_name: str) -> bool:
+        store = self._open.pop(collection_name)
+        if self._in_use.get(collection_name):
+            self._evicted[collection_name] = store
+            return False
+        self._close(collection_name, store)
+        return True
+
+    def _release(self, collection_name: str):
+        self._in_use[collection_name] -= 1
+        if self._in_use[collection_name]:
+            return
+        del self._in_use[collection_name]
+        evicted = self._evicted.pop(collection_name, None)
+        if evicted is not None:
+            self._close(collection_name, evicted)
+
+    def _close(self, collection_name: str, store: VectorStore):
+        try:
+            store.persist()
+            store.close()
+            logger.info(f"Closed vector store {collection_name}")
+        except Exception as e:
+            logger.error(f"Error closing vector store {collection_name}: {e}")
+
+    def retire(self, collection_name: str) -> bool:
+        """Close a collection that no longer serves its tenant.
+
+        Returns False while requests still hold it; it is then closed when
+        the last one finishes.
+        """
+        if collection_name in self._open:
+            return self._evict(collection_name)
+        return collection_name not in self._evicted
+
+    def open_tenants(self) -> int:
+        return len(self._open)
+
+    def persist_all(self):
+        for store in list(self._open.values()) + list(self._evicted.values()):
+            store.persist()
+
+    def close_all(self):
+        for collection_name, store in list(self._open.items()) + list(self._evicted.items()):
+            self._close(collection_name, store)
+        self._open.clear()
+        self._evicted.clear()
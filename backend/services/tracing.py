@@ -0,0 +1,277 @@
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from .metrics import STAGE_SECONDS
+from ..logging_config import SizeRotatingFileHandler, process_path
+
+SERVICE_NAME = "multimodal-rag-backend"
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_CODE_ERROR = 2
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class _Trace:
+    """Spans of one trace, exported together when the root span ends"""
+
+    __slots__ = ("trace_id", "exporter", "spans", "exported")
+
+    def __init__(self, trace_id: str, exporter):
+        self.trace_id = trace_id
+        self.exporter = exporter
+        self.spans = []
+        self.exported = False
+
+    def finish(self, span: "Span", is_root: bool):
+        if self.exported:
+            # A background task that outlived the request; send its span on its own
+            self.exporter.export([span])
+            return
+        self.spans.append(span)
+        if is_root:
+            self.exported = True
+            self.exporter.export(self.spans)
+
+class Span:
+    """A timed operation within a trace; use as a context manager to make it the current span"""
+
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes",
+                 "status_message", "_trace", "_is_root", "_token")
+
+    def __init__(self, name: str, trace: _Trace, parent_id: Optional[str], is_root: bool = False,
+                 kind: int = SPAN_KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace.trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start_ns = 0
+        self.end_ns = 0
+        self.attributes = attributes or {}
+        self.status_message = None
+        self._trace = trace
+        self._is_root = is_root
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        self.attributes.update(attributes)
+
+    def record_error(self, message: str):
+        self.status_message = message or "error"
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        if exc is not None:
+            self.attributes["exception.type"] = exc_type.__name__
+            self.record_error(str(exc))
+        _current_span.reset(self._token)
+        self._trace.finish(self, self._is_root)
+
+class _NoopSpan:
+    """Stands in for a span when the request is not traced, so callers never need to check"""
+
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+
+    def record_error(self, message: str):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+class Tracer:
+    """Creates spans for sampled requests; does nothing until ``configure`` gives it an exporter"""
+
+    def __init__(self):
+        self.exporter = None
+        self.sample_rate = 1.0
+
+    def configure(self, exporter, sample_rate: float = 1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def start_trace(self, name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None,
+                    span_kind: int = SPAN_KIND_SERVER, **attributes):
+        """Root span of a new trace, or of this service's part of a caller's trace"""
+        if self.exporter is None or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            return NOOP_SPAN
+        trace = _Trace(trace_id or f"{random.getrandbits(128):032x}", self.exporter)
+        return Span(name, trace, parent_id, is_root=True, kind=span_kind, attributes=attributes)
+
+    def span(self, name: str, span_kind: int = SPAN_KIND_INTERNAL, **attributes):
+        """Child of the current span; a no-op outside a traced request"""
+        parent = _current_span.get()
+        if parent is None:
+            return NOOP_SPAN
+        return Span(name, parent._trace, parent.span_id, kind=span_kind, attributes=attributes)
+
+    def record(self, name: str, start_ns: int, end_ns: int, span_kind: int = SPAN_KIND_INTERNAL,
+               error: Optional[str] = None, **attributes):
+        """Add an already finished child span, for work that cannot be wrapped in a ``with`` block"""
+        span = self.span(name, span_kind, **attributes)
+        if span is NOOP_SPAN:
+            return
+        span.start_ns = start_ns
+        span.end_ns = end_ns
+        if error is not None:
+            span.record_error(error)
+        span._trace.finish(span, False)
+
+TRACER = Tracer()
+
+def current_span():
+    return _current_span.get() or NOOP_SPAN
+
+class _Stage:
+    __slots__ = ("pipeline", "name", "span", "start")
+
+    def __init__(self, pipeline: str, name: str, span_kind: int, attributes: Dict[str, Any]):
+        self.pipeline = pipeline
+        self.name = name
+        self.span = TRACER.span(f"{pipeline}.{name}", span_kind, **attributes)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self.span.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.__exit__(exc_type, exc, tb)
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, pipeline=self.pipeline, stage=self.name)
+
+def stage(pipeline: str, name: str, span_kind: int = SPAN_KIND_INTERNAL, **attributes) -> _Stage:
+    """Time a pipeline stage into the /metrics histogram and trace it as a span"""
+    return _Stage(pipeline, name, span_kind, attributes)
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP/JSON encodes 64-bit integers as strings
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def _otlp_span(span: Span) -> Dict[str, Any]:
+    encoded = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [{"key": key, "value": _otlp_value(value)}
+                       for key, value in span.attributes.items() if value is not None],
+        "status": {"code": STATUS_CODE_ERROR, "message": span.status_message} if span.status_message else {}
+    }
+    if span.parent_id:
+        encoded["parentSpanId"] = span.parent_id
+    return encoded
+
+class _OtlpJsonFormatter(logging.Formatter):
+    """Serializes the spans carried by a record as one OTLP/JSON ExportTraceServiceRequest"""
+
+    def __init__(self, service_name: str = SERVICE_NAME):
+        super().__init__()
+        self.service_name = service_name
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "backend"}, "spans": [_otlp_span(span) for span in record.spans]}]
+        }]})
+
+class FileSpanExporter:
+    """Writes finished traces as OTLP/JSON lines, one trace per line, to a size-rotated file.
+
+    Serialization and disk writes happen on a background thread; when it
+    falls behind, traces are dropped rather than blocking requests. The
+    format is what the OpenTelemetry Collector's file exporter writes, so
+    the files can be replayed into any OTLP backend.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, backup_count: int = 3,
+                 queue_size: int = 10000, service_name: str = SERVICE_NAME):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handler = SizeRotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        handler.setFormatter(_OtlpJsonFormatter(service_name))
+        self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+        self._listener = logging.handlers.QueueListener(self._queue, handler)
+        self._listener.start()
+
+    def export(self, spans: List[Span]):
+        try:
+            self._queue.put_nowait(logging.makeLogRecord({"spans": spans}))
+        except queue.Full:
+            self.dropped += 1
+
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def shutdown(self):
+        """Write out queued traces and stop the writer thread"""
+        if self._listener is None:
+            return
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
+        self._listener = None
+
+def setup_tracing(settings, service_name: str = SERVICE_NAME) -> Optional[FileSpanExporter]:
+    """Export traces to ``trace_file``, or disable tracing when it is empty"""
+    shutdown_tracing()
+    if not settings.trace_file:
+        return None
+    exporter = FileSpanExporter(process_path(settings.trace_file), max_bytes=settings.trace_max_bytes,
+                                backup_count=settings.trace_backup_count, service_name=service_name)
+    TRACER.configure(exporter, settings.trace_sample_rate)
+    return exporter
+
+def shutdown_tracing():
+    """Stop tracing and write out the traces still queued"""
+    exporter = TRACER.exporter
+    TRACER.configure(None)
+    if exporter is not None:
+        exporter.shutdown()
+
+class TraceIdFilter(logging.Filter):
+    """Stamps log records with the current trace and span ids, so logs and traces can be joined"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        span = _current_span.get()
+        if span is not None:
+            record.trace_id = span.trace_id
+            record.span_id = span.span_id
+        return True
@@ -1,50 +1,207 @@
+import asyncio
 import chromadb
 from chromadb.config import Settings
 from chromadb.utils import embedding_functions
 import uuid
 import logging
+import os
+import time
 from typing import List, Dict, Any, Optional
-import hashlib
+
+from .document_catalog import DocumentCatalog
+from .embeddings import create_embedding_function
+from .metrics import DOCUMENTS_INDEXED, CHUNKS_INDEXED, CHUNKS_RETRIEVED
+from .tracing import stage
 
 logger = logging.getLogger(__name__)
 
+# Chunks only carry the keys needed to find their document; everything else
+# about a document lives once in the catalog and is joined in at read time
+CHUNK_SCHEMA_VERSION = "2"
+CHUNK_METADATA_KEYS = ("document_id", "chunk_index")
+
+DEFAULT_COLLECTION_NAME = "multimodal_rag_docs"
+WARM_UP_QUERY = "warm-up query"
+
+# Cosine distance, so 1 - distance is the cosine similarity the NumPy backend scores with
+COLLECTION_METADATA = {"description": "Multimodal RAG documents", "hnsw:space": "cosine"}
+
 class VectorStore:
-    def __init__(self):
+    def __init__(self, embedding_function=None, collection_name: str = DEFAULT_COLLECTION_NAME,
+                 catalog: Optional[DocumentCatalog] = None, shard_id: Optional[int] = None,
+                 memory_limit_bytes: int = 0):
         self.client = None
         self.collection = None
-        self.collection_name = "multimodal_rag_docs"
+        self.collection_name = collection_name
+        self.persist_directory = "./vector_db"
+        self.embedding_function = embedding_function
+        self.shard_id = shard_id
+        self.memory_limit_bytes = memory_limit_bytes
+        self.l2_distances = False
+        if collection_name == DEFAULT_COLLECTION_NAME:
+            catalog_path = os.path.join(self.persist_directory, "document_catalog.sqlite3")
+        else:
+            catalog_path = os.path.join(self.persist_directory, "catalogs", f"{collection_name}.sqlite3")
+        self.catalog = catalog or DocumentCatalog(catalog_path)
     
     async def initialize(self):
         """Initialize ChromaDB client and collection"""
         try:
+            self._resolve_embedding_function()
+            client_settings = {"allow_reset": True}
+            if self.memory_limit_bytes:
+                # Let Chroma evict HNSW segments of idle collections instead of keeping every index loaded
+                client_settings["chroma_segment_cache_policy"] = "LRU"
+                client_settings["chroma_memory_limit_bytes"] = self.memory_limit_bytes
             self.client = chromadb.PersistentClient(
-                path="./vector_db",
-                settings=Settings(allow_reset=True)
+                path=self.persist_directory,
+                settings=Settings(**client_settings)
             )
             
             # Get or create collection
+            collection_options = {}
+            if self.embedding_function is not None:
+                collection_options["embedding_function"] = self.embedding_function
             try:
-                self.collection = self.client.get_collection(self.collection_name)
+                self.collection = self.client.get_collection(self.collection_name, **collection_options)
                 logger.info(f"Loaded existing collection: {self.collection_name}")
             except:
                 self.collection = self.client.create_collection(
                     name=self.collection_name,
-                    metadata={"description": "Multimodal RAG documents"}
+                    metadata=COLLECTION_METADATA,
+                    **collection_options
                 )
                 logger.info(f"Created new collection: {self.collection_name}")
+            # Collections created before cosine became the default may measure squared L2 distance
+            self.l2_distances = self._distance_space() == "l2"
+            
+            self._initialize_catalog()
                 
         except Exception as e:
             logger.error(f"Failed to initialize ChromaDB: {e}")
             raise
     
-    async def add_document(self, content: str, metadata: Dict[str, Any]) -> str:
-        """Add a document to the vector store"""
+    def _resolve_embedding_function(self):
+        """Use the embedding model recorded for this collection when none was passed in"""
+        self.catalog.initialize()
+        if self.embedding_function is None:
+            # Chroma's default model unless the collection was re-embedded with another one
+            self.embedding_function = create_embedding_function(self.catalog.get_meta("embedding_model"))
+    
+    def _initialize_catalog(self):
+        """Open the catalog and reconcile it with the chunk collection"""
+        self.catalog.initialize()
+        if self.collection.count() == 0 and self.catalog.count() == 0:
+            self.catalog.set_meta("chunk_schema_version", CHUNK_SCHEMA_VERSION)
+        elif self.catalog.count() == 0:
+            self._backfill_catalog()
+        
+        if self.catalog.get_meta("chunk_schema_version") != CHUNK_SCHEMA_VERSION:
+            logger.warning(
+                "Collection still uses the legacy per-chunk metadata schema; "
+                "run `python -m backend.tools.migrate_chunk_metadata` to compact it"
+            )
+    
+    def _backfill_catalog(self, batch_size: int = 1000):
+        """Add catalog rows for documents that only exist as legacy chunk metadata"""
+        documents = {}
+        offset = 0
+        while True:
+            results = self.collection.get(include=["metadatas", "documents"], limit=batch_size, offset=offset)
+            if not results['ids']:
+                break
+            offset += len(results['ids'])
+            
+            for metadata, chunk in zip(results['metadatas'], results['documents']):
+                doc_id = metadata.get('document_id') if metadata else None
+                if not doc_id:
+                    continue
+                if doc_id not in documents:
+                    documents[doc_id] = {
+                        "document_id": doc_id,
+                        "filename": metadata.get('filename', 'Unknown'),
+                        "file_type": metadata.get('file_type', 'Unknown'),
+                        "file_size": metadata.get('file_size', 0),
+                        "upload_time": metadata.get('upload_time'),
+                        "content_length": 0,
+                        "chunk_count": 0,
+                        "shard": self.shard_id
+                    }
+                documents[doc_id]["chunk_count"] += 1
+                documents[doc_id]["content_length"] += len(chunk or "")
+        
+        catalogued = self.catalog.get_many(list(documents.keys()))
+        missing = [document for doc_id, document in documents.items() if doc_id not in catalogued]
+        for document in missing:
+            self.catalog.upsert(document)
+        
+        logger.info(f"Backfilled document catalog with {len(missing)} documents")
+    
+    def migrate_chunk_metadata(self, batch_size: int = 1000) -> int:
+        """Rewrite legacy chunk metadata to the compact schema.
+        
+        Document attributes are first copied into the catalog, then every chunk
+        is updated in batches to keep only CHUNK_METADATA_KEYS. Safe to re-run
+        after an interruption. Returns the number of chunks rewritten.
+        """
+        self._backfill_catalog(batch_size=batch_size)
+        
+        chunk_ids = self.collection.get(include=[])['ids']
+        migrated = 0
+        for start in range(0, len(chunk_ids), batch_size):
+            batch = self.collection.get(ids=chunk_ids[start:start + batch_size], include=["metadatas"])
+            
+            ids = []
+            metadatas = []
+            for chunk_id, metadata in zip(batch['ids'], batch['metadatas']):
+                stale_keys = [key for key in (metadata or {}) if key not in CHUNK_METADATA_KEYS]
+                if not stale_keys:
+                    continue
+                # Chroma merges metadata on update; None removes a key
+                ids.append(chunk_id)
+                metadatas.append({
+                    **{key: None for key in stale_keys},
+                    "document_id": metadata.get('document_id'),
+                    "chunk_index": metadata.get('chunk_index', 0)
+                })
+            
+            if ids:
+                self.collection.update(ids=ids, metadatas=metadatas)
+                migrated += len(ids)
+            logger.info(f"Migrated chunk metadata: {min(start + batch_size, len(chunk_ids))}/{len(chunk_ids)}")
+        
+        self.catalog.set_meta("chunk_schema_version", CHUNK_SCHEMA_VERSION)
+        return migrated
+    
+    async def add_document(self, content: str, metadata: Dict[str, Any],
+                           processing_seconds: Optional[float] = None,
+                           document_id: Optional[str] = None,
+                           chunks: Optional[List[str]] = None,
+                           embeddings: Optional[List[List[float]]] = None) -> str:
+        """Add a document to the vector store.
+        
+        ``chunks`` stores already split text as-is instead of splitting
+        ``content``, for documents copied from another collection, and
+        ``embeddings`` skips embedding them again. Splitting, embedding and
+        writing run on a thread, so searches keep being served meanwhile.
+        """
+        return await asyncio.to_thread(self._insert, content, metadata, processing_seconds, document_id,
+                                       chunks, embeddings)
+    
+    def _insert(self, content: str, metadata: Dict[str, Any], processing_seconds: Optional[float] = None,
+                document_id: Optional[str] = None, chunks: Optional[List[str]] = None,
+                embeddings: Optional[List[List[float]]] = None) -> str:
         try:
+            start_time = time.perf_counter()
+            
             # Generate unique ID
-            document_id = str(uuid.uuid4())
+            document_id = document_id or str(uuid.uuid4())
             
             # Split content into chunks if it's too long
-            chunks = self._split_content(content)
+            if chunks is None:
+                with stage("upload", "chunk", characters=len(content)) as span:
+                    chunks = self._split_content(content)
+                    span.set_attribute("chunks", len(chunks))
             
             # Add each chunk to the collection
             chunk_ids = []
@@ -54,25 +211,42 @@ class VectorStore:
             for i, chunk in enumerate(chunks):
                 chunk_id = f"{document_id}_chunk_{i}"
                 chunk_metadata = {
-                    **metadata,
                     "document_id": document_id,
-                    "chunk_index": i,
-                    "total_chunks": len(chunks),
-                    # Ensure filename is preserved in multiple formats
-                    "filename": metadata.get('filename', metadata.get('source', 'Unknown')),
-                    "source": metadata.get('filename', metadata.get('source', 'Unknown')),
-                    "file_name": metadata.get('filename', metadata.get('source', 'Unknown'))
+                    "chunk_index": i
                 }
                 
                 chunk_ids.append(chunk_id)
                 chunk_metadatas.append(chunk_metadata)
                 chunk_documents.append(chunk)
             
-            self.collection.add(
-                ids=chunk_ids,
-                documents=chunk_documents,
-                metadatas=chunk_metadatas
-            )
+            # Embedded here rather than inside the collection so the two stages are timed apart
+            if embeddings is None:
+                embeddings = self._embed(chunk_documents, pipeline="upload")
+            
+            with stage("upload", "insert", collection=self.collection_name, chunks=len(chunk_ids)):
+                self.collection.add(
+                    ids=chunk_ids,
+                    documents=chunk_documents,
+                    metadatas=chunk_metadatas,
+                    embeddings=embeddings
+                )
+            
+            with stage("upload", "catalog"):
+                self.catalog.upsert({
+                    "document_id": document_id,
+                    "filename": metadata.get('filename', metadata.get('source', 'Unknown')),
+                    "file_type": metadata.get('file_type', 'Unknown'),
+                    "file_size": metadata.get('file_size', 0),
+                    "upload_time": metadata.get('upload_time'),
+                    "content_length": len(content),
+                    "chunk_count": len(chunks),
+                    "processing_seconds": processing_seconds,
+                    "indexing_seconds": time.perf_counter() - start_time,
+                    "file_path": metadata.get('file_path'),
+                    "shard": self.shard_id
+                })
+            DOCUMENTS_INDEXED.inc()
+            CHUNKS_INDEXED.inc(len(chunks))
             
             logger.info(f"Added document {document_id} with {len(chunks)} chunks")
             return document_id
@@ -81,103 +255,215 @@ class VectorStore:
             logger.error(f"Error adding document to vector store: {e}")
             raise
     
-    async def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
-        """Search for relevant documents"""
+    async def search(self, query: str, limit: int = 5,
+                     query_embeddings: Optional[List[List[float]]] = None) -> List[Dict[str, Any]]:
+        """Search for relevant documents on a thread; ``query_embeddings`` skips embedding the query here"""
+        return await asyncio.to_thread(self._search, query, limit, query_embeddings)
+    
+    def _search(self, query: str, limit: int = 5,
+                query_embeddings: Optional[List[List[float]]] = None) -> List[Dict[str, Any]]:
         try:
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=limit,
-                include=["documents", "metadatas", "distances"]
-            )
+            if query_embeddings is None:
+                query_embeddings = self._embed([query], pipeline="query")
+            with stage("query", "search", collection=self.collection_name, limit=limit) as span:
+                results = self.collection.query(
+                    query_embeddings=query_embeddings,
+                    n_results=limit,
+                    include=["documents", "metadatas", "distances"]
+                )
+                span.set_attribute("chunks", len(results['documents'][0]) if results['documents'] else 0)
             
             if not results['documents'] or not results['documents'][0]:
                 return []
             
-            # Format results
-            formatted_results = []
-            for i in range(len(results['documents'][0])):
-                formatted_results.append({
-                    "content": results['documents'][0][i],
-                    "metadata": results['metadatas'][0][i],
-                    "score": 1.0 - results['distances'][0][i]  # Convert distance to similarity
-                })
-            
-            return formatted_results
+            return self._format_results(
+                results['documents'][0], results['metadatas'][0], results['distances'][0]
+            )
             
         except Exception as e:
             logger.error(f"Error searching vector store: {e}")
             raise
     
-    async def list_documents(self) -> List[Dict[str, Any]]:
-        """List all documents in the vector store"""
+    def _embed(self, texts: List[str], pipeline: str):
+        with stage(pipeline, "embed", texts=len(texts), characters=sum(len(text) for text in texts)):
+            return self.embedding_function(texts)
+    
+    async def warm_up(self, query_embeddings: Optional[List[List[float]]] = None):
+        """Load the embedding model and the index into memory with a dummy search.
+        
+        With ``query_embeddings`` only the index is loaded.
+        """
+        start_time = time.perf_counter()
+        await asyncio.to_thread(self._warm_up, query_embeddings)
+        logger.info(f"Warmed up collection {self.collection_name} in {time.perf_counter() - start_time:.2f}s")
+    
+    def _warm_up(self, query_embeddings=None):
+        # The first query embeds the text (loading the model) and loads the HNSW index
+        if query_embeddings is None:
+            self.collection.query(query_texts=[WARM_UP_QUERY], n_results=1, include=["distances"])
+        else:
+            self.collection.query(query_embeddings=query_embeddings, n_results=1, include=["distances"])
+    
+    def _format_results(self, documents: List[str], metadatas: List[Dict[str, Any]],
+                        distances: List[float]) -> List[Dict[str, Any]]:
+        """Join document attributes into raw query results"""
+        with stage("query", "join_metadata", chunks=len(documents)):
+            metadatas = self._join_document_metadata(metadatas)
+        CHUNKS_RETRIEVED.inc(len(documents))
+        
+        # Format results
+        formatted_results = []
+        for i in range(len(documents)):
+            formatted_results.append({
+                "content": documents[i],
+                "metadata": metadatas[i],
+                "score": 1.0 - self.cosine_distance(distances[i])
+            })
+        
+        return formatted_results
+    
+    def _distance_space(self) -> str:
+        """The HNSW space of the collection, from its configuration or, on older Chroma, its metadata"""
+        configuration = getattr(self.collection, "configuration_json", None) or {}
+        hnsw = configuration.get("hnsw") or configuration.get("hnsw_configuration") or {}
+        return hnsw.get("space") or (self.collection.metadata or {}).get("hnsw:space", "l2")
+
+    def cosine_distance(self, distance: float) -> float:
+        """Cosine distance for a distance returned by this store's collection"""
+        if self.l2_distances:
+            # For unit-length embeddings the squared L2 distance is 2 - 2 * cosine
+            return distance / 2.0
+        return distance
+
+    def _join_document_metadata(self, chunk_metadatas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Merge catalog document attributes into slim chunk metadata"""
+        doc_ids = {metadata.get('document_id') for metadata in chunk_metadatas if metadata}
+        documents = self.catalog.get_many([doc_id for doc_id in doc_ids if doc_id])
+        
+        joined = []
+        for metadata in chunk_metadatas:
+            metadata = metadata or {}
+            document = documents.get(metadata.get('document_id'))
+            if document:
+                metadata = {
+                    "filename": document['filename'],
+                    "file_type": document['file_type'],
+                    "file_size": document['file_size'],
+                    "upload_time": document['upload_time'],
+                    "total_chunks": document['chunk_count'],
+                    **metadata
+                }
+            joined.append(metadata)
+        return joined
+    
+    async def list_documents(self, limit: int = 50, offset: int = 0, sort_by: str = "upload_time",
+                             descending: bool = True) -> List[Dict[str, Any]]:
+        """List one page of documents from the document catalog"""
         try:
-            # Get all items from collection
-            results = self.collection.get(include=["metadatas"])
-            
-            # Group by document_id and get unique documents
-            documents = {}
-            for metadata in results['metadatas']:
-                doc_id = metadata.get('document_id')
-                if doc_id and doc_id not in documents:
-                    documents[doc_id] = {
-                        "document_id": doc_id,
-                        "filename": metadata.get('filename', 'Unknown'),
-                        "file_type": metadata.get('file_type', 'Unknown'),
-                        "upload_time": metadata.get('upload_time', 'Unknown'),
-                        "total_chunks": metadata.get('total_chunks', 1)
-                    }
+            rows = await asyncio.to_thread(self.catalog.list, limit=limit, offset=offset, sort_by=sort_by,
+                                           descending=descending)
             
-            return list(documents.values())
+            return [
+                {
+                    **row,
+                    "upload_time": row.get('upload_time') or 'Unknown',
+                    "total_chunks": row['chunk_count']
+                }
+                for row in rows
+            ]
             
         except Exception as e:
             logger.error(f"Error listing documents: {e}")
             raise
     
-    # Improve delete_document method with better search
-    def delete_document(self, document_id: str):
+    def count_documents(self) -> int:
+        """Return the number of documents in the document catalog"""
+        return self.catalog.count()
+    
+    def delete_document(self, document_id: str) -> bool:
         """Delete a document from the vector store by its ID"""
+        return bool(self.delete_documents([document_id]))
+    
+    def delete_documents(self, document_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Delete several documents with a single collection call.
+        
+        Chunk ids are derived from the catalog's chunk counts, so the cost is
+        proportional to the chunks being removed rather than to the corpus.
+        Returns the catalog rows of the documents that were deleted.
+        """
         try:
-            # Try multiple search patterns for the document
-            search_patterns = [
-                {"source": document_id},  # Exact match
-            ]
+            document_ids = list(dict.fromkeys(document_ids))
+            documents = self.catalog.get_many(document_ids)
             
-            deleted_count = 0
-            for pattern in search_patterns:
-                try:
-                    results = self.collection.get(where=pattern)
-                    if results and results['ids']:
-                        self.collection.delete(ids=results['ids'])
-                        deleted_count += len(results['ids'])
-                        logger.info(f"Deleted {len(results['ids'])} chunks for pattern {pattern}")
-                        break  # Stop after first successful match
-                except Exception as pattern_error:
-                    logger.debug(f"Pattern {pattern} failed: {pattern_error}")
-                    continue
+            chunk_ids = []
+            for document_id, document in documents.items():
+                chunk_ids.extend(self._chunk_ids(document_id, document['chunk_count']))
             
-            if deleted_count == 0:
-                # Try to find any documents that might match by filename
-                all_docs = self.collection.get()
-                matching_ids = []
-                if all_docs and all_docs['metadatas']:
-                    for i, metadata in enumerate(all_docs['metadatas']):
-                        if metadata and isinstance(metadata, dict):
-                            source = metadata.get('source', '')
-                            if document_id in source or source in document_id:
-                                matching_ids.append(all_docs['ids'][i])
-                
-                if matching_ids:
-                    self.collection.delete(ids=matching_ids)
-                    deleted_count = len(matching_ids)
-                    logger.info(f"Deleted {deleted_count} chunks by metadata search")
-                else:
-                    logger.warning(f"No documents found with ID {document_id}")
+            # Documents missing from the catalog are looked up through the
+            # indexed document_id metadata field instead
+            uncatalogued = [doc_id for doc_id in document_ids if doc_id not in documents]
+            if uncatalogued:
+                results = self.collection.get(
+                    where={"document_id": {"$in": uncatalogued}},
+                    include=["metadatas"]
+                )
+                for chunk_id, metadata in zip(results['ids'], results['metadatas']):
+                    chunk_ids.append(chunk_id)
+                    doc_id = metadata.get('document_id')
+                    documents.setdefault(doc_id, {"document_id": doc_id, "file_path": None})
+            
+            if not chunk_ids:
+                logger.warning(f"No documents found with IDs {document_ids}")
+                return {}
             
-            return deleted_count > 0
+            self.collection.delete(ids=chunk_ids)
+            self.catalog.delete_many(list(documents.keys()))
+            
+            logger.info(f"Deleted {len(documents)} documents ({len(chunk_ids)} chunks)")
+            return documents
             
         except Exception as e:
-            logger.error(f"Error deleting document {document_id}: {str(e)}")
-            return False
+            logger.error(f"Error deleting documents {document_ids}: {str(e)}")
+            raise
+    
+    def get_chunks(self, document_ids: List[str]) -> Dict[str, List[str]]:
+        """Return the stored chunk texts of several documents in chunk order, with one collection call"""
+        documents = self.catalog.get_many(document_ids)
+        chunk_ids = []
+        for document_id, document in documents.items():
+            chunk_ids.extend(self._chunk_ids(document_id, document['chunk_count']))
+        
+        chunks = {document_id: [] for document_id in documents}
+        if chunk_ids:
+            results = self.collection.get(ids=chunk_ids, include=["documents", "metadatas"])
+            for metadata, text in sorted(zip(results['metadatas'], results['documents']),
+                                         key=lambda item: item[0].get('chunk_index', 0)):
+                chunks[metadata['document_id']].append(text)
+        return chunks
+    
+    def is_file_referenced(self, file_path: str) -> bool:
+        """Return whether any remaining document was uploaded from the given file"""
+        return self.catalog.count_file_references(file_path) > 0
+    
+    @staticmethod
+    def _chunk_ids(document_id: str, chunk_count: int) -> List[str]:
+        return [f"{document_id}_chunk_{i}" for i in range(chunk_count)]
+    
+    def persist(self):
+        """Flush pending writes; Chroma's PersistentClient already writes through"""
+        pass
+    
+    def close(self):
+        """Release the collection handle and the catalog connection"""
+        self.collection = None
+        self.catalog.close()
+    
+    def drop(self):
+        """Delete the collection and its catalog for good"""
+        self.client.delete_collection(self.collection_name)
+        self.collection = None
+        self.catalog.drop()
+        logger.info(f"Dropped collection {self.collection_name}")
     
     def reset(self):
         """Reset the collection by deleting all documents"""
@@ -186,8 +472,12 @@ class VectorStore:
             self.client.delete_collection(self.collection_name)
             self.collection = self.client.create_collection(
                 name=self.collection_name,
-                embedding_function=embedding_functions.SentenceTransformerEmbeddingFunction()
+                metadata=COLLECTION_METADATA,
+                embedding_function=self.embedding_function or embedding_functions.SentenceTransformerEmbeddingFunction()
             )
+            self.l2_distances = False
+            self.catalog.clear()
+            self.catalog.set_meta("chunk_schema_version", CHUNK_SCHEMA_VERSION)
             logger.info("Vector store collection reset successfully")
         except Exception as e:
             logger.error(f"Error resetting vector store: {str(e)}")
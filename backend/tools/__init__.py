@@ -0,0 +1 @@
+# Tools init file
@@ -0,0 +1,54 @@
+"""Compact legacy chunk metadata into the catalog-backed schema.
+
+Usage:
+    python -m backend.tools.migrate_chunk_metadata [--batch-size 1000] [--tenant default]
+
+Older collections repeat filename, file type, size and upload time on every
+chunk. This copies those attributes into the document catalog once and
+strips them from the chunks, leaving only document_id and chunk_index.
+The migration is idempotent and can be re-run after an interruption. It
+works on the active version of the tenant's collection and opens its index
+files directly, so stop the API (or the index service) first.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+from ..config import get_settings
+from ..services.collection_versions import CollectionVersions, REGISTRY_PATH
+from ..services.store_factory import create_vector_store
+from ..services.tenant_stores import DEFAULT_TENANT, tenant_collection_name
+
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate chunk metadata to the compact schema")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Chunks rewritten per update call")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT, help="Tenant whose collection to process")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    settings = get_settings()
+    if settings.vector_store_url:
+        logger.error("This tool opens the index files itself; run it on the index host without "
+                     "VECTOR_STORE_URL, with the index service stopped")
+        sys.exit(1)
+
+    registry = CollectionVersions(REGISTRY_PATH)
+    registry.initialize()
+    collection_name = registry.active_collection(tenant_collection_name(args.tenant))
+    registry.close()
+    logger.info(f"Processing {collection_name}")
+
+    vector_store = create_vector_store(settings, collection_name=collection_name)
+    asyncio.run(vector_store.initialize())
+
+    start_time = time.perf_counter()
+    migrated = vector_store.migrate_chunk_metadata(batch_size=args.batch_size)
+    logger.info(f"Rewrote metadata for {migrated} chunks in {time.perf_counter() - start_time:.1f}s")
+
+if __name__ == "__main__":
+    main()
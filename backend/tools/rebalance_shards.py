@@ -0,0 +1,65 @@
+"""Move documents onto the shard their id hashes to.
+
+Usage:
+    VECTOR_SHARDS=4 python -m backend.tools.rebalance_shards [--batch-size 500] [--tenant default]
+
+Run after raising VECTOR_SHARDS (or after first enabling sharding on an
+existing collection). Jump consistent hashing means growing from n to n + 1
+shards moves only about 1 / (n + 1) of the documents. Chunks are copied
+with their stored embeddings, so nothing is re-embedded. The tool is safe
+to interrupt and re-run. It works on the active version of the tenant's
+collection and opens its index files directly, so stop the API (or the
+index service) first: a running server would not see the moved chunks,
+and two processes writing one Chroma index can corrupt it.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+from ..config import get_settings
+from ..services.collection_versions import CollectionVersions, REGISTRY_PATH
+from ..services.store_factory import create_vector_store
+from ..services.tenant_stores import DEFAULT_TENANT, tenant_collection_name
+from ..services.sharded_vector_store import ShardedVectorStore
+
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebalance documents across vector store shards")
+    parser.add_argument("--batch-size", type=int, default=500, help="Catalog rows scanned per page")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT, help="Tenant whose collection to process")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    settings = get_settings()
+    if settings.vector_store_url:
+        logger.error("This tool opens the index files itself; run it on the index host without "
+                     "VECTOR_STORE_URL, with the index service stopped")
+        sys.exit(1)
+
+    registry = CollectionVersions(REGISTRY_PATH)
+    registry.initialize()
+    collection_name = registry.active_collection(tenant_collection_name(args.tenant))
+    registry.close()
+    logger.info(f"Processing {collection_name}")
+
+    vector_store = create_vector_store(settings, collection_name=collection_name)
+    if not isinstance(vector_store, ShardedVectorStore):
+        logger.error("Sharding is disabled; set VECTOR_SHARDS to 2 or more")
+        sys.exit(1)
+
+    asyncio.run(vector_store.initialize())
+
+    start_time = time.perf_counter()
+    summary = vector_store.rebalance(batch_size=args.batch_size)
+    vector_store.persist()
+    logger.info(
+        f"Rebalanced {summary['moved_documents']} of {summary['scanned']} documents "
+        f"({summary['moved_chunks']} chunks) in {time.perf_counter() - start_time:.1f}s"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""Re-embed every stored chunk of a collection into a new collection version.
+
+Usage:
+    python -m backend.tools.reembed_collection --model all-mpnet-base-v2 [--tenant default]
+        [--workers 4] [--batch-size 256] [--activate]
+    python -m backend.tools.reembed_collection --resume-version 3 [--tenant default]
+
+Chunk texts are read from the serving collection one catalog page at a
+time and embedded in batches on a pool of worker processes, each holding
+its own copy of the model. Chunks and embeddings are written into a new
+collection version (see /collections/versions), so the serving collection
+is untouched until the new version is activated. Progress is
+checkpointed to vector_db/reembed_checkpoints/<collection>.json; after a
+crash, re-run with --resume-version to continue where it stopped.
+
+Without VECTOR_STORE_URL the tool opens the index files directly, so stop
+the API first. With it set, the collections and the version registry are
+those of the index service and the API keeps serving: uploads and deletes
+made meanwhile are reconciled before the version is marked ready, and the
+service runs the last pass and the swap while holding back the writes of
+every API worker.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from typing import Any, Dict, List
+
+import numpy as np
+
+from ..config import get_settings
+from ..services.collection_versions import VersionConflictError, build_collection_version, copy_document
+from ..services.embeddings import DEFAULT_EMBEDDING_MODEL, create_embedding_function
+from ..services.store_factory import (create_vector_store, create_collection_versions, get_index_client,
+                                      close_index_client)
+from ..services.remote_vector_store import RemoteVersionBuilds
+from ..services.tenant_stores import DEFAULT_TENANT, tenant_collection_name
+from ..services.vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIRECTORY = os.path.join("vector_db", "reembed_checkpoints")
+
+_worker_embedding_function = None
+
+def _init_worker(model_name: str, threads: int):
+    global _worker_embedding_function
+    # Keep each worker's math library from starting a thread per core
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    _worker_embedding_function = create_embedding_function(model_name)
+
+def _embed_batch(texts: List[str]) -> np.ndarray:
+    return np.asarray(_worker_embedding_function(texts), dtype=np.float32)
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+def save_checkpoint(path: str, state: Dict[str, Any]):
+    """Write the checkpoint atomically so a crash never leaves a torn file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+class ReembedJob:
+    """Streams documents from ``source`` through the worker pool into ``target``.
+
+    ``state["after"]`` is a watermark: every document id up to it has been
+    written. Documents are submitted in id order but finish out of order,
+    so the watermark only advances over a contiguous completed prefix.
+    Documents between the watermark and ``state["submitted"]`` may have
+    been half written before a crash and are cleared before being redone.
+    """
+
+    def __init__(self, source: VectorStore, target: VectorStore, pool: ProcessPoolExecutor,
+                 state: Dict[str, Any], checkpoint_path: str, batch_size: int, page_size: int,
+                 max_pending: int, checkpoint_seconds: float):
+        self.source = source
+        self.target = target
+        self.pool = pool
+        self.state = state
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.max_pending = max_pending
+        self.checkpoint_seconds = checkpoint_seconds
+        self._pending = {}
+        self._order = deque()
+        self._completed = set()
+        self._batch_documents = []
+        self._batch_chunks = []
+        self._resume_after = state["after"]
+        self._resume_submitted = state["submitted"]
+        self._total_chunks = source.catalog.count_chunks()
+        self._start_time = time.perf_counter()
+        self._start_chunks = state["chunks"]
+        self._last_checkpoint = time.perf_counter()
+
+    async def run(self):
+        after = self.state["after"]
+        while True:
+            page = self.source.catalog.list_document_shards(after=after, limit=self.page_size)
+            if not page:
+                break
+            after = page[-1]["document_id"]
+            await self._submit_page([row["document_id"] for row in page])
+
+        await self._flush_batch()
+        while self._pending:
+            await self._drain(asyncio.ALL_COMPLETED)
+        self._checkpoint()
+        self._report()
+
+    async def _submit_page(self, document_ids: List[str]):
+        documents = self.source.catalog.get_many(document_ids)
+        written = self.target.catalog.get_many(document_ids)
+        chunks = self.source.get_chunks(document_ids)
+
+        for document_id in document_ids:
+            self._order.append(document_id)
+            if document_id in written:
+                # Finished by an interrupted run after its last checkpoint
+                self._completed.add(document_id)
+                self.state["documents"] += 1
+                self.state["chunks"] += written[document_id]["chunk_count"]
+                continue
+            if document_id not in documents:
+                self._completed.add(document_id)
+                continue
+            if self._resume_after < document_id <= self._resume_submitted:
+                # May hold a partial copy from the interrupted run
+                self.target.delete_documents([document_id])
+
+            document_chunks = chunks.get(document_id, [])
+            if not document_chunks:
+                await self._write(documents[document_id], [], None)
+                continue
+
+            self._batch_documents.append(documents[document_id])
+            self._batch_chunks.append(document_chunks)
+            if sum(len(texts) for texts in self._batch_chunks) >= self.batch_size:
+                await self._flush_batch()
+
+    async def _flush_batch(self):
+        if not self._batch_documents:
+            return
+        while len(self._pending) >= self.max_pending:
+            await self._drain(asyncio.FIRST_COMPLETED)
+
+        texts = [text for texts in self._batch_chunks for text in texts]
+        future = asyncio.get_running_loop().run_in_executor(self.pool, _embed_batch, texts)
+        self._pending[future] = (self._batch_documents, self._batch_chunks)
+        self.state["submitted"] = max(self.state["submitted"], self._batch_documents[-1]["document_id"])
+        # Record the batch before any of it is written, so a resume knows to clear partial copies
+        save_checkpoint(self.checkpoint_path, self.state)
+        self._batch_documents, self._batch_chunks = [], []
+
+    async def _drain(self, return_when):
+        done, _ = await asyncio.wait(self._pending.keys(), return_when=return_when)
+        for future in done:
+            documents, chunk_lists = self._pending.pop(future)
+            embeddings = future.result()
+            offset = 0
+            for document, chunks in zip(documents, chunk_lists):
+                await self._write(document, chunks, list(embeddings[offset:offset + len(chunks)]))
+                offset += len(chunks)
+
+        if time.perf_counter() - self._last_checkpoint >= self.checkpoint_seconds:
+            self._checkpoint()
+            self._report()
+
+    async def _write(self, document: Dict[str, Any], chunks: List[str], embeddings):
+        await copy_document(self.target, document, chunks, embeddings)
+        self._completed.add(document["document_id"])
+        self.state["documents"] += 1
+        self.state["chunks"] += len(chunks)
+
+    def _checkpoint(self):
+        while self._order and self._order[0] in self._completed:
+            document_id = self._order.popleft()
+            self._completed.discard(document_id)
+            self.state["after"] = document_id
+        self.state["elapsed_seconds"] += time.perf_counter() - self._last_checkpoint
+        self._last_checkpoint = time.perf_counter()
+        self.target.persist()
+        save_checkpoint(self.checkpoint_path, self.state)
+
+    def _report(self):
+        done = self.state["chunks"]
+        elapsed = time.perf_counter() - self._start_time
+        rate = (done - self._start_chunks) / elapsed if elapsed > 0 else 0.0
+        remaining = max(self._total_chunks - done, 0)
+        eta = timedelta(seconds=int(remaining / rate)) if rate > 0 else "unknown"
+        percent = 100.0 * done / self._total_chunks if self._total_chunks else 100.0
+        logger.info(
+            f"Re-embedded {done}/{self._total_chunks} chunks ({percent:.1f}%) "
+            f"in {self.state['documents']} documents, {rate:.0f} chunks/s, ETA {eta}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed a collection into a new collection version")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT, help="Tenant whose collection to re-embed")
+    parser.add_argument("--model", default=DEFAULT_EMBEDDING_MODEL,
+                        help="sentence-transformers model name, or 'default' for Chroma's built-in model")
+    parser.add_argument("--resume-version", type=int, help="Continue an interrupted run into this version")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Embedding processes")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks per embedding batch")
+    parser.add_argument("--page-size", type=int, default=1000, help="Documents read per catalog page")
+    parser.add_argument("--checkpoint-seconds", type=float, default=10.0, help="Seconds between checkpoints")
+    parser.add_argument("--activate", action="store_true", help="Make the new version serve queries when done")
+    parser.add_argument("--source-quantization",
+                        help="NUMPY_QUANTIZATION the serving collection was built with, when moving to another one")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # Otherwise every index service call is logged
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    settings = get_settings()
+    if args.source_quantization and settings.vector_store_url:
+        logger.error("--source-quantization opens the index files itself; run it on the index host "
+                     "without VECTOR_STORE_URL")
+        sys.exit(1)
+    asyncio.run(reembed(args, settings))
+
+async def reembed(args: argparse.Namespace, settings):
+    alias = tenant_collection_name(args.tenant)
+    registry = create_collection_versions(settings)
+    registry.initialize()
+    try:
+        await _reembed(args, settings, alias, registry)
+    finally:
+        await close_index_client()
+
+async def _reembed(args: argparse.Namespace, settings, alias: str, registry):
+    if args.resume_version is not None:
+        version = registry.get_version(alias, args.resume_version)
+        if version is None or version["status"] != "building":
+            logger.error(f"Version {args.resume_version} of {alias} is not an unfinished build")
+            sys.exit(1)
+        checkpoint_path = os.path.join(CHECKPOINT_DIRECTORY, f"{version['collection_name']}.json")
+        state = load_checkpoint(checkpoint_path)
+        logger.info(f"Resuming {version['collection_name']} after document {state['after'] or '(start)'}")
+    else:
+        source_collection = registry.active_collection(alias)
+        version = registry.create_version(alias, description=f"Re-embedded with {args.model}")
+        checkpoint_path = os.path.join(CHECKPOINT_DIRECTORY, f"{version['collection_name']}.json")
+        state = {
+            "alias": alias,
+            "version": version["version"],
+            "source_collection": source_collection,
+            "target_collection": version["collection_name"],
+            "model": args.model,
+            "source_quantization": args.source_quantization,
+            "after": "",
+            "submitted": "",
+            "documents": 0,
+            "chunks": 0,
+            "elapsed_seconds": 0.0,
+        }
+        save_checkpoint(checkpoint_path, state)
+
+    source_settings = settings
+    if state.get("source_quantization"):
+        source_settings = settings.model_copy(update={"numpy_quantization": state["source_quantization"]})
+    source = create_vector_store(source_settings, collection_name=state["source_collection"])
+    target = create_vector_store(settings, embedding_function=create_embedding_function(state["model"]),
+                                 collection_name=state["target_collection"])
+    await source.initialize()
+    await target.initialize()
+    target.catalog.set_meta("embedding_model", state["model"])
+
+    workers = max(1, args.workers)
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(state["model"], max(1, (os.cpu_count() or 1) // workers))
+    )
+    job = ReembedJob(source, target, pool, state, checkpoint_path, batch_size=args.batch_size,
+                     page_size=args.page_size, max_pending=workers * 2,
+                     checkpoint_seconds=args.checkpoint_seconds)
+    try:
+        await job.run()
+    finally:
+        pool.shutdown()
+
+    if settings.vector_store_url:
+        await _finish_in_service(args, settings, alias, registry, state)
+        return
+
+    # Documents uploaded or deleted between an interrupted run and its resume; these few are embedded here
+    await build_collection_version(source, target)
+    target.persist()
+    registry.set_status(alias, state["version"], "ready")
+    logger.info(
+        f"Re-embedded {state['chunks']} chunks of {state['documents']} documents into "
+        f"{state['target_collection']} in {state['elapsed_seconds']:.1f}s"
+    )
+    if args.activate:
+        registry.activate(alias, state["version"])
+
+async def _finish_in_service(args: argparse.Namespace, settings, alias: str, registry, state: Dict[str, Any]):
+    """Have the index service reconcile the new version and swap it in, then wait for it"""
+    builds = RemoteVersionBuilds(get_index_client(settings))
+    try:
+        await builds.start(alias, activate=args.activate, version=state["version"], model_name=state["model"])
+    except VersionConflictError as e:
+        logger.error(f"{e}; re-run with --resume-version {state['version']} once it has finished")
+        sys.exit(1)
+    while await builds.building(alias):
+        await asyncio.sleep(1.0)
+    version = registry.get_version(alias, state["version"])
+    if version["status"] not in ("ready", "active"):
+        logger.error(f"The index service could not finish {state['target_collection']}; see its log")
+        sys.exit(1)
+    logger.info(
+        f"Re-embedded {state['chunks']} chunks of {state['documents']} documents into "
+        f"{state['target_collection']} in {state['elapsed_seconds']:.1f}s; it is now {version['status']}"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Microbenchmarks of the hot paths of indexing and answering, with regression checks.
+
+Usage:
+    python -m benchmarks.bench_micro --sizes 1000,10000,100000 --output bench.json
+    python -m benchmarks.bench_micro --sizes 1000,10000,100000 --baseline bench.json --threshold 0.1
+
+Times, in-process and without any server, Gemini call or embedding model:
+
+- ``VectorStore._split_content`` on documents of 10k, 100k and 1M characters
+- ``LLMService._format_context`` and ``_calculate_confidence`` on 5, 20
+  and 100 retrieved chunks
+- ``VectorStore.list_documents`` (first page, last page, sorted by
+  filename), ``count_documents`` and ``search`` on synthetic corpora of
+  each --sizes chunk count, up to 1M
+
+Corpora are generated by the real indexing path (``add_document`` with
+chunks and embeddings precomputed) into the backend picked by
+VECTOR_BACKEND/VECTOR_SHARDS, from a pool of synthetic chunk texts whose
+word-hashing embeddings get a little noise per chunk. Building the large
+ones takes minutes; pass --corpus-dir to keep them and reuse them in later
+runs. Each case is calibrated to run for about --min-time seconds, and the
+median and best per-call times of --repeat runs are reported. With
+--baseline, every case whose best time (--statistic) is slower than the
+baseline's by more than --threshold is flagged as a regression, and the
+exit status is 1.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List
+
+import numpy as np
+
+from benchmarks.load_test import REPO_ROOT, HashEmbeddingFunction, fake_llm_service, synthetic_text, vocabulary
+
+TEXT_POOL_SIZE = 2000
+PAGE_SIZE = 50
+
+def measure(fn: Callable[[], Any], min_time: float, repeat: int) -> Dict[str, Any]:
+    """Median and best per-call time of ``fn`` in microseconds"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        if time.perf_counter() - start >= min_time / repeat:
+            break
+        loops *= 2
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        runs.append((time.perf_counter() - start) / loops * 1e6)
+    return {"median_us": round(statistics.median(runs), 3), "min_us": round(min(runs), 3), "loops": loops}
+
+def measure_async(loop: asyncio.AbstractEventLoop, coro_fn: Callable[[], Awaitable[Any]], min_time: float,
+                  repeat: int) -> Dict[str, Any]:
+    """``measure`` for coroutines; each batch of calls runs inside one event loop turn"""
+
+    async def batch(loops: int) -> float:
+        start = time.perf_counter()
+        for _ in range(loops):
+            await coro_fn()
+        return time.perf_counter() - start
+
+    loops = 1
+    while loop.run_until_complete(batch(loops)) < min_time / repeat:
+        loops *= 2
+    runs = [loop.run_until_complete(batch(loops)) / loops * 1e6 for _ in range(repeat)]
+    return {"median_us": round(statistics.median(runs), 3), "min_us": round(min(runs), 3), "loops": loops}
+
+def text_pool(words: List[str], seed: int = 0) -> List[str]:
+    """Distinct chunk-sized texts that corpora are assembled from"""
+    rng = random.Random(seed)
+    return [synthetic_text(rng, words, rng.randint(120, 180)) for _ in range(TEXT_POOL_SIZE)]
+
+def context_docs(pool: List[str], count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Search results as ``VectorStore.search`` returns them, spread over a few documents"""
+    rng = random.Random(seed)
+    return [
+        {
+            "content": rng.choice(pool),
+            "metadata": {"document_id": f"doc_{i % max(1, count // 3)}", "chunk_index": i,
+                         "filename": f"report_{i % max(1, count // 3)}.pdf", "file_type": "application/pdf"},
+            "score": rng.uniform(0.2, 0.9)
+        }
+        for i in range(count)
+    ]
+
+def build_corpus(store, pool: List[str], chunks: int, chunks_per_document: int, seed: int = 0):
+    """Index ``chunks`` chunks through ``add_document``, reusing pool texts and their embeddings"""
+    rng = np.random.default_rng(seed)
+    pool_embeddings = np.array(HashEmbeddingFunction()(pool), dtype=np.float32)
+    loop = asyncio.get_event_loop()
+    for start in range(0, chunks, chunks_per_document):
+        count = min(chunks_per_document, chunks - start)
+        picks = rng.integers(0, len(pool), count)
+        embeddings = pool_embeddings[picks] + 0.05 * rng.standard_normal((count, pool_embeddings.shape[1]),
+                                                                          dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        number = start // chunks_per_document
+        loop.run_until_complete(store.add_document(
+            content=" ".join(pool[i] for i in picks),
+            metadata={"filename": f"document_{number:07d}.pdf", "file_type": "application/pdf",
+                      "file_size": int(rng.integers(10_000, 5_000_000)),
+                      "upload_time": datetime.fromtimestamp(1_700_000_000 + number, timezone.utc).isoformat()},
+            document_id=f"doc_{number:07d}",
+            chunks=[pool[i] for i in picks],
+            embeddings=embeddings.tolist()
+        ))
+
+def open_corpus(size: int, args, pool: List[str]):
+    """Vector store holding a ``size``-chunk corpus, built on first use.
+
+    Every corpus is a collection of its own under ./vector_db, which is
+    where VectorStore keeps its data.
+    """
+    from backend.config import get_settings
+    from backend.services.store_factory import create_vector_store
+
+    settings = get_settings()
+    name = f"bench_{settings.vector_backend}_shards{settings.vector_shards}_{size}"
+    complete = os.path.join("vector_db", f"{name}.complete")
+    store = create_vector_store(settings, embedding_function=HashEmbeddingFunction(), collection_name=name)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(store.initialize())
+    if not os.path.exists(complete):
+        start = time.perf_counter()
+        build_corpus(store, pool, size, args.chunks_per_document)
+        store.persist()
+        open(complete, "w").close()
+        print(f"Built {name} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return store
+
+def function_cases(pool: List[str]) -> Dict[str, Callable[[], Any]]:
+    from backend.services.vector_store import VectorStore
+
+    cases = {}
+    splitter = VectorStore(collection_name="bench_split")
+    rng = random.Random(1)
+    for characters in (10_000, 100_000, 1_000_000):
+        document = ""
+        while len(document) < characters:
+            document += rng.choice(pool) + "\n\n"
+        cases[f"split_content/chars={characters}"] = (
+            lambda document=document[:characters]: splitter._split_content(document)
+        )
+
+    llm_service = fake_llm_service(0, 0)
+    for count in (5, 20, 100):
+        docs = context_docs(pool, count)
+        cases[f"format_context/chunks={count}"] = lambda docs=docs: llm_service._format_context(docs)
+        cases[f"calculate_confidence/chunks={count}"] = lambda docs=docs: llm_service._calculate_confidence(docs)
+    return cases
+
+def corpus_cases(store, size: int, k: int, words: List[str]) -> Dict[str, Callable[[], Any]]:
+    """Calls on a corpus of ``size`` chunks; coroutine functions are timed with ``measure_async``"""
+    last_page = max(0, store.count_documents() - PAGE_SIZE)
+    rng = random.Random(2)
+    queries = itertools.cycle([synthetic_text(rng, words, 8) for _ in range(200)])
+    return {
+        f"list_documents/chunks={size},page=first": lambda: store.list_documents(limit=PAGE_SIZE),
+        f"list_documents/chunks={size},page=last": lambda: store.list_documents(limit=PAGE_SIZE, offset=last_page),
+        f"list_documents/chunks={size},sort=filename":
+            lambda: store.list_documents(limit=PAGE_SIZE, sort_by="filename", descending=False),
+        f"count_documents/chunks={size}": store.count_documents,
+        f"search/chunks={size},k={k}": lambda: store.search(next(queries), limit=k),
+    }
+
+CORPUS_CASES = ("list_documents", "count_documents", "search")
+
+def run_cases(cases: Dict[str, Callable[[], Any]], prefixes, args) -> Dict[str, Dict[str, Any]]:
+    loop = asyncio.get_event_loop()
+    results = {}
+    for name, fn in cases.items():
+        if not name.startswith(prefixes):
+            continue
+        if name.startswith(("list_documents", "search")):
+            results[name] = measure_async(loop, fn, args.min_time, args.repeat)
+        else:
+            results[name] = measure(fn, args.min_time, args.repeat)
+        print(f"{name:<55} {results[name]['median_us']:>14.1f} us", file=sys.stderr)
+    return results
+
+def compare(cases: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], threshold: float,
+            statistic: str) -> List[Dict[str, Any]]:
+    """Cases slower than in the baseline by more than ``threshold``, as a fraction"""
+    regressions = []
+    for name, result in cases.items():
+        previous = baseline.get("cases", {}).get(name)
+        if previous is None:
+            continue
+        change = round(result[statistic] / previous[statistic] - 1, 4)
+        result["baseline_" + statistic] = previous[statistic]
+        result["change"] = change
+        if change > threshold:
+            regressions.append({"case": name, "baseline_us": previous[statistic], "us": result[statistic],
+                                "change": change})
+    return regressions
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks of chunking, context formatting, catalog and search")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated corpus chunk counts, up to 1000000")
+    parser.add_argument("--chunks-per-document", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5, help="Results per search")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Seconds to spend measuring each case")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="Comma-separated case name prefixes to run, e.g. search,split_content")
+    parser.add_argument("--corpus-dir", help="Keep generated corpora here and reuse them (default: temporary)")
+    parser.add_argument("--baseline", help="Earlier --output to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Slowdown flagged as a regression")
+    parser.add_argument("--statistic", choices=("min_us", "median_us"), default="min_us",
+                        help="Per-call time compared with the baseline; the best run is the least noisy")
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    args = parser.parse_args()
+
+    # Results go where the caller asked, even though the corpora are opened from their own directories
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    corpus_root = os.path.abspath(args.corpus_dir) if args.corpus_dir else tempfile.mkdtemp(prefix="bench_micro_")
+    os.makedirs(corpus_root, exist_ok=True)
+    os.environ.setdefault("GOOGLE_API_KEY", "bench")
+    prefixes = tuple(args.only.split(",")) if args.only else ("",)
+
+    words = vocabulary()
+    pool = text_pool(words)
+    cwd = os.getcwd()
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    try:
+        os.chdir(corpus_root)
+        cases = run_cases(function_cases(pool), prefixes, args)
+        if any(case.startswith(prefix) or prefix.startswith(case) for case in CORPUS_CASES for prefix in prefixes):
+            for size in (int(s) for s in args.sizes.split(",")):
+                store = open_corpus(size, args, pool)
+                cases.update(run_cases(corpus_cases(store, size, args.k, words), prefixes, args))
+                store.close()
+    finally:
+        os.chdir(cwd)
+        if not args.corpus_dir:
+            shutil.rmtree(corpus_root, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "backend": os.environ.get("VECTOR_BACKEND", "chroma"),
+        "shards": int(os.environ.get("VECTOR_SHARDS", "1")),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "cases": cases,
+    }
+    regressions = compare(cases, baseline, args.threshold, args.statistic) if baseline else []
+    if baseline:
+        report["baseline_commit"] = baseline.get("commit")
+        report["regressions"] = regressions
+
+    print(f"{'case':<55} {'median':>14} {'min':>14}")
+    for name, result in cases.items():
+        change = f"  {result['change']:+.1%}" if "change" in result else ""
+        print(f"{name:<55} {result['median_us']:>11.1f} us {result['min_us']:>11.1f} us{change}")
+    for regression in regressions:
+        print(f"REGRESSION {regression['case']}: {regression['baseline_us']:.1f} us -> "
+              f"{regression['us']:.1f} us ({regression['change']:+.1%})", file=sys.stderr)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Measure memory savings and recall of quantized NumPy vector storage.
+
+Usage:
+    python -m benchmarks.bench_quantization --size 200000 --k 10
+
+Builds one NumpyCollection per mode (unquantized float16, int8, pq) from the
+same synthetic embeddings. For each mode it reports RAM held for the first
+pass, query latency and recall@k against exact float32 search. Quantized
+modes rescore their shortlist against full-precision vectors on disk.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from backend.services.numpy_vector_store import NumpyCollection
+from benchmarks.bench_vector_backends import synthetic_batches, make_queries, time_queries, recall
+
+def exact_top_k(size: int, dim: int, queries: np.ndarray, k: int):
+    """Ground truth from a float32 brute-force scan over the generated data"""
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+    offset = 0
+    for ids, vectors in synthetic_batches(size, dim):
+        scores = queries @ vectors.T
+        best_scores = np.concatenate([best_scores, scores], axis=1)
+        best_ids = np.concatenate([best_ids, np.arange(offset, offset + len(ids))[None, :].repeat(len(queries), 0)], axis=1)
+        keep = np.argsort(-best_scores, axis=1)[:, :k]
+        best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        best_ids = np.take_along_axis(best_ids, keep, axis=1)
+        offset += len(ids)
+    return [[f"chunk_{i}" for i in row] for row in best_ids]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quantized vector storage")
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--modes", default="none,int8,pq")
+    parser.add_argument("--pq-subspaces", type=int, default=48)
+    parser.add_argument("--rescore-factor", type=int, default=8)
+    parser.add_argument("--output", help="Write the report as JSON to this path")
+    args = parser.parse_args()
+
+    queries = make_queries(args.queries, args.dim)
+    truth = exact_top_k(args.size, args.dim, queries, args.k)
+
+    reports = []
+    for mode in args.modes.split(","):
+        workdir = tempfile.mkdtemp(prefix="bench_quant_")
+        try:
+            collection = NumpyCollection(os.path.join(workdir, mode), embedding_function=None,
+                                         quantization=mode, pq_subspaces=args.pq_subspaces,
+                                         rescore_factor=args.rescore_factor)
+            collection.open()
+            start = time.perf_counter()
+            for ids, vectors in synthetic_batches(args.size, args.dim):
+                collection.add(ids=ids, embeddings=vectors, metadatas=[{}] * len(ids))
+            # Waits for a background training, or trains below the automatic threshold
+            collection.train(force=True)
+            build_seconds = time.perf_counter() - start
+
+            def query(vector, k):
+                return collection.query(query_embeddings=[vector], n_results=k, include=[])["ids"][0]
+
+            latency, results = time_queries(query, queries, args.k)
+            memory = collection.memory_usage()
+            report = {
+                "mode": mode,
+                "chunks": args.size,
+                "build_s": round(build_seconds, 2),
+                **latency,
+                "recall_at_k": recall(results, truth),
+                "resident_mb": round(memory["resident_bytes"] / 2**20, 1),
+                "float32_mb": round(memory["float32_equivalent_bytes"] / 2**20, 1),
+                "memory_saving": round(1 - memory["resident_bytes"] / memory["float32_equivalent_bytes"], 3),
+            }
+            collection.close()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        print(json.dumps(report))
+        reports.append(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Compare query latency of the Chroma and NumPy vector backends.
+
+Usage:
+    python -m benchmarks.bench_vector_backends --sizes 10000,100000,1000000
+
+Both backends are loaded with the same synthetic, clustered, L2-normalised
+embeddings (so no embedding model is involved) and queried through the
+collection API that VectorStore uses, with Chroma in the cosine space the
+app creates its collections in. Exact NumPy search is the ground
+truth for recall@k of the approximate indexes (Chroma HNSW, NumPy IVF).
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+
+from backend.services.numpy_vector_store import NumpyCollection
+from backend.services.vector_store import COLLECTION_METADATA
+
+BATCH_SIZE = 5000
+
+def synthetic_batches(size: int, dim: int, clusters: int = 256, seed: int = 0):
+    """Yield (ids, embeddings) batches drawn around random cluster centres"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    for start in range(0, size, BATCH_SIZE):
+        count = min(BATCH_SIZE, size - start)
+        labels = rng.integers(0, clusters, count)
+        vectors = centres[labels] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        yield [f"chunk_{start + i}" for i in range(count)], vectors
+
+def make_queries(count: int, dim: int, seed: int = 1) -> np.ndarray:
+    sample = next(synthetic_batches(count, dim, seed=0))[1]
+    rng = np.random.default_rng(seed)
+    queries = sample + 0.3 * rng.standard_normal(sample.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def time_queries(query_fn, queries: np.ndarray, k: int):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        ids = query_fn(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids)
+    latencies = np.array(latencies)
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "mean_ms": round(float(latencies.mean()), 3),
+    }, results
+
+def recall(results, truth):
+    hits = sum(len(set(found) & set(expected)) for found, expected in zip(results, truth))
+    return round(hits / sum(len(expected) for expected in truth), 4)
+
+def run_size(size: int, args, workdir: str):
+    report = {"chunks": size}
+    queries = make_queries(args.queries, args.dim)
+
+    def numpy_collection(name, ivf_lists=0):
+        collection = NumpyCollection(os.path.join(workdir, name), embedding_function=None,
+                                     ivf_lists=ivf_lists, ivf_probes=args.ivf_probes)
+        collection.open()
+        return collection
+
+    def query_numpy(collection):
+        return lambda query, k: collection.query(query_embeddings=[query], n_results=k, include=[])["ids"][0]
+
+    start = time.perf_counter()
+    exact = numpy_collection(f"numpy_{size}")
+    for ids, vectors in synthetic_batches(size, args.dim):
+        exact.add(ids=ids, embeddings=vectors, metadatas=[{}] * len(ids))
+    report["numpy_build_s"] = round(time.perf_counter() - start, 2)
+    report["numpy"], truth = time_queries(query_numpy(exact), queries, args.k)
+    report["numpy_disk_mb"] = round(os.path.getsize(exact.vectors_path) / 2**20, 1)
+
+    if args.ivf_lists:
+        start = time.perf_counter()
+        ivf = numpy_collection(f"ivf_{size}", ivf_lists=args.ivf_lists)
+        for ids, vectors in synthetic_batches(size, args.dim):
+            ivf.add(ids=ids, embeddings=vectors, metadatas=[{}] * len(ids))
+        # Waits for a background training, or trains below the automatic threshold
+        ivf.train(force=True)
+        report["numpy_ivf_build_s"] = round(time.perf_counter() - start, 2)
+        report["numpy_ivf"], results = time_queries(query_numpy(ivf), queries, args.k)
+        report["numpy_ivf"]["recall_at_k"] = recall(results, truth)
+        ivf.close()
+
+    if not args.skip_chroma:
+        client = chromadb.PersistentClient(path=os.path.join(workdir, f"chroma_{size}"),
+                                           settings=Settings(anonymized_telemetry=False))
+        collection = client.create_collection(name=f"bench_{size}", embedding_function=None,
+                                              metadata=COLLECTION_METADATA)
+        start = time.perf_counter()
+        for ids, vectors in synthetic_batches(size, args.dim):
+            collection.add(ids=ids, embeddings=vectors.tolist())
+        report["chroma_build_s"] = round(time.perf_counter() - start, 2)
+
+        def query_chroma(query, k):
+            return collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])["ids"][0]
+
+        report["chroma"], results = time_queries(query_chroma, queries, args.k)
+        report["chroma"]["recall_at_k"] = recall(results, truth)
+
+    exact.close()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Chroma vs NumPy vector backends")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated chunk counts")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension (all-MiniLM-L6-v2 is 384)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--ivf-lists", type=int, default=0, help="Also benchmark an IVF index with this many lists")
+    parser.add_argument("--ivf-probes", type=int, default=8)
+    parser.add_argument("--skip-chroma", action="store_true")
+    parser.add_argument("--output", help="Write the report as JSON to this path")
+    args = parser.parse_args()
+
+    reports = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        workdir = tempfile.mkdtemp(prefix="bench_vectors_")
+        try:
+            report = run_size(size, args, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        print(json.dumps(report))
+        reports.append(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+"""Load-test the API offline, with stand-ins for Gemini and the embedding model.
+
+Usage:
+    python -m benchmarks.load_test --duration 60 --concurrency 16
+    python -m benchmarks.load_test --mix query=6,query_stream=2,upload_pdf=1,upload_wav=1,documents=2 \
+        --llm-latency-ms 1500 --output load.json
+
+The app is started in a child process from a scratch working directory,
+so its vector_db/, uploads/ and logs/ never touch the real ones. In that
+process the Gemini client is replaced by a fake that answers after a
+configurable delay (streaming one piece every --llm-token-ms), and chunks
+are embedded by a deterministic word-hashing function instead of a model.
+Everything else (routing, middleware, PDF parsing, audio transcription
+when --vosk-model is given, chunking, the vector backend picked by
+VECTOR_BACKEND/VECTOR_SHARDS) is the real code. Synthetic PDFs and WAVs
+are uploaded first, then workers send a weighted mix of requests for
+--duration seconds and latency percentiles and throughput are reported
+per endpoint. Pass --url to drive an already running server instead.
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = "query=6,query_stream=2,upload_pdf=1,upload_wav=1,documents=2"
+
+class HashEmbeddingFunction(EmbeddingFunction[Documents]):
+    """Deterministic bag-of-words embedding: each word is hashed to a signed dimension.
+
+    Texts sharing words get similar vectors, so retrieval behaves
+    plausibly, and embedding costs microseconds instead of a model call.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def __call__(self, input: Documents) -> Embeddings:
+        embeddings = []
+        for text in input:
+            vector = np.zeros(self.dim, dtype=np.float32)
+            for word in re.findall(r"\w+", text.lower()):
+                digest = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+                vector[digest % self.dim] += 1.0 if digest >> 63 else -1.0
+            norm = np.linalg.norm(vector)
+            if norm == 0:
+                vector[0], norm = 1.0, 1.0
+            embeddings.append(vector / norm)
+        return embeddings
+
+    @staticmethod
+    def name() -> str:
+        return "load_test_hash"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {"dim": self.dim}
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "HashEmbeddingFunction":
+        return HashEmbeddingFunction(config.get("dim", 384))
+
+class FakeGeminiClient:
+    """Answers like GeminiClient after ``latency_ms``, streaming a piece every ``token_ms``"""
+
+    def __init__(self, latency_ms: float, token_ms: float, answer_words: int = 120):
+        self.model = "fake"
+        self.latency_ms = latency_ms
+        self.token_ms = token_ms
+        self.answer_words = answer_words
+
+    def _pieces(self, prompt: str) -> List[str]:
+        words = [f"answer{i}" for i in range(self.answer_words)]
+        return [" ".join(words[i:i + 4]) + " " for i in range(0, len(words), 4)]
+
+    def _usage(self, prompt: str, usage: Optional[Dict[str, int]]):
+        if usage is not None:
+            usage.update(prompt_tokens=len(prompt) // 4, output_tokens=self.answer_words,
+                         total_tokens=len(prompt) // 4 + self.answer_words)
+
+    async def generate_content(self, prompt: str, usage: Optional[Dict[str, int]] = None) -> str:
+        pieces = self._pieces(prompt)
+        await asyncio.sleep((self.latency_ms + len(pieces) * self.token_ms) / 1000)
+        self._usage(prompt, usage)
+        return "".join(pieces)
+
+    async def stream_content(self, prompt: str, usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+        await asyncio.sleep(self.latency_ms / 1000)
+        self._usage(prompt, usage)
+        for position, piece in enumerate(self._pieces(prompt)):
+            if position:
+                await asyncio.sleep(self.token_ms / 1000)
+            yield piece
+
+    async def get_model(self) -> Dict[str, Any]:
+        return {"name": "models/fake"}
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": 0, "waiting": 0, "retries": 0}
+
+    async def aclose(self):
+        pass
+
+def fake_llm_service(latency_ms: float, token_ms: float):
+    """LLMService with real prompt building and confidence scoring around a fake client"""
+    from backend.services.llm_service import LLMService
+
+    class FakeLLMService(LLMService):
+        def _initialize_gemini(self):
+            self.client = FakeGeminiClient(latency_ms, token_ms)
+
+    return FakeLLMService()
+
+def vocabulary(size: int = 400, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "do", "gu", "he", "ji", "qu", "we"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def synthetic_text(rng: random.Random, words: List[str], count: int) -> str:
+    sentences, sentence = [], []
+    for _ in range(count):
+        sentence.append(rng.choice(words))
+        if len(sentence) >= rng.randint(8, 16):
+            sentences.append(" ".join(sentence).capitalize() + ".")
+            sentence = []
+    if sentence:
+        sentences.append(" ".join(sentence).capitalize() + ".")
+    return " ".join(sentences)
+
+def synthetic_pdf(rng: random.Random, words: List[str], pages: int = 3, words_per_page: int = 400) -> bytes:
+    """A minimal valid PDF with one Helvetica text block per page"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for _ in range(pages):
+        text = synthetic_text(rng, words, words_per_page)
+        lines = [text[i:i + 90] for i in range(0, len(text), 90)]
+        stream = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(output.tell())
+        output.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = output.tell()
+    output.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        output.write(f"{offset:010d} 00000 n \n".encode())
+    output.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return output.getvalue()
+
+def synthetic_wav(rng: random.Random, seconds: float = 5.0, rate: int = 16000) -> bytes:
+    """16 kHz mono 16-bit tones with noise, the format the transcriber expects"""
+    noise = np.random.default_rng(rng.randrange(2 ** 32))
+    time_axis = np.arange(int(seconds * rate)) / rate
+    frequencies = np.array([rng.uniform(150, 900) for _ in range(max(1, int(seconds * 2)))])
+    tone = np.sin(2 * np.pi * frequencies[np.minimum((time_axis * 2).astype(int), len(frequencies) - 1)] * time_axis)
+    samples = 0.3 * tone + 0.05 * noise.uniform(-1, 1, len(time_axis))
+    output = io.BytesIO()
+    with wave.open(output, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes((samples * 32767).astype("<i2").tobytes())
+    return output.getvalue()
+
+def build_corpus(words: List[str], pdfs: int, wavs: int, seed: int = 0) -> Dict[str, List[bytes]]:
+    """Generate the upload files up front so the load generator spends no time on them"""
+    rng = random.Random(seed)
+    return {
+        "pdf": [synthetic_pdf(rng, words, pages=rng.randint(1, 6)) for _ in range(pdfs)],
+        "wav": [synthetic_wav(rng, seconds=rng.uniform(2, 10)) for _ in range(wavs)],
+    }
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}'; choose from {', '.join(ENDPOINTS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+class LoadGenerator:
+    """Drives a weighted mix of requests and records latencies per endpoint"""
+
+    def __init__(self, client: httpx.AsyncClient, words: List[str], corpus: Dict[str, List[bytes]], seed: int = 0):
+        self.client = client
+        self.words = words
+        self.corpus = corpus
+        self.seed = seed
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.rejected = defaultdict(int)
+        self.uploads = 0
+
+    async def timed(self, endpoint: str, rng: random.Random):
+        """Send one request; a 429 is counted apart from errors and its Retry-After is waited out"""
+        start = time.perf_counter()
+        try:
+            response = await ENDPOINTS[endpoint](self, rng, start)
+        except httpx.HTTPError:
+            response = None
+        if response is not None and response.status_code == 200:
+            self.latencies[endpoint].append(time.perf_counter() - start)
+        elif response is not None and response.status_code == 429:
+            self.rejected[endpoint] += 1
+            await asyncio.sleep(float(response.headers.get("retry-after", 1)))
+        else:
+            self.errors[endpoint] += 1
+
+    async def upload_pdf(self, rng: random.Random, start: float) -> Optional[httpx.Response]:
+        self.uploads += 1
+        files = {"file": (f"load_{self.uploads}.pdf", rng.choice(self.corpus["pdf"]), "application/pdf")}
+        return await self.client.post("/upload", files=files)
+
+    async def upload_wav(self, rng: random.Random, start: float) -> Optional[httpx.Response]:
+        self.uploads += 1
+        files = {"file": (f"load_{self.uploads}.wav", rng.choice(self.corpus["wav"]), "audio/wav")}
+        return await self.client.post("/upload", files=files)
+
+    async def query(self, rng: random.Random, start: float) -> Optional[httpx.Response]:
+        payload = {"query": " ".join(rng.choice(self.words) for _ in range(6)), "max_results": 5}
+        return await self.client.post("/query", json=payload)
+
+    async def query_stream(self, rng: random.Random, start: float) -> Optional[httpx.Response]:
+        """The response, or None when the stream broke off or ended in an error event"""
+        payload = {"query": " ".join(rng.choice(self.words) for _ in range(6)), "max_results": 5}
+        async with self.client.stream("POST", "/query/stream", json=payload) as response:
+            if response.status_code != 200:
+                return response
+            event, first_token = None, None
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                    if event == "token" and first_token is None:
+                        first_token = time.perf_counter() - start
+                    elif event == "error":
+                        return None
+            if event != "done":
+                return None
+            self.latencies["query_stream (first token)"].append(first_token)
+            return response
+
+    async def documents(self, rng: random.Random, start: float) -> Optional[httpx.Response]:
+        return await self.client.get("/documents", params={"limit": 50})
+
+    async def run(self, mix: Dict[str, float], concurrency: int, duration: float) -> float:
+        names, weights = list(mix), list(mix.values())
+        deadline = time.perf_counter() + duration
+
+        async def worker(number: int):
+            rng = random.Random(self.seed * 1000 + number)
+            while time.perf_counter() < deadline:
+                await self.timed(rng.choices(names, weights)[0], rng)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(number) for number in range(concurrency)))
+        return time.perf_counter() - start
+
+ENDPOINTS = {
+    "query": LoadGenerator.query,
+    "query_stream": LoadGenerator.query_stream,
+    "upload_pdf": LoadGenerator.upload_pdf,
+    "upload_wav": LoadGenerator.upload_wav,
+    "documents": LoadGenerator.documents,
+}
+
+def summarize(generator: LoadGenerator, elapsed: float) -> Dict[str, Dict[str, Any]]:
+    summary = {}
+    for endpoint in sorted(set(generator.latencies) | set(generator.errors) | set(generator.rejected)):
+        latencies = np.array(generator.latencies.get(endpoint, [])) * 1000
+        row = {"requests": len(latencies), "errors": generator.errors.get(endpoint, 0),
+               "rejected": generator.rejected.get(endpoint, 0), "throughput_rps": round(len(latencies) / elapsed, 2)}
+        if len(latencies):
+            row.update({
+                "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+                "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+                "mean_ms": round(float(latencies.mean()), 1),
+            })
+        summary[endpoint] = row
+    return summary
+
+def print_summary(summary: Dict[str, Dict[str, Any]]):
+    print(f"{'endpoint':<28}{'requests':>9}{'errors':>8}{'429s':>7}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, row in summary.items():
+        print(f"{endpoint:<28}{row['requests']:>9}{row['errors']:>8}{row['rejected']:>7}{row['throughput_rps']:>9}"
+              f"{row.get('p50_ms', '-'):>10}{row.get('p95_ms', '-'):>10}{row.get('p99_ms', '-'):>10}")
+
+async def wait_until_ready(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float = 300.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError("Server did not become ready")
+
+async def drive(args, base_url: str, server: subprocess.Popen = None) -> Dict[str, Any]:
+    words = vocabulary(seed=args.seed)
+    corpus = build_corpus(words, args.corpus_pdfs, args.corpus_wavs, seed=args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        await wait_until_ready(client, server)
+
+        seeder = LoadGenerator(client, words, corpus, seed=args.seed)
+        rng = random.Random(args.seed)
+        for _ in range(args.seed_documents):
+            await seeder.timed("upload_pdf", rng)
+        print(f"Seeded {len(seeder.latencies['upload_pdf'])} documents ({seeder.errors['upload_pdf']} failed)")
+
+        generator = LoadGenerator(client, words, corpus, seed=args.seed + 1)
+        generator.uploads = seeder.uploads
+        elapsed = await generator.run(parse_mix(args.mix), args.concurrency, args.duration)
+    return {
+        "config": {key: value for key, value in vars(args).items() if key != "serve"},
+        "elapsed_seconds": round(elapsed, 2),
+        "endpoints": summarize(generator, elapsed),
+    }
+
+def serve(args):
+    """Child process: run the real app with the stand-ins swapped in"""
+    os.makedirs("logs", exist_ok=True)
+    os.environ.setdefault("GOOGLE_API_KEY", "load-test")
+    if args.vosk_model:
+        os.makedirs("models", exist_ok=True)
+        os.symlink(os.path.abspath(args.vosk_model), os.path.join("models", "vosk-model-en-us-0.22"))
+
+    import uvicorn
+    from backend import main
+    from backend.services.store_factory import create_vector_store
+    from backend.services.tenant_stores import TenantVectorStores
+
+    embedding_function = HashEmbeddingFunction()
+    main.llm_service = fake_llm_service(args.llm_latency_ms, args.llm_token_ms)
+    main.tenant_stores = TenantVectorStores(
+        lambda collection_name: create_vector_store(main.settings, embedding_function=embedding_function,
+                                                    collection_name=collection_name),
+        max_open=main.settings.max_open_tenants,
+        resolve_collection=main.tenant_stores.resolve_collection
+    )
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the API")
+    parser.add_argument("--url", help="Drive this running server instead of starting one with stand-ins")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Comma-separated endpoint=weight pairs")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent client workers")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of measured load")
+    parser.add_argument("--seed-documents", type=int, default=20, help="PDFs uploaded before measuring")
+    parser.add_argument("--corpus-pdfs", type=int, default=32, help="Distinct synthetic PDFs to upload from")
+    parser.add_argument("--corpus-wavs", type=int, default=8, help="Distinct synthetic WAVs to upload from")
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0, help="Fake Gemini time to first piece")
+    parser.add_argument("--llm-token-ms", type=float, default=20.0, help="Fake Gemini delay between pieces")
+    parser.add_argument("--vosk-model", help="Vosk model directory, so WAV uploads are really transcribed")
+    parser.add_argument("--workdir", help="Scratch directory for the server (default: a temporary one)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request client timeout")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    server, workdir = None, None
+    base_url = args.url
+    if base_url is None:
+        workdir = args.workdir or tempfile.mkdtemp(prefix="rag_load_")
+        os.makedirs(workdir, exist_ok=True)
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")]))}
+        command = [sys.executable, "-m", "benchmarks.load_test", "--serve", "--port", str(args.port),
+                   "--llm-latency-ms", str(args.llm_latency_ms), "--llm-token-ms", str(args.llm_token_ms)]
+        if args.vosk_model:
+            command += ["--vosk-model", os.path.abspath(args.vosk_model)]
+        # Keep the server's request logging out of the report; it is shown if the run fails
+        server_log = open(os.path.join(workdir, "server.log"), "w+")
+        server = subprocess.Popen(command, cwd=workdir, env=env, stdout=server_log, stderr=subprocess.STDOUT)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        results = asyncio.run(drive(args, base_url, server))
+    except Exception:
+        if server is not None:
+            server_log.seek(0)
+            print("".join(server_log.readlines()[-40:]), file=sys.stderr)
+        raise
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+            server_log.close()
+        if workdir is not None and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_summary(results["endpoints"])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Local stand-in for the Gemini REST API.
+
+Usage:
+    python -m benchmarks.mock_gemini --port 8100 --latency-ms 800 --error-rate 0.1
+    GEMINI_BASE_URL=http://localhost:8100 GOOGLE_API_KEY=test uvicorn backend.main:app
+
+Serves generateContent, streamGenerateContent (SSE) and model lookups.
+Streams send their first piece after about --latency-ms and then one
+piece every --token-ms; non-streaming calls wait for the whole answer.
+A share of calls fails with 429 or 503 (with Retry-After) so timeouts,
+retries and backoff in the async Gemini client can be exercised offline.
+"""
+import argparse
+import asyncio
+import json
+import random
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+def create_app(latency_ms: float = 500.0, error_rate: float = 0.0, answer_words: int = 120,
+               token_ms: float = 20.0, words_per_piece: int = 4) -> FastAPI:
+    app = FastAPI(title="Mock Gemini API")
+    app.state.calls = 0
+    app.state.failures = 0
+
+    def failure():
+        if random.random() >= error_rate:
+            return None
+        app.state.failures += 1
+        status = random.choice([429, 503])
+        return JSONResponse(status_code=status, headers={"Retry-After": "0.1"},
+                            content={"error": {"code": status, "message": "Injected failure"}})
+
+    @app.get("/v1beta/models/{model}")
+    async def get_model(model: str):
+        return {"name": f"models/{model}", "displayName": model}
+
+    def response(text: str) -> dict:
+        return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+
+    @app.post("/v1beta/models/{model_action}")
+    async def generate(model_action: str, request: Request):
+        app.state.calls += 1
+        body = await request.json()
+        prompt = body["contents"][-1]["parts"][0]["text"]
+        words = [f"Mock answer ({len(prompt)} prompt chars):"] + [f"word{i}" for i in range(answer_words)]
+        pieces = [" ".join(words[i:i + words_per_piece]) + " " for i in range(0, len(words), words_per_piece)]
+        await asyncio.sleep(random.uniform(0.5, 1.5) * latency_ms / 1000)
+
+        error = failure()
+        if error is not None:
+            return error
+        if not model_action.endswith(":streamGenerateContent"):
+            await asyncio.sleep(len(pieces) * token_ms / 1000)
+            return response("".join(pieces))
+
+        async def stream():
+            for position, piece in enumerate(pieces):
+                if position:
+                    await asyncio.sleep(token_ms / 1000)
+                yield f"data: {json.dumps(response(piece))}\r\n\r\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return {"calls": app.state.calls, "failures": app.state.failures}
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock Gemini API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=500.0, help="Mean generation latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls answered with 429/503")
+    parser.add_argument("--answer-words", type=int, default=120)
+    parser.add_argument("--token-ms", type=float, default=20.0, help="Delay between streamed pieces")
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(args.latency_ms, args.error_rate, args.answer_words, args.token_ms),
+                host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ from typing import List, Dict, Any
 import os
 from datetime import datetime
 import time
+import uuid
 
 # Configure Streamlit page
 st.set_page_config(
@@ -367,12 +368,14 @@ st.markdown("""
 
 # Configuration
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
+TENANT_ID = os.getenv("TENANT_ID", "")
+BACKEND_HEADERS = {"X-Tenant-ID": TENANT_ID} if TENANT_ID else {}
 
 def upload_file(file) -> Dict[str, Any]:
     """Upload file to backend"""
     try:
         files = {"file": (file.name, file.getvalue(), file.type)}
-        response = requests.post(f"{BACKEND_URL}/upload", files=files)
+        response = requests.post(f"{BACKEND_URL}/upload", files=files, headers=BACKEND_HEADERS)
         
         if response.status_code == 200:
             return response.json()
@@ -383,20 +386,39 @@ def upload_file(file) -> Dict[str, Any]:
         st.error(f"Upload error: {str(e)}")
         return None
 
-def query_chatbot(query: str, max_results: int = 5) -> Dict[str, Any]:
-    """Query the chatbot"""
+def query_chatbot(query: str, on_answer=None, max_results: int = 5) -> Dict[str, Any]:
+    """Query the chatbot over /query/stream, passing the answer so far to on_answer as it arrives"""
     try:
         payload = {
             "query": query,
-            "max_results": max_results
+            "max_results": max_results,
+            "session_id": st.session_state.session_id
         }
-        response = requests.post(f"{BACKEND_URL}/query", json=payload)
+        response = requests.post(f"{BACKEND_URL}/query/stream", json=payload, headers=BACKEND_HEADERS, stream=True)
         
-        if response.status_code == 200:
-            return response.json()
-        else:
+        if response.status_code != 200:
             st.error(f"Query failed: {response.text}")
             return None
+        
+        result = {"answer": "", "sources": [], "confidence_score": 0.0}
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):])
+                if event == "sources":
+                    result["sources"] = data["sources"]
+                elif event == "token":
+                    result["answer"] += data["text"]
+                    if on_answer:
+                        on_answer(result["answer"])
+                elif event == "done":
+                    result["confidence_score"] = data["confidence_score"]
+                elif event == "error":
+                    st.error(f"Query failed: {data['detail']}")
+                    return None
+        return result
     except Exception as e:
         st.error(f"Query error: {str(e)}")
         return None
@@ -405,7 +427,7 @@ def query_chatbot(query: str, max_results: int = 5) -> Dict[str, Any]:
 def get_documents() -> List[Dict[str, Any]]:
     """Get list of uploaded documents"""
     try:
-        response = requests.get(f"{BACKEND_URL}/documents")
+        response = requests.get(f"{BACKEND_URL}/documents", headers=BACKEND_HEADERS)
         if response.status_code == 200:
             return response.json().get("documents", [])
         else:
@@ -417,7 +439,7 @@ def get_documents() -> List[Dict[str, Any]]:
 def delete_document(document_id: str) -> bool:
     """Delete a specific document"""
     try:
-        response = requests.delete(f"{BACKEND_URL}/documents/{document_id}")
+        response = requests.delete(f"{BACKEND_URL}/documents/{document_id}", headers=BACKEND_HEADERS)
         if response.status_code == 200:
             return True
         else:
@@ -427,10 +449,17 @@ def delete_document(document_id: str) -> bool:
         st.error(f"Error deleting document: {str(e)}")
         return False
 
+def delete_session(session_id: str):
+    """Forget the conversation history kept by the backend"""
+    try:
+        requests.delete(f"{BACKEND_URL}/sessions/{session_id}", headers=BACKEND_HEADERS)
+    except Exception:
+        pass  # The session expires on its own once idle
+
 def clear_all_documents() -> bool:
     """Clear all documents"""
     try:
-        response = requests.delete(f"{BACKEND_URL}/documents")
+        response = requests.delete(f"{BACKEND_URL}/documents", headers=BACKEND_HEADERS)
         if response.status_code == 200:
             return True
         else:
@@ -589,6 +618,9 @@ def main():
         st.session_state.uploaded_files_pending = []
     if 'is_generating' not in st.session_state:
         st.session_state.is_generating = False
+    if 'session_id' not in st.session_state:
+        # The backend keeps the conversation history under this id
+        st.session_state.session_id = uuid.uuid4().hex
 
     # Display modern header
     display_modern_header()
@@ -685,7 +717,7 @@ def main():
                 # Delete button
                 delete_key = f"delete_{idx}_{hash(filename) % 10000}"
                 if st.button("🗑️ Delete", key=delete_key, help=f"Delete {filename}", use_container_width=True, type="primary"):
-                    doc_id = doc.get('id', filename)
+                    doc_id = doc.get('document_id', filename)
                     if delete_document(doc_id):
                         st.success("File deleted!")
                         # Use a flag to prevent multiple reruns
@@ -720,6 +752,13 @@ def main():
                 st.session_state.documents = []  # Clear cache
                 st.rerun()
         
+        if st.session_state.messages:
+            if st.button("💬 New Conversation", use_container_width=True, type="primary"):
+                delete_session(st.session_state.session_id)
+                st.session_state.session_id = uuid.uuid4().hex
+                st.session_state.messages = []
+                st.rerun()
+        
         # App info
         st.markdown("---")
         st.markdown("### ℹ️ About")
@@ -835,10 +874,13 @@ def main():
     if st.session_state.is_generating and len(st.session_state.messages) > 0:
         last_message = st.session_state.messages[-1]
         if last_message["role"] == "user":
-            # Query backend with spinner shown above
-            with thinking_placeholder.container():
-                with st.spinner("🤔 Analyzing your question and searching through documents..."):
-                    response = query_chatbot(last_message["content"])
+            # Stream the answer into the placeholder, replacing the spinner once the first words arrive
+            def show_partial_answer(answer):
+                with thinking_placeholder.container():
+                    display_chat_message(answer, is_user=False)
+            
+            thinking_placeholder.info("🤔 Analyzing your question and searching through documents...")
+            response = query_chatbot(last_message["content"], on_answer=show_partial_answer)
             
             if response:
                 answer = response.get('answer', 'No answer received')